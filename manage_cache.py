@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+"""
+Inspect and collect the stage cache of refine_loop_with_cache and the render cache of presentations, e.g.
+
+    python manage_cache.py stats
+    python manage_cache.py gc --max_size 50GB --render_max_size 10GB --dedup_runs runs
+"""
+import os
+
+# Add src directory to path
+os.sys.path.append('./src')
+
+from agentic_loop.cache_manager import main
+
+if __name__ == "__main__":
+    main()
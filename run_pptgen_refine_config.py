@@ -3,16 +3,27 @@
 import argparse
 import hashlib
 import json
+import multiprocessing
 import os
 import sys
+import time
 import uuid
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
 from openai import OpenAI
 
 # Add src directory to path
 os.sys.path.append('./src')
 
-from llms import LLM, setup_models
+from llms import LLM, connect_api_servers, setup_models
+from llm_cache import ResponseCache
+from model_registry import MODEL_REGISTRY
+from soffice_pool import INSTANCES_ENV
+from sweep_journal import COMPLETED, FAILED, STARTED, SweepJournal, task_key
+from sweep_planner import SweepPlanner
+from work_queue import Heartbeat, WorkQueue, worker_id
 from utils import Config, pjoin, pptx_to_pdf
 from agentic_loop.pref_refine_loop import refine_loop, refine_loop_with_cache
 
@@ -51,27 +62,73 @@ def parse_args():
                         help='Use local LLM instead of OpenAI API')
     parser.add_argument('--local_model_path', type=str, default="Qwen/Qwen2.5-VL-7B-Instruct",
                         help='Path to local model when using --local_llm')
-    parser.add_argument('--vlm_api_server_url', type=str, default="http://0.0.0.0:8001",
-                        help='URL of OpenAI-compatible VLM API server (e.g., vllm or lmdeploy, http://0.0.0.0:8001)')
-    parser.add_argument('--llm_api_server_url', type=str, default="http://0.0.0.0:8002",
-                        help='URL of OpenAI-compatible LLM API server (e.g., vllm or lmdeploy, http://0.0.0.0:8002)')
+    parser.add_argument('--vlm_api_server_url', type=str, nargs='+', default=["http://0.0.0.0:8001"],
+                        help='URL(s) of OpenAI-compatible VLM API server replicas (e.g., vllm or lmdeploy, http://0.0.0.0:8001)')
+    parser.add_argument('--llm_api_server_url', type=str, nargs='+', default=["http://0.0.0.0:8002"],
+                        help='URL(s) of OpenAI-compatible LLM API server replicas (e.g., vllm or lmdeploy, http://0.0.0.0:8002)')
+    parser.add_argument('--max_concurrency', type=int, default=8,
+                        help='Maximum number of in-flight requests per LLM backend for batched calls')
+    parser.add_argument('--llm_cache', type=str, default=None,
+                        help='Path of the persistent LLM response cache (SQLite), e.g. runs/cache/llm_cache.sqlite')
+    parser.add_argument('--llm_cache_size_gb', type=float, default=2,
+                        help='Size budget of the LLM response cache in GB, least recently used entries are evicted')
+    parser.add_argument('--image_size', type=int, default=1024,
+                        help='Effective image resolution of the models, larger images are downscaled before sending')
+    parser.add_argument('--image_quality', type=int, default=90,
+                        help='JPEG quality images are recompressed to before sending')
+    parser.add_argument('--image_transport', type=str, default='base64', choices=['base64', 'file', 'http'],
+                        help='How images are sent to local API servers: inlined base64, file:// urls '
+                             '(needs e.g. vllm --allowed-local-media-path) or urls of a built-in localhost file server')
+    parser.add_argument('--media_root', type=str, nargs='+', default=None,
+                        help='Directories served to local API servers with --image_transport http, images outside '
+                             'them are sent as base64; the output directory and runs/cache by default')
+    parser.add_argument('--parallel_slides', type=int, default=1,
+                        help='Number of slides generated concurrently, 1 to generate them one by one')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of config items processed concurrently, each worker process sets up its own models')
+    parser.add_argument('--model_memory_budget_gb', type=float, default=None,
+                        help='Memory budget of the local models kept loaded across tasks (marker, embeddings) in GB, '
+                             'least recently used models are unloaded beyond it; no limit by default')
+    parser.add_argument('--resume', action='store_true',
+                        help='Resume an interrupted sweep from its journal: skip the completed tasks and rerun the others '
+                             'in their previous run directories, reusing their checkpointed slides')
+    parser.add_argument('--task_order', type=str, default='plan', choices=['plan', 'config'],
+                        help='plan: run first the tasks producing the cached stages other tasks share, and keep '
+                             'parallel workers off the stages another worker is producing; config: run in config order')
+    parser.add_argument('--soffice_instances', type=int, default=1,
+                        help='Number of long-running LibreOffice instances of each worker process, '
+                             'i.e. of its concurrent pptx/pdf/image conversions')
+    parser.add_argument('--queue', type=str, default=None,
+                        help='Path of a SQLite work queue on a filesystem shared by the worker machines: the tasks of the '
+                             'config are enqueued once, and every process running with the same queue leases them')
+    parser.add_argument('--lease_timeout', type=float, default=600,
+                        help='Seconds without heartbeat after which the task of a dead worker is leased again')
+    parser.add_argument('--max_attempts', type=int, default=3,
+                        help='Number of times a task is run (leased from the queue, or rerun after its worker died) before it is failed')
     return parser.parse_args()
 
 
 def setup_models_from_args(args):
+    # language and vision models share one response cache
+    llm_cache = None
+    if args.llm_cache:
+        llm_cache = ResponseCache(args.llm_cache, max_bytes=int(args.llm_cache_size_gb * 1024**3))
+    # the run directories, and the stage and render caches their images are linked from
+    media_root = args.media_root or [args.output_dir or RUNS_DIR, pjoin(RUNS_DIR, "cache")]
+
     if args.local_llm:
         if args.llm_api_server_url and args.vlm_api_server_url:
             # Use OpenAI client with local API server URL
             print(f"[INFO] Using OpenAI-compatible API server at: {args.llm_api_server_url}")
             
             # Setup online models with custom API base URL
-            llm_client = OpenAI(api_key='YOUR_API_KEY', base_url=f"{args.llm_api_server_url}/v1")
-            model_name = llm_client.models.list().data[0].id
-            language_model = LLM(model=model_name, api_base=f"{args.llm_api_server_url}/v1", api_key="dummy-key")
+            language_model = connect_api_servers(args.llm_api_server_url, max_concurrency=args.max_concurrency, cache=llm_cache,
+                                                 image_size=args.image_size, image_quality=args.image_quality,
+                                                 image_transport=args.image_transport, media_root=media_root)
             
-            vlm_client = OpenAI(api_key='YOUR_API_KEY', base_url=f"{args.vlm_api_server_url}/v1")
-            model_name = vlm_client.models.list().data[0].id
-            vision_model = LLM(model=model_name, api_base=f"{args.vlm_api_server_url}/v1", api_key="dummy-key")
+            vision_model = connect_api_servers(args.vlm_api_server_url, max_concurrency=args.max_concurrency, cache=llm_cache,
+                                               image_size=args.image_size, image_quality=args.image_quality,
+                                               image_transport=args.image_transport, media_root=media_root)
             
             # vision_model = language_model  # Share the same model instance
         else:
@@ -79,12 +136,13 @@ def setup_models_from_args(args):
             print(f"[INFO] Using local LLM: {args.local_model_path}")
             from lmdeploy import VisionConfig, GenerationConfig
             # Configure vision and generation parameters for local model
-            vision_config = VisionConfig(image_size=1024)
+            vision_config = VisionConfig(image_size=args.image_size)
             gen_config = GenerationConfig(max_new_tokens=4096)
             
             # Use the same model for both language and vision
             language_model = LLM(model=args.local_model_path, offline_inference=True, 
-                                vision_config=vision_config, gen_config=gen_config)
+                                vision_config=vision_config, gen_config=gen_config, cache=llm_cache,
+                                image_size=args.image_size, image_quality=args.image_quality)
             vision_model = language_model  # Share the same model instance
     else:
         # Load API key for OpenAI
@@ -95,13 +153,23 @@ def setup_models_from_args(args):
         openai_model = "gpt-4.1-2025-04-14" # "gpt-4.1-2025-04-14"
         
         # Setup online models
-        language_model = LLM(model=openai_model, api_key=openai_api_key)
-        vision_model = LLM(model=openai_model, api_key=openai_api_key)
+        language_model = LLM(model=openai_model, api_key=openai_api_key, max_concurrency=args.max_concurrency, cache=llm_cache,
+                             image_size=args.image_size, image_quality=args.image_quality)
+        vision_model = LLM(model=openai_model, api_key=openai_api_key, max_concurrency=args.max_concurrency, cache=llm_cache,
+                           image_size=args.image_size, image_quality=args.image_quality)
     
     setup_models(language_model, vision_model)
     return language_model, vision_model
 
-def process_config_item(config_item, args, base_output_dir):
+def new_project_id(config_item):
+    target_id = os.path.splitext(config_item['target'])[0]
+    ref_id = os.path.splitext(config_item['sample']['paper'])[0]
+    dt_str = datetime.now().strftime("%Y%m%d_%H%M%S")
+    unique_id = str(uuid.uuid4())[:4]
+    return f"{dt_str}_{unique_id}_ref{ref_id}_tgt{target_id}"
+
+
+def process_config_item(config_item, args, base_output_dir, project_id=None):
     target_id = os.path.splitext(config_item['target'])[0]
     ref_id = os.path.splitext(config_item['sample']['paper'])[0]
 
@@ -110,10 +178,8 @@ def process_config_item(config_item, args, base_output_dir):
     ref_content_pdf = os.path.join(args.dataset_dir, "slide_paper_pairs", "paper", f"{ref_id}.pdf")
     ref_content_ppt = os.path.join(args.dataset_dir, "slide_paper_pairs", "ppt", f"{ref_id}.pdf")
     
-    # Create unique output directory for this task
-    dt_str = datetime.now().strftime("%Y%m%d_%H%M%S")
-    unique_id = str(uuid.uuid4())[:4]
-    project_id = f"{dt_str}_{unique_id}_ref{ref_id}_tgt{target_id}"
+    # Create unique output directory for this task, or reuse the one of the resumed task
+    project_id = project_id or new_project_id(config_item)
     output_dir = os.path.join(base_output_dir, project_id)
     
     os.makedirs(output_dir, exist_ok=True)
@@ -139,6 +205,8 @@ def process_config_item(config_item, args, base_output_dir):
         no_refinement=args.no_refinement,
         regen_outline=args.regen_outline,
         device=args.device,
+        parallel_slides=args.parallel_slides,
+        resume=args.resume,
         target_id=target_id,
         ref_id=ref_id
     )
@@ -168,13 +236,240 @@ def process_config_item(config_item, args, base_output_dir):
         # Convert to PDF for easier viewing
         pptx_to_pdf(final_pptx_path, os.path.dirname(final_pptx_path))
         print(f"[INFO] PDF version: {final_pptx_path.replace('.pptx', '.pdf')}")
-        return True
     else:
         print(f"[ERROR] Presentation generation failed for task: Target={target_id}, Reference={ref_id}")
-        return False
+    return final_pptx_path
+
+def init_worker(args):
+    """
+    Set up the models of a worker process, shared by all the tasks it runs.
+    The local models are loaded on first use by the model registry and kept across tasks.
+    """
+    language_model, vision_model = setup_models_from_args(args)
+    if args.model_memory_budget_gb is not None:
+        MODEL_REGISTRY.memory_budget = int(args.model_memory_budget_gb * 1024**3)
+    globals()['language_model'] = language_model
+    globals()['vision_model'] = vision_model
+
+
+def run_task(task_idx, config_item, args, base_output_dir, journal_path, project_id=None):
+    """
+    Process a config item and report its result, never raising so that one failed task does not stop the others.
+    The task is recorded in the journal as it starts and finishes.
+
+    Args:
+        project_id (str): The project id of a resumed task, to rerun it in its previous run directory.
+    """
+    start_time = time.time()
+    journal = SweepJournal(journal_path)
+    key = task_key(config_item, args.slides)
+    project_id = project_id or new_project_id(config_item)
+    output_dir = os.path.join(base_output_dir, project_id)
+    journal.append(key, STARTED, task=task_idx+1, project_id=project_id, output_dir=output_dir)
+    final_pptx_path = None
+    try:
+        final_pptx_path = process_config_item(config_item, args, base_output_dir, project_id)
+        error_msg = None if final_pptx_path else "Presentation generation failed"
+    except Exception as e:
+        error_msg = str(e)
+        print(f"[ERROR] Task {task_idx+1} failed: {error_msg}")
+    
+    result = {
+        "task": task_idx+1,
+        "target": config_item['target'],
+        "reference": config_item['sample']['paper'],
+        "success": bool(final_pptx_path),
+        "error": error_msg,
+        "duration": round(time.time() - start_time, 1),
+        "output_dir": output_dir,
+        "final_pptx": final_pptx_path,
+    }
+    journal.append(key, COMPLETED if final_pptx_path else FAILED, project_id=project_id, result=result)
+    return result
+
+
+def queue_worker(args, base_output_dir, journal_path):
+    """
+    Lease and run the tasks of the work queue until none is left, writing their results to the queue.
+
+    Returns:
+        int: The number of tasks run.
+    """
+    queue = WorkQueue(args.queue, lease_timeout=args.lease_timeout, max_attempts=args.max_attempts)
+    worker = worker_id()
+    num_run = 0
+    while (lease := queue.lease(worker)) is not None:
+        # a task leased again was interrupted, resume it in its run directory from its checkpoints
+        project_id = lease.project_id or new_project_id(lease.config_item)
+        task_args = argparse.Namespace(**{**vars(args), "resume": args.resume or lease.project_id is not None})
+        print(f"\n[INFO] {worker} leased task {lease.task} (attempt {lease.attempts}): {lease.config_item}")
+        with Heartbeat(queue, lease, worker, project_id):
+            result = run_task(lease.task - 1, lease.config_item, task_args, base_output_dir, journal_path, project_id)
+        if not queue.complete(lease, worker, result):
+            print(f"[WARNING] Lease of task {lease.task} expired before it finished, its result is dropped")
+        num_run += 1
+        print(f"[INFO] Queue: {queue.counts()}")
+    return num_run
+
+
+def save_summary(results, summary_path):
+    # write to a temporary file first, so an interrupted run never leaves a truncated summary
+    tmp_path = summary_path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(sorted(results, key=lambda r: r['task']), f, indent=2)
+    os.replace(tmp_path, summary_path)
+
+
+def report_progress(results, num_tasks, start_time, num_skipped=0):
+    elapsed = time.time() - start_time
+    num_run = len(results) - num_skipped
+    throughput = num_run / elapsed * 3600
+    eta = (num_tasks - len(results)) / num_run * elapsed
+    success_count = sum(1 for r in results if r['success'])
+    print(f"[INFO] {len(results)}/{num_tasks} tasks done ({success_count} succeeded), "
+          f"{throughput:.1f} tasks/hour, ETA {eta / 60:.0f} min")
+
+
+def new_executor(args, initializer=init_worker):
+    # spawn rather than fork, CUDA and the model clients cannot be shared with a forked child
+    return ProcessPoolExecutor(
+        max_workers=args.workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=initializer,
+        initargs=(args,),
+    )
+
+
+def failed_result(task_idx, config_item, error):
+    return {
+        "task": task_idx+1,
+        "target": config_item['target'],
+        "reference": config_item['sample']['paper'],
+        "success": False,
+        "error": error,
+    }
+
+
+def run_pool(tasks, args, base_output_dir, journal_path, project_ids, record, initializer=init_worker, task_fn=run_task):
+    """
+    Run tasks in a pool of `args.workers` worker processes, passing the result of each to `record` as it finishes.
+
+    Tasks are submitted as workers free up, so that each one is planned knowing what the others produce.
+    When a worker dies (e.g. killed by the OOM killer), the pool is broken and every task running in it fails:
+    the pool is recreated and those tasks are resumed in their run directories, up to `args.max_attempts` runs each.
+
+    Args:
+        tasks (list[tuple[int, dict]]): The tasks to run, as (index, config item).
+        project_ids (dict[int, str]): The project ids of resumed tasks by index.
+        record (Callable[[dict], None]): Called with the result of every task.
+        initializer (Callable): The initializer of the worker processes.
+        task_fn (Callable): The function running a task in a worker, with the arguments of `run_task`.
+    """
+    planner = SweepPlanner(tasks, args.slides)
+    project_ids = dict(project_ids)
+    runs = Counter()
+    resumed = set()
+    executor = new_executor(args, initializer)
+    # futures of the running tasks, with the pool they run in
+    futures = {}
+    try:
+        while planner.pending or futures:
+            while len(futures) < args.workers and planner.pending:
+                task = planner.next_task() if args.task_order == 'plan' else planner.pending[0]
+                planner.start(task)
+                i, config_item = task
+                task_args = argparse.Namespace(**{**vars(args), "resume": True}) if i in resumed else args
+                try:
+                    future = executor.submit(
+                        task_fn, i, config_item, task_args, base_output_dir, journal_path, project_ids.get(i)
+                    )
+                except BrokenProcessPool:
+                    planner.finish(task, success=False)
+                    planner.requeue(task)
+                    print("[WARNING] The worker pool is broken, restarting it")
+                    executor.shutdown(wait=False)
+                    executor = new_executor(args, initializer)
+                    continue
+                runs[i] += 1
+                futures[future] = (task, executor)
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                task, task_executor = futures.pop(future)
+                i, config_item = task
+                key = task_key(config_item, args.slides)
+                try:
+                    result = future.result()
+                except BrokenProcessPool as e:
+                    if task_executor is executor:
+                        print("[WARNING] A worker died and broke the worker pool, restarting it")
+                        executor.shutdown(wait=False)
+                        executor = new_executor(args, initializer)
+                    if runs[i] < args.max_attempts:
+                        # resume it from the checkpoints of its run directory
+                        entry = SweepJournal(journal_path).load().get(key)
+                        project_ids[i] = (entry or {}).get('project_id') or project_ids.get(i)
+                        resumed.add(i)
+                        planner.finish(task, success=False)
+                        planner.requeue(task)
+                        print(f"[WARNING] Task {i+1} was running in a dead worker, rerunning it "
+                              f"({runs[i]}/{args.max_attempts} runs)")
+                        continue
+                    print(f"[ERROR] Task {i+1} failed: its workers died {runs[i]} times")
+                    result = failed_result(i, config_item, f"Worker died: {e}")
+                    SweepJournal(journal_path).append(key, FAILED, project_id=project_ids.get(i), result=result)
+                except Exception as e:
+                    # the worker process itself failed (e.g. to set up models)
+                    print(f"[ERROR] Task {i+1} failed in its worker: {e}")
+                    result = failed_result(i, config_item, str(e))
+                    SweepJournal(journal_path).append(key, FAILED, project_id=project_ids.get(i), result=result)
+                planner.finish(task, success=result["success"])
+                record(result)
+    finally:
+        executor.shutdown(wait=True)
+
+
+def run_queue(args, config_data, base_output_dir, journal_path, summary_path):
+    """
+    Run `args.workers` queue workers on this machine, then write the summary of all the tasks of the queue.
+    """
+    queue = WorkQueue(args.queue, lease_timeout=args.lease_timeout, max_attempts=args.max_attempts)
+    added = queue.enqueue(list(enumerate(config_data)), args.slides)
+    print(f"[INFO] Added {added} tasks to the work queue {args.queue}: {queue.counts()}")
+    start_time = time.time()
+    if args.workers > 1:
+        with new_executor(args) as executor:
+            futures = [executor.submit(queue_worker, args, base_output_dir, journal_path) for _ in range(args.workers)]
+            num_run = 0
+            for future in futures:
+                try:
+                    num_run += future.result()
+                except Exception as e:
+                    # its leased task is leased again by another worker once the lease expires
+                    print(f"[ERROR] Queue worker failed: {e}")
+    else:
+        try:
+            init_worker(args)
+        except Exception as e:
+            print(f"[ERROR] Failed to setup models: {str(e)}")
+            sys.exit(1)
+        num_run = queue_worker(args, base_output_dir, journal_path)
+    
+    # the results of the tasks run by every machine
+    results = queue.results()
+    save_summary(results, summary_path)
+    counts = queue.counts()
+    success_count = sum(1 for r in results if r['success'])
+    print(f"\n[SUMMARY] Ran {num_run} tasks on this machine in {(time.time() - start_time) / 60:.1f} min, "
+          f"queue: {counts}")
+    print(f"[SUMMARY] Completed {success_count}/{len(results)} finished tasks successfully, results saved to: {summary_path}")
+    if success_count < len(results):
+        sys.exit(1)
+
 
 def main():
     args = parse_args()
+    # read by the LibreOffice pool of every process, including the spawned workers
+    os.environ[INSTANCES_ENV] = str(args.soffice_instances)
     
     # Check if config file exists
     if not os.path.exists(args.config_file):
@@ -193,46 +488,68 @@ def main():
     
     os.makedirs(base_output_dir, exist_ok=True)
     print(f"[INFO] Base output directory: {base_output_dir}")
+    config_name = args.config_file.split('/')[-1].split('.')[0]
+    summary_path = os.path.join(base_output_dir, f"summary_{config_name}.json")
+    journal_path = os.path.join(base_output_dir, f"journal_{config_name}.jsonl")
     
-    # Setup models once for all tasks
-    try:
-        language_model, vision_model = setup_models_from_args(args)
-        
-        # Save models for the global scope to be passed to each task
-        globals()['language_model'] = language_model
-        globals()['vision_model'] = vision_model
-    except Exception as e:
-        print(f"[ERROR] Failed to setup models: {str(e)}")
-        sys.exit(1)
+    if args.queue:
+        run_queue(args, config_data, base_output_dir, journal_path, summary_path)
+        return
     
-    # Process each config item
+    # Tasks of the journal: completed ones are skipped, the others are rerun in their run directories
     results = []
-    for i, config_item in enumerate(config_data):
-        print(f"\n[INFO] Processing task {i+1}/{len(config_data)}")
-        print(f"[INFO] Task item: {config_item}")
+    project_ids = {}
+    tasks = list(enumerate(config_data))
+    if args.resume:
+        journal = SweepJournal(journal_path).load()
+        tasks = []
+        for i, config_item in enumerate(config_data):
+            record = journal.get(task_key(config_item, args.slides))
+            if record is not None and record['status'] == COMPLETED:
+                results.append({**record['result'], "task": i+1})
+                continue
+            if record is not None:
+                project_ids[i] = record.get('project_id')
+            tasks.append((i, config_item))
+        print(f"[INFO] Resuming from {journal_path}: {len(results)} tasks completed, {len(tasks)} left "
+              f"({len(project_ids)} resumed in their run directories)")
+    num_skipped = len(results)
+    
+    # Process each config item, the summary is updated as soon as a task finishes
+    start_time = time.time()
+    if args.workers > 1:
+        if args.local_llm and not (args.llm_api_server_url and args.vlm_api_server_url):
+            print(f"[WARNING] Each of the {args.workers} workers loads its own copy of {args.local_model_path}, "
+                  f"serve it with --llm_api_server_url/--vlm_api_server_url to share one model")
+        print(f"[INFO] Processing {len(tasks)} tasks with {args.workers} workers")
+
+        def record(result):
+            results.append(result)
+            save_summary(results, summary_path)
+            report_progress(results, len(config_data), start_time, num_skipped)
+
+        run_pool(tasks, args, base_output_dir, journal_path, project_ids, record)
+    else:
+        # Setup models once for all tasks
         try:
-            success = process_config_item(config_item, args, base_output_dir)
-            error_msg = None
+            init_worker(args)
         except Exception as e:
-            success = False
-            error_msg = str(e)
-            print(f"[ERROR] Task {i+1} failed: {error_msg}")
+            print(f"[ERROR] Failed to setup models: {str(e)}")
+            sys.exit(1)
         
-        results.append({
-            "task": i+1,
-            "target": config_item['target'],
-            "reference": config_item['sample']['paper'],
-            "success": success,
-            "error": error_msg
-        })
-    # Save summary of results
-    summary_path = os.path.join(base_output_dir, f"summary_{args.config_file.split('/')[-1].split('.')[0]}.json")
-    with open(summary_path, 'w') as f:
-        json.dump(results, f, indent=2)
+        if args.task_order == 'plan':
+            tasks = SweepPlanner(tasks, args.slides).order()
+        for i, config_item in tasks:
+            print(f"\n[INFO] Processing task {i+1}/{len(config_data)}")
+            print(f"[INFO] Task item: {config_item}")
+            results.append(run_task(i, config_item, args, base_output_dir, journal_path, project_ids.get(i)))
+            save_summary(results, summary_path)
+            report_progress(results, len(config_data), start_time, num_skipped)
     
     # Print summary
     success_count = sum(1 for r in results if r['success'])
-    print(f"\n[SUMMARY] Completed {success_count}/{len(results)} tasks successfully")
+    print(f"\n[SUMMARY] Completed {success_count}/{len(results)} tasks successfully "
+          f"in {(time.time() - start_time) / 60:.1f} min")
     print(f"[SUMMARY] Results saved to: {summary_path}")
     
     # Exit with error if any task failed
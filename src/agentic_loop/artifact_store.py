@@ -0,0 +1,374 @@
+import fcntl
+import functools
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import stat
+import threading
+import uuid
+from contextlib import contextmanager
+from time import time
+
+from utils import pjoin
+
+# materialization methods, tried in order
+LINK_MODES = ("hardlink", "symlink", "copy")
+
+# files only ever read by the pipeline, which are linked rather than copied when materialized;
+# the others (pptx, json, ...) may be rewritten in place by later stages, so they get copies of their own
+LINKED_SUFFIXES = (".png", ".jpg", ".jpeg", ".gif", ".bmp", ".webp")
+
+
+def file_digest(path: str, chunk_size: int = 1024**2) -> str:
+    """
+    Return the sha256 hex digest of a file's content.
+    """
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def manifest_stage(name: str) -> str:
+    """
+    Return the stage of a manifest, the first component of its name (e.g. `pdf` for `pdf/{hash}/{fingerprint}`).
+    """
+    return name.split("/", 1)[0]
+
+
+class CacheIndex:
+    """
+    The access log of an ArtifactStore: the size and last access time of every manifest, and the hits,
+    misses and bytes saved of every stage, used to evict the least recently used outputs (see `cache_manager`).
+    It lives in a SQLite file in WAL mode, like the LLM response cache, so it is shared by worker processes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS manifests ("
+                "name TEXT PRIMARY KEY, stage TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, last_access REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS stages ("
+                "stage TEXT PRIMARY KEY, hits INTEGER NOT NULL DEFAULT 0, "
+                "misses INTEGER NOT NULL DEFAULT 0, bytes_saved INTEGER NOT NULL DEFAULT 0)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, stage: str, hits: int = 0, misses: int = 0, bytes_saved: int = 0):
+        self._connect().execute(
+            "INSERT INTO stages (stage, hits, misses, bytes_saved) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(stage) DO UPDATE SET hits = hits + excluded.hits, "
+            "misses = misses + excluded.misses, bytes_saved = bytes_saved + excluded.bytes_saved",
+            (stage, hits, misses, bytes_saved),
+        )
+
+    def record_save(self, name: str, size: int):
+        now = time()
+        self._connect().execute(
+            "INSERT INTO manifests (name, stage, size, created, last_access) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET size = excluded.size, last_access = excluded.last_access",
+            (name, manifest_stage(name), size, now, now),
+        )
+
+    def record_hit(self, name: str, size: int):
+        conn = self._connect()
+        now = time()
+        conn.execute(
+            "INSERT INTO manifests (name, stage, size, created, last_access, hits) VALUES (?, ?, ?, ?, ?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET last_access = excluded.last_access, hits = hits + 1",
+            (name, manifest_stage(name), size, now, now),
+        )
+        self._count(manifest_stage(name), hits=1, bytes_saved=size)
+
+    def record_miss(self, name: str):
+        self._count(manifest_stage(name), misses=1)
+
+    def forget(self, name: str):
+        self._connect().execute("DELETE FROM manifests WHERE name = ?", (name,))
+
+    def last_access(self) -> dict[str, float]:
+        return dict(self._connect().execute("SELECT name, last_access FROM manifests").fetchall())
+
+    def stage_stats(self) -> dict[str, dict]:
+        rows = self._connect().execute("SELECT stage, hits, misses, bytes_saved FROM stages").fetchall()
+        return {
+            stage: {"hits": hits, "misses": misses, "bytes_saved": bytes_saved}
+            for stage, hits, misses, bytes_saved in rows
+        }
+
+
+class ArtifactStore:
+    """
+    A content-addressed store of the cached stage outputs.
+
+    Every file is stored once as a read-only blob keyed by the hash of its content, and a stage's
+    output is a manifest mapping relative paths to blob digests. Run directories are materialized
+    from a manifest with hardlinks (falling back to symlinks, then copies across filesystems),
+    so a cache hit costs a few metadata operations per image instead of a full copy.
+
+    Linked files share their blob: they must be replaced (written to a new file), never modified in place,
+    which is why only `LINKED_SUFFIXES` are linked by default.
+
+    Layout:
+        {root}/blobs/{digest[:2]}/{digest}
+        {root}/manifests/{name}.json
+        {root}/index.sqlite, see `CacheIndex`
+        {root}/locks/{name}.lock, see `lock`
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.blob_dir = pjoin(root, "blobs")
+        self.manifest_dir = pjoin(root, "manifests")
+        os.makedirs(self.blob_dir, exist_ok=True)
+        os.makedirs(self.manifest_dir, exist_ok=True)
+        self.index = CacheIndex(pjoin(root, "index.sqlite"))
+
+    def blob_path(self, digest: str) -> str:
+        return pjoin(self.blob_dir, digest[:2], digest)
+
+    def manifest_path(self, name: str) -> str:
+        return pjoin(self.manifest_dir, f"{name}.json")
+
+    def manifest_names(self) -> list[str]:
+        """
+        Return the names of all the manifests of the store.
+        """
+        names = []
+        for dirpath, _, filenames in os.walk(self.manifest_dir):
+            for filename in filenames:
+                if filename.endswith(".json"):
+                    rel = os.path.relpath(pjoin(dirpath, filename), self.manifest_dir)
+                    names.append(rel[: -len(".json")].replace(os.sep, "/"))
+        return sorted(names)
+
+    def files_size(self, files: dict[str, str]) -> int:
+        """
+        Return the size of the files of a manifest, i.e. the bytes a full copy of it would write.
+        """
+        return sum(os.path.getsize(self.blob_path(d)) for d in files.values() if os.path.exists(self.blob_path(d)))
+
+    def put_file(self, path: str) -> str:
+        """
+        Store a file, returning its digest; files already stored are not copied again.
+        """
+        digest = file_digest(path)
+        blob = self.blob_path(digest)
+        try:
+            # the blob may be an orphan: refresh it, so that `cache_manager.gc` leaves it to the manifest being saved
+            os.utime(blob)
+        except PermissionError:
+            pass
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            # copy then rename, so that a blob is either complete or absent
+            tmp = f"{blob}.{uuid.uuid4().hex}.tmp"
+            shutil.copyfile(path, tmp)
+            os.chmod(tmp, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            os.replace(tmp, blob)
+        return digest
+
+    def put_files(self, files: dict[str, str]) -> dict[str, str]:
+        """
+        Store files under the given relative paths.
+
+        Args:
+            files (dict[str, str]): The file paths by relative path, missing files are skipped.
+
+        Returns:
+            dict[str, str]: The manifest, mapping the relative paths to the blob digests.
+        """
+        return {
+            rel: self.put_file(path)
+            for rel, path in files.items()
+            if os.path.isfile(path)
+        }
+
+    def put_dir(self, src_dir: str, prefix: str = "", suffixes: tuple[str, ...] = None) -> dict[str, str]:
+        """
+        Store the files of a directory recursively.
+
+        Args:
+            src_dir (str): The directory to store.
+            prefix (str): The directory the files are stored under in the manifest.
+            suffixes (tuple[str, ...]): The file suffixes to store, all files when None.
+
+        Returns:
+            dict[str, str]: The manifest of the directory.
+        """
+        files = {}
+        if not os.path.isdir(src_dir):
+            return files
+        for dirpath, _, filenames in os.walk(src_dir):
+            for filename in sorted(filenames):
+                if suffixes is not None and not filename.lower().endswith(suffixes):
+                    continue
+                path = pjoin(dirpath, filename)
+                rel = os.path.relpath(path, src_dir)
+                files[pjoin(prefix, rel) if prefix else rel] = path
+        return self.put_files(files)
+
+    def save_manifest(self, name: str, manifest: dict[str, str], meta: dict = None):
+        """
+        Save the manifest of a stage output, atomically replacing the previous one.
+
+        Args:
+            name (str): The name of the manifest, e.g. `pdf/{hash}`.
+            manifest (dict[str, str]): The blob digests by relative path.
+            meta (dict): JSON data kept along the manifest.
+        """
+        path = self.manifest_path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"files": manifest, "meta": meta or {}}, f, indent=2)
+        os.replace(tmp, path)
+        self.index.record_save(name, self.files_size(manifest))
+
+    def has_manifest(self, name: str) -> bool:
+        """
+        Whether a manifest exists, without checking its blobs nor recording an access, e.g. to plan stages.
+        """
+        return os.path.exists(self.manifest_path(name))
+
+    @contextmanager
+    def lock(self, name: str):
+        """
+        Hold the lock of a manifest across threads and processes, so that a stage output is computed
+        by a single worker while the others wait for it and then find it cached (single flight).
+        The lock is released by the kernel if its holder dies.
+        """
+        path = pjoin(self.root, "locks", f"{name}.lock")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # one open file per holder: flock locks of different open files exclude each other, even in one process
+        with open(path, "a") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                print(f"[CACHE] Waiting for {name}, computed by another worker")
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def single_flight(self, name: str):
+        """
+        Decorate a stage function to run it under the lock of its manifest, see `lock`.
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.lock(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def read_manifest(self, name: str) -> dict | None:
+        """
+        Read a manifest as is, without checking its blobs nor recording an access.
+        """
+        try:
+            with open(self.manifest_path(name)) as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def delete_manifest(self, name: str):
+        """
+        Delete a manifest, its blobs are deleted by the next `cache_manager.gc` if no other manifest uses them.
+        """
+        if os.path.exists(self.manifest_path(name)):
+            os.remove(self.manifest_path(name))
+        self.index.forget(name)
+
+    def load_manifest(self, name: str) -> dict | None:
+        """
+        Load a manifest, None if it does not exist or some of its blobs are missing,
+        recording the cache hit or miss of its stage.
+
+        Returns:
+            dict: `files`, the blob digests by relative path, and `meta`.
+        """
+        manifest = self.read_manifest(name)
+        if manifest is None or not all(os.path.exists(self.blob_path(d)) for d in manifest["files"].values()):
+            self.index.record_miss(name)
+            return None
+        self.index.record_hit(name, self.files_size(manifest["files"]))
+        return manifest
+
+    def read_json(self, manifest: dict, rel: str):
+        with open(self.blob_path(manifest["files"][rel])) as f:
+            return json.load(f)
+
+    def materialize(
+        self,
+        files: dict[str, str],
+        dest_dir: str,
+        overwrite: bool = False,
+        link_suffixes: tuple[str, ...] = LINKED_SUFFIXES,
+    ) -> int:
+        """
+        Materialize files of a manifest into a directory.
+
+        Args:
+            files (dict[str, str]): The blob digests by relative path, e.g. `manifest["files"]` or a subset of it.
+            dest_dir (str): The directory to materialize into.
+            overwrite (bool): Whether to replace existing files, they are kept otherwise.
+            link_suffixes (tuple[str, ...]): The suffixes of the files to link, the others are copied.
+
+        Returns:
+            int: The number of files materialized.
+        """
+        count = 0
+        for rel, digest in files.items():
+            dest = pjoin(dest_dir, rel)
+            if os.path.lexists(dest):
+                if not overwrite:
+                    continue
+                os.remove(dest)
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            if rel.lower().endswith(link_suffixes):
+                link_file(self.blob_path(digest), dest)
+            else:
+                shutil.copyfile(self.blob_path(digest), dest)
+            count += 1
+        return count
+
+
+def link_file(src: str, dest: str) -> str:
+    """
+    Make `dest` a hardlink of `src`, or a symlink if hardlinks are not possible
+    (e.g. across filesystems), or a copy as a last resort.
+
+    Returns:
+        str: The method used, one of `LINK_MODES`.
+    """
+    try:
+        os.link(src, dest)
+        return "hardlink"
+    except OSError:
+        pass
+    try:
+        os.symlink(os.path.abspath(src), dest)
+        return "symlink"
+    except OSError:
+        pass
+    shutil.copyfile(src, dest)
+    return "copy"
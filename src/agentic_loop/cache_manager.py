@@ -0,0 +1,328 @@
+import argparse
+import os
+from collections import defaultdict
+from time import time
+
+from render_cache import RENDER_CACHE_ENV, RenderCache
+from utils import pjoin
+
+from .artifact_store import LINKED_SUFFIXES, ArtifactStore, file_digest, link_file, manifest_stage
+
+# stages of refine_loop_with_cache, by manifest name prefix
+STAGES = ("pptx", "induction", "sample_pair", "pdf", "generation")
+# blobs stored or reused more recently than this may belong to a manifest not saved yet, gc leaves them
+GRACE_SECONDS = 3600
+
+
+def format_bytes(size: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(size) < 1024:
+            return f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}TB"
+
+
+def _blob_refs(store: ArtifactStore) -> tuple[dict[str, dict], dict[str, int]]:
+    """
+    Read all the manifests of a store and count the manifests using each blob.
+    """
+    manifests = {}
+    refs = defaultdict(int)
+    for name in store.manifest_names():
+        manifest = store.read_manifest(name)
+        if manifest is None:
+            continue
+        manifests[name] = manifest
+        for digest in set(manifest["files"].values()):
+            refs[digest] += 1
+    return manifests, refs
+
+
+def _blob_sizes(store: ArtifactStore) -> dict[str, int]:
+    sizes = {}
+    for dirpath, _, filenames in os.walk(store.blob_dir):
+        for filename in filenames:
+            # skip the temporary files of blobs being stored
+            if not filename.endswith(".tmp"):
+                sizes[filename] = os.path.getsize(pjoin(dirpath, filename))
+    return sizes
+
+
+def cache_stats(store: ArtifactStore) -> dict:
+    """
+    Report the disk usage of a store, and the hits, misses and bytes saved by cache hits of every stage.
+
+    Returns:
+        dict: `total_bytes`, `blobs`, and `stages`, the stats of every stage. The bytes of a stage are
+        the bytes of the blobs its manifests use, blobs shared by several stages are counted in each of them.
+    """
+    manifests, _ = _blob_refs(store)
+    sizes = _blob_sizes(store)
+    stage_stats = store.index.stage_stats()
+    stages = {}
+    for stage in sorted(set(STAGES) | set(stage_stats) | {manifest_stage(n) for n in manifests}):
+        digests = {
+            digest
+            for name, manifest in manifests.items()
+            if manifest_stage(name) == stage
+            for digest in manifest["files"].values()
+        }
+        counts = stage_stats.get(stage, {"hits": 0, "misses": 0, "bytes_saved": 0})
+        lookups = counts["hits"] + counts["misses"]
+        stages[stage] = {
+            "manifests": sum(1 for name in manifests if manifest_stage(name) == stage),
+            "bytes": sum(sizes.get(digest, 0) for digest in digests),
+            "hit_rate": counts["hits"] / lookups if lookups else None,
+            **counts,
+        }
+    return {"total_bytes": sum(sizes.values()), "blobs": len(sizes), "stages": stages}
+
+
+def _recent(store: ArtifactStore, digest: str, grace_seconds: float) -> bool:
+    """
+    Whether a blob was stored or reused by `ArtifactStore.put_file` within the grace period.
+    """
+    try:
+        return time() - os.path.getmtime(store.blob_path(digest)) < grace_seconds
+    except FileNotFoundError:
+        return False
+
+
+def gc(
+    store: ArtifactStore,
+    max_bytes: int = None,
+    stages: list[str] = None,
+    max_age_days: float = None,
+    dry_run: bool = False,
+    grace_seconds: float = GRACE_SECONDS,
+) -> dict:
+    """
+    Collect the garbage of a store: delete the blobs no manifest uses, then evict the least recently
+    used manifests (and the blobs only they use) until the store fits in `max_bytes`.
+
+    Blobs are read-only and materialized run directories hold their own links or copies, so evicting
+    a manifest never breaks a finished run; the stage is just recomputed by the next task needing it.
+    A stage stores its blobs before saving its manifest, so the unused blobs stored or reused within
+    `grace_seconds` are kept: they may belong to a stage running concurrently.
+
+    Args:
+        store (ArtifactStore): The store to collect.
+        max_bytes (int): The disk budget of the store in bytes, None for no budget.
+        stages (list[str]): The stages whose manifests may be evicted, all stages when None.
+        max_age_days (float): Evict the manifests not accessed for this many days, whatever the budget.
+        dry_run (bool): Whether to only report what would be deleted.
+        grace_seconds (float): The age under which unused blobs are kept.
+
+    Returns:
+        dict: `evicted`, the names of the evicted manifests, `freed_bytes` and `total_bytes` after collection.
+    """
+    manifests, refs = _blob_refs(store)
+    sizes = _blob_sizes(store)
+    last_access = store.index.last_access()
+    freed = 0
+
+    # blobs no manifest uses, e.g. of manifests deleted by a previous collection or interrupted saves
+    orphans = [digest for digest in sizes if digest not in refs and not _recent(store, digest, grace_seconds)]
+    for digest in orphans:
+        freed += sizes.pop(digest)
+        if not dry_run:
+            os.remove(store.blob_path(digest))
+    total = sum(sizes.values())
+
+    # least recently used first, manifests without access record (e.g. saved by an older version) by mtime
+    def access_time(name):
+        return last_access.get(name) or os.path.getmtime(store.manifest_path(name))
+
+    candidates = sorted(
+        (name for name in manifests if stages is None or manifest_stage(name) in stages),
+        key=access_time,
+    )
+    evicted = []
+    now = time()
+    for name in candidates:
+        expired = max_age_days is not None and now - access_time(name) > max_age_days * 86400
+        if not expired and (max_bytes is None or total <= max_bytes):
+            continue
+        evicted.append(name)
+        if not dry_run:
+            store.delete_manifest(name)
+        for digest in set(manifests[name]["files"].values()):
+            refs[digest] -= 1
+            if refs[digest] == 0 and digest in sizes and not _recent(store, digest, grace_seconds):
+                size = sizes.pop(digest)
+                total -= size
+                freed += size
+                if not dry_run:
+                    os.remove(store.blob_path(digest))
+    if max_bytes is not None and total > max_bytes:
+        print(f"[WARNING] Cache is still {format_bytes(total)} after evicting every allowed stage")
+    return {"evicted": evicted, "freed_bytes": freed, "total_bytes": total}
+
+
+def _entry_size(cache: RenderCache, digest: str) -> int:
+    size = 0
+    for dirpath, _, filenames in os.walk(cache.entry_dir(digest)):
+        for filename in filenames:
+            try:
+                size += os.path.getsize(pjoin(dirpath, filename))
+            except FileNotFoundError:
+                pass
+    return size
+
+
+def render_cache_stats(cache: RenderCache) -> dict:
+    """
+    Report the disk usage of a render cache.
+
+    Returns:
+        dict: `total_bytes`, and `entries`, the number of cached presentations.
+    """
+    digests = cache.entries()
+    return {"total_bytes": sum(_entry_size(cache, digest) for digest in digests), "entries": len(digests)}
+
+
+def gc_render_cache(
+    cache: RenderCache,
+    max_bytes: int = None,
+    max_age_days: float = None,
+    dry_run: bool = False,
+) -> dict:
+    """
+    Evict the least recently used renderings of a render cache until it fits in `max_bytes`.
+    Run directories hold their own links or copies of the cached files, so evicting never breaks a finished run.
+
+    Args:
+        cache (RenderCache): The render cache to collect.
+        max_bytes (int): The disk budget of the cache in bytes, None for no budget.
+        max_age_days (float): Evict the renderings not accessed for this many days, whatever the budget.
+        dry_run (bool): Whether to only report what would be deleted.
+
+    Returns:
+        dict: `evicted`, the digests of the evicted presentations, `freed_bytes` and `total_bytes` after collection.
+    """
+    access_times = {}
+    sizes = {}
+    for digest in cache.entries():
+        try:
+            access_times[digest] = os.path.getmtime(cache.entry_dir(digest))
+        except FileNotFoundError:
+            continue
+        sizes[digest] = _entry_size(cache, digest)
+    total = sum(sizes.values())
+    freed = 0
+    evicted = []
+    now = time()
+    for digest in sorted(access_times, key=access_times.get):
+        expired = max_age_days is not None and now - access_times[digest] > max_age_days * 86400
+        if not expired and (max_bytes is None or total <= max_bytes):
+            continue
+        evicted.append(digest)
+        if not dry_run:
+            cache.delete(digest)
+        total -= sizes[digest]
+        freed += sizes[digest]
+    return {"evicted": evicted, "freed_bytes": freed, "total_bytes": total}
+
+
+def dedup_runs(store: ArtifactStore, runs_dir: str, dry_run: bool = False) -> int:
+    """
+    Replace the images of run directories that are copies of a blob by links to it,
+    e.g. in runs made before the artifact store or materialized by copy.
+
+    Returns:
+        int: The bytes reclaimed.
+    """
+    sizes = _blob_sizes(store)
+    blob_sizes = set(sizes.values())
+    store_root = os.path.realpath(store.root)
+    reclaimed = 0
+    for dirpath, _, filenames in os.walk(runs_dir):
+        if os.path.realpath(dirpath).startswith(store_root):
+            continue
+        for filename in filenames:
+            path = pjoin(dirpath, filename)
+            if not filename.lower().endswith(LINKED_SUFFIXES) or os.path.islink(path):
+                continue
+            stat = os.stat(path)
+            if stat.st_nlink > 1 or stat.st_size not in blob_sizes:
+                continue
+            digest = file_digest(path)
+            if digest not in sizes:
+                continue
+            reclaimed += stat.st_size
+            if not dry_run:
+                tmp = f"{path}.dedup.tmp"
+                link_file(store.blob_path(digest), tmp)
+                os.replace(tmp, path)
+    return reclaimed
+
+
+def parse_size(size: str) -> int:
+    """
+    Parse a size like `50GB`, `500MB` or a number of bytes.
+    """
+    size = size.strip().upper()
+    for unit, factor in (("TB", 1024**4), ("GB", 1024**3), ("MB", 1024**2), ("KB", 1024), ("B", 1)):
+        if size.endswith(unit):
+            return int(float(size[: -len(unit)]) * factor)
+    return int(size)
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(description="Inspect and collect the stage cache of refine_loop_with_cache and the render cache")
+    parser.add_argument("command", choices=["stats", "gc"], help="stats: report usage and hit rates; gc: collect garbage")
+    parser.add_argument("--cache_dir", type=str, default="runs/cache", help="Cache directory, the store is in {cache_dir}/store")
+    parser.add_argument("--max_size", type=str, default=None, help="Disk budget of the cache, e.g. 50GB")
+    parser.add_argument("--render_max_size", type=str, default=None,
+                        help="Disk budget of the render cache of presentations, in {cache_dir}/render unless "
+                             f"{RENDER_CACHE_ENV} is set, e.g. 10GB")
+    parser.add_argument("--stages", type=str, nargs="+", default=None, choices=STAGES,
+                        help="Stages whose outputs may be evicted, all by default")
+    parser.add_argument("--max_age_days", type=float, default=None,
+                        help="Evict outputs not used for this many days, whatever the budget")
+    parser.add_argument("--dedup_runs", type=str, default=None,
+                        help="Runs directory whose image copies of cached files are replaced by links, e.g. runs")
+    parser.add_argument("--grace_minutes", type=float, default=GRACE_SECONDS / 60,
+                        help="Keep the unused outputs stored more recently, they may belong to stages still running")
+    parser.add_argument("--dry_run", action="store_true", help="Only report what would be deleted")
+    args = parser.parse_args(argv)
+
+    store = ArtifactStore(pjoin(args.cache_dir, "store"))
+    render_root = os.environ.get(RENDER_CACHE_ENV, pjoin(args.cache_dir, "render"))
+    render_cache = RenderCache(render_root) if render_root else None
+    if args.command == "gc":
+        result = gc(
+            store,
+            max_bytes=parse_size(args.max_size) if args.max_size else None,
+            stages=args.stages,
+            max_age_days=args.max_age_days,
+            dry_run=args.dry_run,
+            grace_seconds=args.grace_minutes * 60,
+        )
+        action = "Would evict" if args.dry_run else "Evicted"
+        print(f"[INFO] {action} {len(result['evicted'])} stage outputs, "
+              f"freed {format_bytes(result['freed_bytes'])}, cache is {format_bytes(result['total_bytes'])}")
+        if render_cache is not None:
+            result = gc_render_cache(
+                render_cache,
+                max_bytes=parse_size(args.render_max_size) if args.render_max_size else None,
+                max_age_days=args.max_age_days,
+                dry_run=args.dry_run,
+            )
+            print(f"[INFO] {action} {len(result['evicted'])} presentation renderings, "
+                  f"freed {format_bytes(result['freed_bytes'])}, render cache is {format_bytes(result['total_bytes'])}")
+        if args.dedup_runs:
+            reclaimed = dedup_runs(store, args.dedup_runs, dry_run=args.dry_run)
+            print(f"[INFO] Linked duplicate images of {args.dedup_runs}, reclaimed {format_bytes(reclaimed)}")
+
+    stats = cache_stats(store)
+    print(f"[INFO] Cache {store.root}: {format_bytes(stats['total_bytes'])} in {stats['blobs']} blobs")
+    print(f"{'stage':<12} {'outputs':>8} {'size':>10} {'hits':>6} {'misses':>6} {'hit rate':>9} {'saved':>10}")
+    for stage, s in stats["stages"].items():
+        hit_rate = f"{s['hit_rate']:.0%}" if s["hit_rate"] is not None else "-"
+        print(f"{stage:<12} {s['manifests']:>8} {format_bytes(s['bytes']):>10} {s['hits']:>6} "
+              f"{s['misses']:>6} {hit_rate:>9} {format_bytes(s['bytes_saved']):>10}")
+    if render_cache is not None:
+        stats = render_cache_stats(render_cache)
+        print(f"[INFO] Render cache {render_cache.root}: {format_bytes(stats['total_bytes'])} "
+              f"in {stats['entries']} presentations")
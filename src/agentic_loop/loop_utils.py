@@ -21,4 +21,40 @@ def get_file_name_hash(path, digest_bytes=6, prefix=""):
     h.update(p.read_bytes())
     # urlsafe_b64encode keeps it filename-safe; rstrip('=') removes padding
     short_id = base64.urlsafe_b64encode(h.digest()).decode('ascii').rstrip('=')
-    return f"{prefix}{p.stem}_{short_id}"
\ No newline at end of file
+    return f"{prefix}{p.stem}_{short_id}"
+
+# bump to invalidate every cached stage output, e.g. after a change of the cache layout
+CACHE_VERSION = 1
+
+
+def get_package_version(package):
+    """
+    Return the installed version of a package, "none" if it is not installed.
+    """
+    from importlib.metadata import PackageNotFoundError, version
+    try:
+        return version(package)
+    except PackageNotFoundError:
+        return "none"
+
+
+def stage_fingerprint(prompts=(), roles=(), code=(), models=(), deps=(), digest_bytes=6):
+    """
+    Return a url-safe fingerprint of everything a stage's output depends on besides its input files,
+    so that a cached output is only reused while none of them changed:
+    • prompts: paths of the prompt templates it renders
+    • roles: names of the roles (roles/{name}.yaml) it runs
+    • code: paths of the source files implementing it
+    • models: identifiers of the models it calls (e.g. `LLM.model`, package versions)
+    • deps: fingerprints or keys of the stages it depends on
+    """
+    h = hashlib.blake2s(digest_size=digest_bytes)
+    h.update(f"v{CACHE_VERSION}".encode())
+    files = [*prompts, *(f"roles/{name}.yaml" for name in roles), *code]
+    for path in files:
+        h.update(str(path).encode())
+        p = pathlib.Path(path)
+        h.update(p.read_bytes() if p.exists() else b"<missing>")
+    for item in [*models, *deps]:
+        h.update(b"\0" + str(item).encode())
+    return base64.urlsafe_b64encode(h.digest()).decode('ascii').rstrip('=')
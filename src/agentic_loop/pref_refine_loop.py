@@ -1,16 +1,30 @@
 import os
 import json
-import shutil
+from functools import partial
 from utils import pjoin
+from pdf_parsing import is_parsed, marker_parse_pdf
+from model_registry import MODEL_REGISTRY
+from model_daemon import get_daemon_client
+import doc_handling
+import induct_v2
+import model_utils
+import multimodal
+import pdf_parsing
+import pptgen_2stage
+import presentation as presentation_module
 from presentation import Presentation
 
-from .loop_utils import get_file_name_hash
+from .artifact_store import ArtifactStore
+from .loop_utils import get_file_name_hash, get_package_version, stage_fingerprint
+from .stage_graph import StageGraph
 
 from stage_modules import (
     stage_ppt_template_parsing,
     stage_slide_induction,
     stage_reference_document_parsing,
     stage_target_document_parsing,
+    stage_target_document_captioning,
+    stage_target_document_refinement,
     stage_presentation_generation,
     stage_presentation_refinement,
 )
@@ -61,29 +75,70 @@ def refine_loop_with_cache(
     """
 
     
-    # Create cache directories if they don't exist
-    os.makedirs(pjoin(cache_dir, "pptx"), exist_ok=True)
-    os.makedirs(pjoin(cache_dir, "pdf"), exist_ok=True)
+    # Cached stage outputs are manifests of a content-addressed store, materialized into the run directories
+    store = ArtifactStore(pjoin(cache_dir, "store"))
     
     # Copy template to the project directory
     if not os.path.exists(pjoin(pptx_config.RUN_DIR, "source.pptx")):
         os.system(f"cp '{ppt_path}' '{pjoin(pptx_config.RUN_DIR, 'source.pptx')}'")
     
+    # Stages 1-4 form a graph: the template branch (parsing, induction) and the document branch
+    # (reference parsing, target parsing) only meet at generation, and the marker parsing of the
+    # target PDF does not depend on the reference guidelines, so they run concurrently.
+    # marker runs in a single worker process loading its models once, the LLM-bound stages in threads.
+    graph = StageGraph()
+    # with a model daemon, marker stages only wait on it
+    marker_executor = "thread" if get_daemon_client() is not None else "process"
+
+    # Every cache key combines the hashes of the stage's input files with the fingerprint of
+    # the prompts, roles, code and models it depends on, including the stages it builds on
+    llm_ids = [vision_model.model, language_model.model]
+    marker_id = f"marker-pdf=={get_package_version('marker-pdf')}"
+    template_fp = stage_fingerprint(
+        prompts=["prompts/caption.txt"],
+        code=[multimodal.__file__, presentation_module.__file__],
+        models=[vision_model.model],
+    )
+    induction_fp = stage_fingerprint(
+        prompts=["prompts/category_split.txt", "prompts/ask_category.txt", "prompts/content_induct.txt",
+                 "prompts/content_induct_v2.txt", "prompts/content_induct_v2_simp.txt"],
+        code=[induct_v2.__file__, model_utils.__file__],
+        models=[*llm_ids, model_utils.IMAGE_MODEL_NAME],
+        deps=[template_fp],
+    )
+    parsing_fp = stage_fingerprint(
+        prompts=[pdf_parsing.CAPTION_PROMPT_PATH, doc_handling.REFINE_TEMPLATE_PATH],
+        code=[pdf_parsing.__file__],
+        models=[*llm_ids, marker_id],
+    )
+    ref_fp = stage_fingerprint(
+        prompts=[doc_handling.PRESENTATION_GUIDELINES_TEMPLATE_PATH],
+        code=[doc_handling.__file__],
+        models=llm_ids,
+        deps=[parsing_fp],
+    )
+    generation_fp = stage_fingerprint(
+        roles=pptgen_2stage.PPTCrew.roles,
+        code=[pptgen_2stage.__file__],
+        models=[*llm_ids, model_utils.TEXT_MODEL_NAME],
+        deps=[induction_fp],
+    )
+
     # 1. PPT template parsing with caching
-    print("[STAGE] PPT Template Parsing")
     ppt_hash = get_file_name_hash(ppt_path, prefix="pptx_")
-    ppt_cache_dir = pjoin(cache_dir, "pptx", ppt_hash)
-    
-    if use_cache and os.path.exists(ppt_cache_dir) and os.path.exists(pjoin(ppt_cache_dir, "slide_images")):
-        print(f"[CACHE] Using cached PPT template parsing from {ppt_cache_dir}")
-        # Load presentation from cache
-        presentation = Presentation.from_file(pjoin(ppt_cache_dir, "source.pptx"), pptx_config)
-        ppt_image_folder = pjoin(ppt_cache_dir, "slide_images")
-        
-        # Copy cached files to the project directory for this run
-        if not os.path.exists(pjoin(pptx_config.RUN_DIR, "slide_images")):
-            shutil.copytree(ppt_image_folder, pjoin(pptx_config.RUN_DIR, "slide_images"))
-    else:
+    ppt_manifest_name = f"pptx/{ppt_hash}/{template_fp}"
+
+    @store.single_flight(ppt_manifest_name)
+    def template():
+        print("[STAGE] PPT Template Parsing")
+        manifest = store.load_manifest(ppt_manifest_name) if use_cache else None
+        if manifest is not None:
+            print(f"[CACHE] Using cached PPT template parsing {ppt_manifest_name}")
+            # Materialize the cached files into the project directory for this run
+            store.materialize(manifest["files"], pptx_config.RUN_DIR)
+            presentation = Presentation.from_file(pjoin(pptx_config.RUN_DIR, "source.pptx"), pptx_config)
+            return presentation, pjoin(pptx_config.RUN_DIR, "slide_images")
+
         # Run template parsing and cache results
         presentation, ppt_image_folder = stage_ppt_template_parsing(
             pjoin(pptx_config.RUN_DIR, "source.pptx"),
@@ -91,87 +146,91 @@ def refine_loop_with_cache(
             vision_model
         )
         
-        # Cache the results
+        # Cache the results, everything in pptx_config.RUN_DIR including source.pptx and slide_images
         if renew_cache:
-            os.makedirs(ppt_cache_dir, exist_ok=True)
-            # Copy the everything in pptx_config.RUN_DIR to ppt_cache_dir
-            shutil.copytree(pptx_config.RUN_DIR, ppt_cache_dir, dirs_exist_ok=True)
-            
-            # Save the presentation explicitly
-            shutil.copy(pjoin(pptx_config.RUN_DIR, "source.pptx"), pjoin(ppt_cache_dir, "source.pptx"))
-            
-            # Ensure the image directory exists in the cache
-            if os.path.exists(ppt_image_folder):
-                slide_images_cache_dir = pjoin(ppt_cache_dir, "slide_images")
-                shutil.copytree(ppt_image_folder, slide_images_cache_dir, dirs_exist_ok=True)
-            else:
+            if not os.path.exists(ppt_image_folder):
                 print("[WARNING] slide_images directory not found, cache may be incomplete")
+            store.save_manifest(ppt_manifest_name, store.put_dir(pptx_config.RUN_DIR))
+        return presentation, ppt_image_folder
+
+    graph.add("template", template)
     
     # 2. Slide induction (template analysis) with caching
-    print("[STAGE] Slide Induction")
-    induction_cache_dir = pjoin(cache_dir, "pptx", ppt_hash, "induction")
-    
-    if use_cache and os.path.exists(induction_cache_dir) and os.path.exists(pjoin(induction_cache_dir, "slide_induction.json")) and os.path.exists(pjoin(induction_cache_dir, "template.pptx")):
-        print(f"[CACHE] Using cached slide induction from {induction_cache_dir}")
-        # Load template presentation and slide induction from cache
-        template_presentation = Presentation.from_file(pjoin(induction_cache_dir, "template.pptx"), pptx_config)
-        with open(pjoin(induction_cache_dir, "slide_induction.json"), "r") as f:
-            slide_induction = json.load(f)
-            
-        # Copy cached files to the project directory
-        if not os.path.exists(pjoin(pptx_config.RUN_DIR, "template.pptx")):
-            shutil.copy(pjoin(induction_cache_dir, "template.pptx"), pjoin(pptx_config.RUN_DIR, "template.pptx"))
-        if not os.path.exists(pjoin(pptx_config.RUN_DIR, "slide_induction.json")):
-            shutil.copy(pjoin(induction_cache_dir, "slide_induction.json"), pjoin(pptx_config.RUN_DIR, "slide_induction.json"))
-    else:
-        from model_utils import get_image_model
-        image_model = get_image_model(device=args.device)
+    induction_manifest_name = f"induction/{ppt_hash}/{induction_fp}"
+
+    @store.single_flight(induction_manifest_name)
+    def induction(template):
+        print("[STAGE] Slide Induction")
+        manifest = store.load_manifest(induction_manifest_name) if use_cache else None
+        if manifest is not None and {"template.pptx", "slide_induction.json"} <= manifest["files"].keys():
+            print(f"[CACHE] Using cached slide induction {induction_manifest_name}")
+            # Materialize template presentation and slide induction into the project directory
+            store.materialize(manifest["files"], pptx_config.RUN_DIR)
+            template_presentation = Presentation.from_file(pjoin(pptx_config.RUN_DIR, "template.pptx"), pptx_config)
+            slide_induction = store.read_json(manifest, "slide_induction.json")
+            return template_presentation, slide_induction
+
+        presentation, ppt_image_folder = template
         
         # Run slide induction
-        template_presentation, slide_induction = stage_slide_induction(
-            presentation,
-            ppt_image_folder,
-            pptx_config,
-            vision_model,
-            language_model,
-            image_model
-        )
+        with MODEL_REGISTRY.use("image", args.device) as induction_image_model:
+            template_presentation, slide_induction = stage_slide_induction(
+                presentation,
+                ppt_image_folder,
+                pptx_config,
+                vision_model,
+                language_model,
+                induction_image_model
+            )
         
         # Cache the results
         if use_cache:
-            os.makedirs(induction_cache_dir, exist_ok=True)
-            # Save template presentation
-            if os.path.exists(pjoin(pptx_config.RUN_DIR, "template.pptx")):
-                shutil.copy(pjoin(pptx_config.RUN_DIR, "template.pptx"), pjoin(induction_cache_dir, "template.pptx"))
             # Save slide induction
-            with open(pjoin(induction_cache_dir, "slide_induction.json"), "w") as f:
+            slide_induction_path = pjoin(pptx_config.RUN_DIR, "slide_induction.json")
+            with open(slide_induction_path, "w") as f:
                 json.dump(slide_induction, f, indent=2)
-    
-    
-    # import pdb; pdb.set_trace()
+            # Save template presentation
+            store.save_manifest(induction_manifest_name, store.put_files({
+                "template.pptx": pjoin(pptx_config.RUN_DIR, "template.pptx"),
+                "slide_induction.json": slide_induction_path,
+            }))
+        return template_presentation, slide_induction
+
+    graph.add("induction", induction, deps=["template"])
     
     # 3. Reference document parsing with caching
-    print("[STAGE] Reference Document Parsing")
     ref_pdf_hash = get_file_name_hash(ref_content_pdf, prefix="refpdf_")
     ref_ppt_hash = get_file_name_hash(ref_content_ppt, prefix="refppt_")
-    ref_cache_dir = pjoin(cache_dir, "sample_pair", f"{ref_pdf_hash}_{ref_ppt_hash}")
-    
-    if use_cache and os.path.exists(ref_cache_dir) and os.path.exists(pjoin(ref_cache_dir, "pref_guidelines.json")):
-        print(f"[CACHE] Using cached reference document parsing from {ref_cache_dir}")
-        # Load preference guidelines from cache
-        with open(pjoin(ref_cache_dir, "pref_guidelines.json"), "r") as f:
-            pref_guidelines = json.load(f)
-            
-        # Copy to project directory
-        pref_guidelines_path = pjoin(output_dir, "pref_guidelines.json")
-        with open(pref_guidelines_path, "w") as f:
-            json.dump(pref_guidelines, f, indent=2)
+    ref_key = f"{ref_pdf_hash}_{ref_ppt_hash}/{ref_fp}"
+    ref_manifest_name = f"sample_pair/{ref_key}"
+    ref_pdf_dir = pjoin("runs", project_id, "pdf", "ref_pdf")
+    ref_ppt_dir = pjoin("runs", project_id, "pdf", "ref_slide_pdf")
+
+    def marker_text(pdf_path, parsed_pdf_dir, text):
+        # the marker stages are planned from a peek at the cache, parse here if the output was evicted since
+        if text is None and not is_parsed(parsed_pdf_dir):
+            text = marker_parse_pdf(pdf_path, parsed_pdf_dir, args.device)
+        return text
+
+    ref_deps = []
+    if not (use_cache and store.has_manifest(ref_manifest_name)):
+        if not is_parsed(ref_pdf_dir):
+            graph.add("ref_pdf_marker", partial(marker_parse_pdf, ref_content_pdf, ref_pdf_dir, args.device), executor=marker_executor)
+            ref_deps.append("ref_pdf_marker")
+        if not is_parsed(ref_ppt_dir):
+            graph.add("ref_ppt_marker", partial(marker_parse_pdf, ref_content_ppt, ref_ppt_dir, args.device), executor=marker_executor)
+            ref_deps.append("ref_ppt_marker")
+
+    @store.single_flight(ref_manifest_name)
+    def reference(ref_pdf_marker=None, ref_ppt_marker=None):
+        print("[STAGE] Reference Document Parsing")
+        manifest = store.load_manifest(ref_manifest_name) if use_cache else None
+        if manifest is not None and "pref_guidelines.json" in manifest["files"]:
+            print(f"[CACHE] Using cached reference document parsing {ref_manifest_name}")
+            # Materialize preference guidelines into the project directory
+            store.materialize({"pref_guidelines.json": manifest["files"]["pref_guidelines.json"]}, output_dir, overwrite=True)
+            return store.read_json(manifest, "pref_guidelines.json")
 
-    else:
-        from marker.models import create_model_dict
-        import torch
-        marker_model = create_model_dict(device=args.device, dtype=torch.float16)
-        
         # Run reference document parsing
         pref_guidelines = stage_reference_document_parsing(
             ref_content_pdf,
@@ -179,93 +238,108 @@ def refine_loop_with_cache(
             marker_model,
             vision_model,
             language_model,
-            project_id
+            project_id,
+            ref_pdf_text=marker_text(ref_content_pdf, ref_pdf_dir, ref_pdf_marker),
+            ref_slide_text=marker_text(ref_content_ppt, ref_ppt_dir, ref_ppt_marker),
         )
 
-        # Cache the results
+        # Cache the results along the parsed PDFs
         if use_cache:
-            os.makedirs(ref_cache_dir, exist_ok=True)
-            with open(pjoin(ref_cache_dir, "pref_guidelines.json"), "w") as f:
-                json.dump(pref_guidelines, f, indent=2)
-            
-            # Copy parsed PDFs to cache if they exist
-            ref_pdf_dir = pjoin("runs", project_id, "pdf", "ref_pdf")
-            ref_ppt_dir = pjoin("runs", project_id, "pdf", "ref_slide_pdf")
-            
-            if os.path.exists(ref_pdf_dir):
-                os.makedirs(pjoin(ref_cache_dir, "ref_pdf"), exist_ok=True)
-                for file in os.listdir(ref_pdf_dir):
-                    shutil.copy(pjoin(ref_pdf_dir, file), pjoin(ref_cache_dir, "ref_pdf", file))
-                    
-            if os.path.exists(ref_ppt_dir):
-                os.makedirs(pjoin(ref_cache_dir, "ref_slide_pdf"), exist_ok=True)
-                for file in os.listdir(ref_ppt_dir):
-                    shutil.copy(pjoin(ref_ppt_dir, file), pjoin(ref_cache_dir, "ref_slide_pdf", file))
+            manifest = store.put_files({"pref_guidelines.json": pjoin("runs", project_id, "pref_guidelines.json")})
+            manifest.update(store.put_dir(ref_pdf_dir, prefix="ref_pdf"))
+            manifest.update(store.put_dir(ref_ppt_dir, prefix="ref_slide_pdf"))
+            store.save_manifest(ref_manifest_name, manifest)
+        return pref_guidelines
+
+    graph.add("reference", reference, deps=ref_deps)
     
     # 4. Target document parsing with caching
-    print("[STAGE] Target Document Parsing")
     target_pdf_hash = get_file_name_hash(target_pdf, prefix="tgtpdf_")
-    target_cache_dir = pjoin(cache_dir, "pdf", target_pdf_hash)
-    
-    if use_cache and os.path.exists(target_cache_dir) and os.path.exists(pjoin(target_cache_dir, "refined_doc.json")) and os.path.exists(pjoin(target_cache_dir, "image_captions.json")):
-        print(f"[CACHE] Using cached target document parsing from {target_cache_dir}")
-        # Load document JSON and images from cache
-        with open(pjoin(target_cache_dir, "refined_doc.json"), "r") as f:
-            doc_json = json.load(f)
-        with open(pjoin(target_cache_dir, "image_captions.json"), "r") as f:
-            images = json.load(f)
-            
-        # Copy to project directory
-        target_dir = pjoin("runs", project_id, "pdf", "target_pdf")
-        os.makedirs(target_dir, exist_ok=True)
-        with open(pjoin(target_dir, "refined_doc.json"), "w") as f:
-            json.dump(doc_json, f, indent=2)
-        with open(pjoin(target_dir, "image_captions.json"), "w") as f:
-            json.dump(images, f, indent=2)
-            
-        # Copy images if they exist
-        if os.path.exists(pjoin(target_cache_dir, "images")):
-            os.makedirs(pjoin(target_dir, "images"), exist_ok=True)
-            for img_file in os.listdir(pjoin(target_cache_dir, "images")):
-                shutil.copy(pjoin(target_cache_dir, "images", img_file), pjoin(target_dir, "images", img_file))
-    else:
-        
-        from marker.models import create_model_dict
-        import torch
-        marker_model = create_model_dict(device=args.device, dtype=torch.float16)
-        
-        # Run target document parsing
-        doc_json, images = stage_target_document_parsing(
+    # the target document is refined with the reference guidelines, so its key includes the reference key
+    target_fp = stage_fingerprint(
+        prompts=[doc_handling.CONDITIONAL_REFINE_WITH_GUIDELINES_TEMPLATE_PATH],
+        code=[doc_handling.__file__],
+        models=llm_ids,
+        deps=[parsing_fp, ref_key],
+    )
+    target_manifest_name = f"pdf/{target_pdf_hash}/{target_fp}"
+    target_dir = pjoin("runs", project_id, "pdf", "target_pdf")
+
+    # captioning does not depend on the guidelines, only the refinement does
+    def caption_target(target_marker=None):
+        return stage_target_document_captioning(
             target_pdf,
             marker_model,
             vision_model,
             language_model,
             project_id,
-            pref_guidelines
+            text_content=marker_text(target_pdf, target_dir, target_marker),
+        )
+
+    target_deps = ["reference"]
+    if not (use_cache and store.has_manifest(target_manifest_name)):
+        captioning_deps = []
+        if not is_parsed(target_dir):
+            graph.add("target_marker", partial(marker_parse_pdf, target_pdf, target_dir, args.device), executor=marker_executor)
+            captioning_deps.append("target_marker")
+        graph.add("target_captioning", caption_target, deps=captioning_deps)
+        target_deps.append("target_captioning")
+
+    # the image paths reach the planner and editor prompts: like the baseline cache, they are kept
+    # under the cache directory, the same for every run and whether the stage was cached or not,
+    # so that the LLM calls downstream hit the response cache on reruns
+    target_images_dir = pjoin(cache_dir, "pdf", target_pdf_hash, target_fp)
+
+    def stable_images(manifest, captions):
+        store.materialize(
+            {rel: digest for rel, digest in manifest["files"].items() if rel.startswith("images/")},
+            target_images_dir,
+        )
+        return {pjoin(target_images_dir, rel): caption for rel, caption in captions.items()}
+
+    @store.single_flight(target_manifest_name)
+    def target(reference, target_captioning=None):
+        print("[STAGE] Target Document Parsing")
+        manifest = store.load_manifest(target_manifest_name) if use_cache else None
+        if manifest is not None and {"refined_doc.json", "image_captions.json"} <= manifest["files"].keys():
+            print(f"[CACHE] Using cached target document parsing {target_manifest_name}")
+            # Materialize document JSON, image captions and images into the project directory
+            store.materialize(manifest["files"], target_dir)
+            doc_json = store.read_json(manifest, "refined_doc.json")
+            return doc_json, stable_images(manifest, store.read_json(manifest, "image_captions.json"))
+
+        # Run target document parsing, captioning it here if the cached output was evicted since the planning
+        if target_captioning is None:
+            target_captioning = caption_target()
+        doc_json, images = stage_target_document_refinement(
+            target_captioning,
+            language_model,
+            project_id,
+            reference
         )
         
         # Cache the results
         if use_cache:
-            os.makedirs(target_cache_dir, exist_ok=True)
-            with open(pjoin(target_cache_dir, "refined_doc.json"), "w") as f:
-                json.dump(doc_json, f, indent=2)
-            with open(pjoin(target_cache_dir, "image_captions.json"), "w") as f:
-                # redirect the images from the target_dir to the cache
-                redir_images = {}
-                for k, v in images.items():
-                    redir_images[os.path.join(target_cache_dir, "images", os.path.basename(k))] = v
-                images = redir_images
-                json.dump(images, f, indent=2)
-                
-            # Copy images to cache
-            target_dir = pjoin("runs", project_id, "pdf", "target_pdf")
-            if os.path.exists(target_dir):
-                for file in os.listdir(target_dir):
-                    if file.endswith(('.png', '.jpg', '.jpeg', '.gif')):
-                        os.makedirs(pjoin(target_cache_dir, "images"), exist_ok=True)
-                        shutil.copy(pjoin(target_dir, file), pjoin(target_cache_dir, "images", file))
-    
-    # import pdb; pdb.set_trace()
+            captions_path = pjoin(target_dir, "image_captions.json")
+            # key the images by their path in the cached images directory
+            captions = {pjoin("images", os.path.basename(k)): v for k, v in images.items()}
+            with open(captions_path, "w") as f:
+                json.dump(captions, f, indent=2)
+            manifest = store.put_files({
+                "refined_doc.json": pjoin(target_dir, "refined_doc.json"),
+                "image_captions.json": captions_path,
+            })
+            manifest.update(store.put_dir(target_dir, prefix="images", suffixes=('.png', '.jpg', '.jpeg', '.gif')))
+            store.save_manifest(target_manifest_name, manifest)
+            images = stable_images({"files": manifest}, captions)
+        return doc_json, images
+
+    graph.add("target", target, deps=target_deps)
+
+    results = graph.run()
+    template_presentation, slide_induction = results["induction"]
+    pref_guidelines = results["reference"]
+    doc_json, images = results["target"]
     
     # 5. Initial presentation generation
     print("[STAGE] Initial PPT Generation")
@@ -273,64 +347,58 @@ def refine_loop_with_cache(
     # Combine all hashes to create a unique identifier for this generation
     slides_count_hash = f"slides_{args.slides}"
     gen_hash = f"{ppt_hash}_{ref_pdf_hash}_{ref_ppt_hash}_{target_pdf_hash}_{slides_count_hash}"
-    gen_cache_dir = pjoin(cache_dir, "generation", gen_hash)
-    cached_pptx_path = pjoin(gen_cache_dir, "final.pptx")
-    cached_outline_path = pjoin(gen_cache_dir, "presentation_outline.json")
-    
-    # if have a cached generation result
-    if use_cache and not args.regen_outline and os.path.exists(gen_cache_dir) and os.path.exists(cached_pptx_path) and os.path.exists(cached_outline_path):
-        print(f"[CACHE] Using cached presentation generation from {gen_cache_dir}")
+    gen_manifest_name = f"generation/{gen_hash}/{stage_fingerprint(deps=[generation_fp, ref_fp, target_fp])}"
+    # a single worker generates each presentation, the others wait for it and get a cache hit
+    with store.lock(gen_manifest_name):
+        gen_manifest = store.load_manifest(gen_manifest_name) if use_cache and not args.regen_outline else None
+    
+        # if have a cached generation result
+        if gen_manifest is not None and {"final.pptx", "presentation_outline.json"} <= gen_manifest["files"].keys():
+            print(f"[CACHE] Using cached presentation generation {gen_manifest_name}")
         
-        # Copy the cached presentation to the output directory
-        output_pptx_path = pjoin(output_dir, "final.pptx")
-        shutil.copy(cached_pptx_path, output_pptx_path)
+            # Materialize the cached presentation (and its PDF, if cached) into the output directory
+            store.materialize(gen_manifest["files"], output_dir, overwrite=True)
+            output_pptx_path = pjoin(output_dir, "final.pptx")
         
-        # Convert to PDF if needed
-        if not os.path.exists(output_pptx_path.replace(".pptx", ".pdf")):
-            from utils import pptx_to_pdf
-            pptx_to_pdf(output_pptx_path, output_dir)
+            # Convert to PDF if needed
+            if not os.path.exists(output_pptx_path.replace(".pptx", ".pdf")):
+                from utils import pptx_to_pdf
+                pptx_to_pdf(output_pptx_path, output_dir)
             
-        initial_pptx_path = output_pptx_path
-        with open(pjoin(gen_cache_dir, "presentation_outline.json"), "r") as f:
-            presentation_outline = json.load(f)
-        shutil.copy(pjoin(gen_cache_dir, "presentation_outline.json"), pjoin(output_dir, "presentation_outline.json"))
+            initial_pptx_path = output_pptx_path
+            presentation_outline = store.read_json(gen_manifest, "presentation_outline.json")
             
-    else:
-        
-        from model_utils import get_text_model
-        text_model = get_text_model(device=args.device)
+        else:
         
-        print("[INFO] Generating presentation outline")
+            print("[INFO] Generating presentation outline")
         
-        # Generate the presentation
-        initial_pptx_path, presentation_outline = stage_presentation_generation(
-            template_presentation=template_presentation,
-            slide_induction=slide_induction,
-            generation_config=generation_config,
-            pref_guidelines=pref_guidelines,
-            images=images,
-            num_slides=args.slides,
-            doc_json=doc_json,
-            vision_model=vision_model,
-            language_model=language_model,
-            text_model=text_model
-        )
+            # Generate the presentation
+            with MODEL_REGISTRY.use("text", args.device) as text_model:
+                initial_pptx_path, presentation_outline = stage_presentation_generation(
+                    template_presentation=template_presentation,
+                    slide_induction=slide_induction,
+                    generation_config=generation_config,
+                    pref_guidelines=pref_guidelines,
+                    images=images,
+                    num_slides=args.slides,
+                    doc_json=doc_json,
+                    vision_model=vision_model,
+                    language_model=language_model,
+                    text_model=text_model,
+                    parallel_slides=args.parallel_slides,
+                    resume=getattr(args, "resume", False),
+                )
         
-        # Cache the generated presentation
-        if use_cache and initial_pptx_path is not None:
-            os.makedirs(gen_cache_dir, exist_ok=True)
-            
-            # Copy the generated presentation to the cache
-            shutil.copy(initial_pptx_path, cached_pptx_path)
-            
-            # Copy PDF if it exists
-            pdf_path = initial_pptx_path.replace(".pptx", ".pdf")
-            if os.path.exists(pdf_path):
-                shutil.copy(pdf_path, pjoin(gen_cache_dir, "final.pdf"))
-            
-            # Copy presentation outline to cache
-            with open(pjoin(gen_cache_dir, "presentation_outline.json"), "w") as f:
-                json.dump(presentation_outline, f, indent=2)
+            # Cache the generated presentation, its PDF if it exists and its outline
+            if use_cache and initial_pptx_path is not None:
+                outline_path = pjoin(output_dir, "presentation_outline.json")
+                with open(outline_path, "w") as f:
+                    json.dump(presentation_outline, f, indent=2)
+                store.save_manifest(gen_manifest_name, store.put_files({
+                    "final.pptx": initial_pptx_path,
+                    "final.pdf": initial_pptx_path.replace(".pptx", ".pdf"),
+                    "presentation_outline.json": outline_path,
+                }))
     
     # Skip refinement if requested or if initial generation failed
     if not hasattr(args, 'no_refinement') or args.no_refinement or initial_pptx_path is None:
@@ -467,7 +535,8 @@ def refine_loop(
         doc_json,
         vision_model,
         language_model,
-        text_model
+        text_model,
+        parallel_slides=args.parallel_slides,
     )
     
     # Skip refinement if requested or if initial generation failed
@@ -0,0 +1,137 @@
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+EXECUTORS = ("thread", "process")
+
+# worker processes of the process stages, kept across runs so the models they load
+# (see `model_registry`) are loaded once per process rather than once per run
+_PROCESS_POOLS: dict[int, ProcessPoolExecutor] = {}
+
+
+def get_process_pool(max_processes: int) -> ProcessPoolExecutor:
+    """
+    Get the shared process pool with `max_processes` workers, started on first use.
+    """
+    if max_processes not in _PROCESS_POOLS:
+        # spawn rather than fork, CUDA cannot be used in a forked child
+        _PROCESS_POOLS[max_processes] = ProcessPoolExecutor(
+            max_processes, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _PROCESS_POOLS[max_processes]
+
+
+def shutdown_process_pools():
+    """
+    Stop the shared worker processes, unloading their models.
+    """
+    for pool in _PROCESS_POOLS.values():
+        pool.shutdown(wait=True, cancel_futures=True)
+    _PROCESS_POOLS.clear()
+
+
+@dataclass
+class Stage:
+    """
+    A node of a StageGraph.
+
+    Args:
+        name (str): The name of the stage, its result is passed to its dependents under this name.
+        func (Callable): The function of the stage, called with the results of its dependencies as keyword arguments.
+        deps (list[str]): The names of the stages it depends on.
+        executor (str): `thread` for LLM-bound stages, `process` for CPU/GPU-bound ones (e.g. marker);
+            process stages must be picklable, i.e. module-level functions or partials of them.
+    """
+
+    name: str
+    func: Callable[..., Any]
+    deps: list[str] = field(default_factory=list)
+    executor: str = "thread"
+
+
+class StageError(RuntimeError):
+    """
+    Raised when a stage of a StageGraph fails.
+    """
+
+    def __init__(self, stage: str, error: Exception):
+        super().__init__(f"Stage {stage} failed: {error}")
+        self.stage = stage
+        self.error = error
+
+
+class StageGraph:
+    """
+    A dependency graph of pipeline stages, running every stage as soon as its dependencies are done,
+    so that independent branches run concurrently.
+    """
+
+    def __init__(self, max_threads: int = 4, max_processes: int = 1):
+        """
+        Initialize the StageGraph.
+
+        Args:
+            max_threads (int): The number of thread stages run concurrently.
+            max_processes (int): The number of worker processes; process stages keep the models
+                they load between calls and runs, so one process avoids loading them twice.
+        """
+        self.max_threads = max_threads
+        self.max_processes = max_processes
+        self.stages: dict[str, Stage] = {}
+
+    def add(self, name: str, func: Callable[..., Any], deps: list[str] = (), executor: str = "thread"):
+        """
+        Add a stage, after the stages it depends on.
+        """
+        assert name not in self.stages, f"Stage {name} already exists"
+        assert executor in EXECUTORS, f"Unknown executor {executor}"
+        for dep in deps:
+            assert dep in self.stages, f"Stage {name} depends on unknown stage {dep}"
+        self.stages[name] = Stage(name, func, list(deps), executor)
+        return self
+
+    def run(self) -> dict[str, Any]:
+        """
+        Run all stages.
+
+        Returns:
+            dict[str, Any]: The results of the stages by name.
+
+        Raises:
+            StageError: If a stage fails, the stages already running are waited for and no new one is started.
+        """
+        results = {}
+        pending = dict(self.stages)
+        running = {}
+        thread_pool = ThreadPoolExecutor(self.max_threads)
+        start_time = time.time()
+        try:
+            while pending or running:
+                for name, stage in list(pending.items()):
+                    if not all(dep in results for dep in stage.deps):
+                        continue
+                    kwargs = {dep: results[dep] for dep in stage.deps}
+                    if stage.executor == "process":
+                        future = get_process_pool(self.max_processes).submit(stage.func, **kwargs)
+                    else:
+                        future = thread_pool.submit(stage.func, **kwargs)
+                    print(f"[STAGE] {name} started at {time.time() - start_time:.1f}s")
+                    running[future] = name
+                    del pending[name]
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except Exception as e:
+                        raise StageError(name, e) from e
+                    print(f"[STAGE] {name} finished at {time.time() - start_time:.1f}s")
+        finally:
+            thread_pool.shutdown(wait=True, cancel_futures=True)
+            for future in running:
+                future.cancel()
+            wait(running)
+        return results
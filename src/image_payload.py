@@ -0,0 +1,268 @@
+import base64
+import io
+import os
+import posixpath
+import threading
+from collections import OrderedDict
+from functools import partial
+from pathlib import Path
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote, urlparse, urlsplit
+
+from PIL import Image
+
+IMAGE_TRANSPORTS = ("base64", "file", "http")
+# directory served by the media server by default: the run directories and the caches they link images from
+DEFAULT_MEDIA_ROOT = "runs"
+
+MIME_TYPES = {
+    "jpg": "image/jpeg",
+    "jpeg": "image/jpeg",
+    "png": "image/png",
+    "gif": "image/gif",
+    "webp": "image/webp",
+    "bmp": "image/bmp",
+}
+
+
+class PayloadCache:
+    """
+    A thread-safe LRU cache of encoded image payloads, bounded by the total payload size.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024**2):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> str | None:
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key: tuple, payload: str):
+        with self._lock:
+            if key in self._entries:
+                self.total_bytes -= len(self._entries.pop(key))
+            self._entries[key] = payload
+            self.total_bytes += len(payload)
+            while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self.total_bytes -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+PAYLOAD_CACHE = PayloadCache()
+
+
+def _encode(path: str, max_size: int | None, quality: int | None) -> str:
+    """
+    Read an image, downscale it to fit `max_size` and recompress it as JPEG if required.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    ext = path.rsplit(".", 1)[-1].lower()
+    mime = MIME_TYPES.get(ext, "image/jpeg")
+
+    with Image.open(io.BytesIO(data)) as img:
+        need_resize = max_size is not None and max(img.size) > max_size
+        if need_resize or quality is not None:
+            if img.mode in ("RGBA", "LA", "P"):
+                img = img.convert("RGBA")
+                background = Image.new("RGB", img.size, (255, 255, 255))
+                background.paste(img, mask=img.split()[-1])
+                img = background
+            elif img.mode != "RGB":
+                img = img.convert("RGB")
+            if need_resize:
+                img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+            buffer = io.BytesIO()
+            img.save(buffer, format="JPEG", quality=quality or 90, optimize=True)
+            data = buffer.getvalue()
+            mime = "image/jpeg"
+
+    return f"data:{mime};base64,{base64.b64encode(data).decode('utf-8')}"
+
+
+def encode_image(path: str, max_size: int = None, quality: int = None) -> str:
+    """
+    Encode an image file as a base64 data url, memoized by (path, mtime, size, max_size, quality).
+
+    Args:
+        path (str): The image file path.
+        max_size (int): The maximum length of the longer side, larger images are downscaled; None to keep the resolution.
+        quality (int): The JPEG quality to recompress to; None to keep the original bytes when no resize is needed.
+
+    Returns:
+        str: The data url of the image.
+    """
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size, max_size, quality)
+    payload = PAYLOAD_CACHE.get(key)
+    if payload is None:
+        payload = _encode(path, max_size, quality)
+        PAYLOAD_CACHE.put(key, payload)
+    return payload
+
+
+def _within(path: str, roots: list[str]) -> int | None:
+    """
+    Get the index of the first root containing a path, None if none does.
+    """
+    for i, root in enumerate(roots):
+        if os.path.commonpath([root, path]) == root:
+            return i
+    return None
+
+
+class _MediaHandler(SimpleHTTPRequestHandler):
+    """
+    Serve the files of the roots of a LocalMediaServer, at /<index of the root>/<path relative to it>.
+    """
+
+    def translate_path(self, path: str) -> str:
+        roots = self.server.media_roots
+        index, _, rel = posixpath.normpath(unquote(urlsplit(path).path)).lstrip("/").partition("/")
+        if not index.isdigit() or int(index) >= len(roots) or not rel or rel.startswith(".."):
+            return ""
+        path = os.path.join(roots[int(index)], *rel.split("/"))
+        # links may point anywhere, e.g. to the artifact store, only serve the files they resolve to within a root
+        if _within(os.path.realpath(path), self.server.real_roots) is None:
+            return ""
+        return path
+
+    def list_directory(self, path):
+        self.send_error(404, "File not found")
+        return None
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LocalMediaServer:
+    """
+    A tiny static file server over local directories, so that an OpenAI-compatible server
+    on the same machine can fetch images by url instead of receiving them inlined as base64.
+    Only the files within the served directories are reachable, whatever links point to.
+    """
+
+    def __init__(self, roots: list[str], host: str = "127.0.0.1", port: int = 0):
+        """
+        Start the server in a daemon thread.
+
+        Args:
+            roots (list[str]): The directories to serve, e.g. the run directories and the artifact store
+                their images are linked from; files outside them are not reachable.
+            host (str): The host to bind, localhost only by default.
+            port (int): The port to bind, 0 to pick a free port.
+        """
+        self.roots = [os.path.abspath(root) for root in roots]
+        self.real_roots = [os.path.realpath(root) for root in roots]
+        self.httpd = ThreadingHTTPServer((host, port), _MediaHandler)
+        self.httpd.media_roots = self.roots
+        self.httpd.real_roots = self.real_roots
+        self.host, self.port = self.httpd.server_address[:2]
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/"
+
+    def url_for(self, path: str) -> str | None:
+        """
+        Get the url of a file, None if it is not reachable: outside the served directories, or a link
+        resolving outside them. The path is matched unresolved, so links into the artifact store are served.
+        """
+        path = os.path.abspath(path)
+        index = _within(path, self.roots)
+        if index is None or _within(os.path.realpath(path), self.real_roots) is None:
+            return None
+        return f"{self.base_url}{index}/{quote(os.path.relpath(path, self.roots[index]))}"
+
+    def path_for(self, url: str) -> str | None:
+        """
+        Get the file path of a url served by this server, None if it is not.
+        """
+        if not url.startswith(self.base_url):
+            return None
+        index, _, rel = unquote(url.removeprefix(self.base_url)).partition("/")
+        if not index.isdigit() or int(index) >= len(self.roots):
+            return None
+        return os.path.join(self.roots[int(index)], rel)
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+_MEDIA_SERVERS: dict[tuple[str, ...], LocalMediaServer] = {}
+_MEDIA_SERVERS_LOCK = threading.Lock()
+
+
+def get_media_server(roots: list[str]) -> LocalMediaServer:
+    """
+    Get the media server of a list of directories, started on first use and shared by all LLMs.
+    """
+    key = tuple(os.path.abspath(root) for root in roots)
+    with _MEDIA_SERVERS_LOCK:
+        if key not in _MEDIA_SERVERS:
+            _MEDIA_SERVERS[key] = LocalMediaServer(list(key))
+        return _MEDIA_SERVERS[key]
+
+
+def image_url(
+    path: str,
+    transport: str = "base64",
+    max_size: int = None,
+    quality: int = None,
+    media_root: str | list[str] = None,
+) -> str:
+    """
+    Get the url an image is sent with.
+
+    With the `file` and `http` transports the server reads the original file itself, so resizing is left to it;
+    images outside the `media_root` directories fall back to base64.
+
+    Args:
+        path (str): The image file path.
+        transport (str): One of `base64`, `file` (file:// urls) and `http` (served by a LocalMediaServer).
+        max_size (int): The maximum length of the longer side for base64 payloads.
+        quality (int): The JPEG quality for base64 payloads.
+        media_root (str | list[str]): The directories served by the media server, `runs` by default.
+
+    Returns:
+        str: The image url.
+    """
+    assert transport in IMAGE_TRANSPORTS, f"Unknown image transport {transport}"
+    if transport == "file":
+        return Path(path).resolve().as_uri()
+    if transport == "http":
+        roots = [media_root] if isinstance(media_root, str) else media_root or [DEFAULT_MEDIA_ROOT]
+        url = get_media_server(roots).url_for(path)
+        if url is not None:
+            return url
+    return encode_image(path, max_size, quality)
+
+
+def resolve_local_url(url: str) -> str | None:
+    """
+    Get the local file path behind a file:// or media server url, None for other urls.
+    """
+    if url.startswith("file://"):
+        return unquote(urlparse(url).path)
+    for server in list(_MEDIA_SERVERS.values()):
+        path = server.path_for(url)
+        if path is not None:
+            return path
+    return None
@@ -0,0 +1,196 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from time import time
+
+from image_payload import resolve_local_url
+from utils import pexists
+
+
+def _digest_url(url: str) -> str:
+    """
+    Digest an image/file url by its content, so the same image keys the same entry whatever its transport is.
+    """
+    path = resolve_local_url(url)
+    if path is not None:
+        if pexists(path):
+            with open(path, "rb") as f:
+                return hashlib.sha256(f.read()).hexdigest()
+    return hashlib.sha256(url.encode()).hexdigest()
+
+
+def _normalize_messages(messages: list) -> list:
+    """
+    Replace inlined images and files in messages by their content digests.
+    """
+    normalized = []
+    for message in messages:
+        if isinstance(message, str) or not isinstance(message.get("content"), list):
+            normalized.append(message)
+            continue
+        parts = []
+        for part in message["content"]:
+            if part.get("type") == "image_url":
+                parts.append({"type": "image_url", "digest": _digest_url(part["image_url"]["url"])})
+            elif part.get("type") == "file":
+                parts.append({"type": "file", "digest": _digest_url(part["file"]["file_data"])})
+            else:
+                parts.append(part)
+        normalized.append({**message, "content": parts})
+    return normalized
+
+
+class ResponseCache:
+    """
+    A disk-backed, content-addressed cache of LLM responses.
+    Entries live in a single SQLite file in WAL mode, so it can be shared by multiple worker processes,
+    and the least recently used entries are evicted once the cache exceeds `max_bytes`.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 2 * 1024**3):
+        """
+        Initialize the ResponseCache.
+
+        Args:
+            path (str): The path of the SQLite database file.
+            max_bytes (int): The size budget of cached responses, in bytes.
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, "
+                "size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS responses_last_access ON responses(last_access)"
+            )
+            # the total size of the responses, kept by triggers so that puts do not sum the whole table
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS stats (id INTEGER PRIMARY KEY CHECK (id = 0), total_size INTEGER NOT NULL)"
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO stats (id, total_size) SELECT 0, COALESCE(SUM(size), 0) FROM responses"
+            )
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS responses_insert AFTER INSERT ON responses BEGIN "
+                "UPDATE stats SET total_size = total_size + new.size WHERE id = 0; END"
+            )
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS responses_update AFTER UPDATE OF size ON responses BEGIN "
+                "UPDATE stats SET total_size = total_size + new.size - old.size WHERE id = 0; END"
+            )
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS responses_delete AFTER DELETE ON responses BEGIN "
+                "UPDATE stats SET total_size = total_size - old.size WHERE id = 0; END"
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _connect(self) -> sqlite3.Connection:
+        """
+        Get the connection of the current thread, sqlite connections must not be shared across threads.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def make_key(self, model: str, messages: list, **params) -> str:
+        """
+        Make the cache key of a request, the digest of its content: byte-identical requests share
+        one entry, whichever process or task issues them. Unparsable responses are never cached
+        (see `LLM._post_process`), so resampling one does not replay it.
+
+        Args:
+            model (str): The model name.
+            messages (list): The messages of the request, including system message and history.
+            **params: The generation parameters.
+
+        Returns:
+            str: The cache key.
+        """
+        payload = json.dumps(
+            {"model": model, "messages": _normalize_messages(messages), "params": params},
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT response FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        conn.execute(
+            "UPDATE responses SET last_access = ? WHERE key = ?", (time(), key)
+        )
+        self.hits += 1
+        return row[0]
+
+    def put(self, key: str, response: str):
+        conn = self._connect()
+        # an upsert rather than INSERT OR REPLACE, whose implicit delete would not fire the delete trigger
+        conn.execute(
+            "INSERT INTO responses (key, response, size, last_access) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET response = excluded.response, size = excluded.size, "
+            "last_access = excluded.last_access",
+            (key, response, len(response.encode()), time()),
+        )
+        self.evict()
+
+    def evict(self):
+        """
+        Evict the least recently used entries until the cache fits in `max_bytes`.
+        """
+        conn = self._connect()
+        if self.total_size() <= self.max_bytes:
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            total = self.total_size()
+            while total > self.max_bytes:
+                rows = conn.execute(
+                    "SELECT key, size FROM responses ORDER BY last_access LIMIT 256"
+                ).fetchall()
+                if not rows:
+                    break
+                for key, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    total -= size
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def total_size(self) -> int:
+        """
+        Get the total size of the cached responses, in bytes.
+        """
+        return self._connect().execute("SELECT total_size FROM stats WHERE id = 0").fetchone()[0]
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def __repr__(self) -> str:
+        return f"ResponseCache(path={self.path}, hits={self.hits}, misses={self.misses})"
@@ -0,0 +1,326 @@
+import asyncio
+import random
+import threading
+from collections import deque
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from time import monotonic, sleep, time
+
+import openai
+
+from utils import print
+
+# outcomes of a request, see `classify_error`
+SUCCESS = "success"
+OVERLOADED = "overloaded"
+TRANSIENT = "transient"
+FATAL = "fatal"
+# the request was abandoned (e.g. its task was cancelled) before the backend answered
+CANCELLED = "cancelled"
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised when a request is refused because the circuit breaker of its backend is open.
+    """
+
+    def __init__(self, api_base: str, retry_after: float):
+        super().__init__(f"Circuit of backend {api_base} is open, retry in {retry_after:.1f}s")
+        self.api_base = api_base
+        self.retry_after = retry_after
+
+
+def classify_error(error: Exception) -> str:
+    """
+    Classify a failed request.
+
+    Args:
+        error (Exception): The exception raised by the request.
+
+    Returns:
+        str: `overloaded` for rate limits and overloaded servers (429, 503), `transient` for other
+        server errors, timeouts and connection errors, `fatal` for everything else (e.g. 400, 401, 404).
+    """
+    if isinstance(error, CircuitOpenError):
+        return TRANSIENT
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return TRANSIENT
+    if isinstance(error, openai.APIStatusError):
+        if error.status_code in (429, 503):
+            return OVERLOADED
+        if error.status_code >= 500 or error.status_code in (408, 409):
+            return TRANSIENT
+    return FATAL
+
+
+def retry_after(error: Exception) -> float | None:
+    """
+    Get the delay requested by the server through the `Retry-After` headers, in seconds.
+    """
+    if isinstance(error, CircuitOpenError):
+        return error.retry_after
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            value = headers["retry-after"]
+            try:
+                return float(value)
+            except ValueError:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time())
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+@dataclass
+class RetryPolicy:
+    """
+    Retry transient failures with jittered exponential backoff, failing fast on the others.
+
+    Args:
+        max_attempts (int): The maximum number of attempts of a request.
+        base_delay (float): The backoff of the first retry, in seconds.
+        max_delay (float): The maximum backoff, in seconds.
+        max_parse_retries (int): The number of times an unparsable response is resampled, without backoff.
+    """
+
+    max_attempts: int = 6
+    base_delay: float = 1.0
+    max_delay: float = 60.0
+    max_parse_retries: int = 2
+
+    def delay(self, attempt: int, error: Exception) -> float:
+        """
+        Get the delay before the next attempt, honoring `Retry-After` over the full-jitter backoff.
+        """
+        requested = retry_after(error)
+        if requested is not None:
+            return min(requested, self.max_delay) + random.uniform(0, self.base_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def should_retry(self, attempt: int, error: Exception) -> bool:
+        """
+        Whether to retry after the `attempt`-th attempt failed with `error`.
+        """
+        kind = classify_error(error)
+        if kind == FATAL or attempt + 1 >= self.max_attempts:
+            return False
+        print(f"[{kind}] attempt {attempt + 1}/{self.max_attempts} failed: {error}")
+        return True
+
+    def call(self, func, *args, **kwargs):
+        """
+        Call `func` under the policy.
+        """
+        for attempt in range(self.max_attempts):
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if not self.should_retry(attempt, e):
+                    raise
+                sleep(self.delay(attempt, e))
+
+    async def acall(self, func, *args, **kwargs):
+        """
+        Await the coroutine function `func` under the policy.
+        """
+        for attempt in range(self.max_attempts):
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                if not self.should_retry(attempt, e):
+                    raise
+                await asyncio.sleep(self.delay(attempt, e))
+
+
+class AIMDLimiter:
+    """
+    A concurrency limiter with additive increase / multiplicative decrease:
+    the limit grows by one after a window of successes and is cut when the backend reports overload,
+    so that a burst of rate limits throttles the clients instead of being retried in lockstep.
+    It is shared by threads and event loops, so it is built on a thread lock; coroutines wait on
+    futures of their own event loop, which `release` resolves thread-safely.
+    """
+
+    def __init__(
+        self,
+        max_limit: int = 8,
+        min_limit: int = 1,
+        decrease_factor: float = 0.5,
+    ):
+        """
+        Initialize the AIMDLimiter.
+
+        Args:
+            max_limit (int): The maximum (and initial) number of in-flight requests.
+            min_limit (int): The minimum number of in-flight requests.
+            decrease_factor (float): The factor the limit is multiplied by on overload.
+        """
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.decrease_factor = decrease_factor
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        self._waiters: deque[tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()
+
+    def _try_acquire(self) -> float | None:
+        if self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return monotonic()
+        return None
+
+    def acquire(self) -> float:
+        """
+        Wait for a slot.
+
+        Returns:
+            float: The token of the request, to pass to `release`.
+        """
+        with self._cond:
+            while (token := self._try_acquire()) is None:
+                self._cond.wait()
+            return token
+
+    async def aacquire(self) -> float:
+        """
+        Coroutine version of `acquire`.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._cond:
+                token = self._try_acquire()
+                if token is not None:
+                    return token
+                waiter = loop.create_future()
+                self._waiters.append((loop, waiter))
+            try:
+                await waiter
+            finally:
+                with self._cond:
+                    if (loop, waiter) in self._waiters:
+                        self._waiters.remove((loop, waiter))
+
+    @staticmethod
+    def _wake(waiter: asyncio.Future):
+        if not waiter.done():
+            waiter.set_result(None)
+
+    def release(self, token: float, outcome: str = SUCCESS):
+        """
+        Release a slot and adapt the limit to the outcome of the request.
+
+        Args:
+            token (float): The token returned by `acquire`.
+            outcome (str): `success`, `cancelled`, or the class of the error as returned by `classify_error`.
+        """
+        with self._cond:
+            self.in_flight -= 1
+            if outcome == SUCCESS:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            # requests sent before the last decrease were sent under the old limit, do not count them twice
+            elif outcome == OVERLOADED and token >= self._last_decrease:
+                self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                self._last_decrease = monotonic()
+                print(f"Backend overloaded, concurrency limit lowered to {int(self.limit)}")
+            self._cond.notify_all()
+            for loop, waiter in self._waiters:
+                try:
+                    loop.call_soon_threadsafe(self._wake, waiter)
+                except RuntimeError:
+                    # the event loop of the waiter is closed
+                    pass
+
+
+class CircuitBreaker:
+    """
+    Stop sending requests to a backend after consecutive failures.
+    The circuit opens for `reset_timeout` seconds, then lets a single probe through (half-open)
+    and closes again once a request succeeds.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        """
+        Initialize the CircuitBreaker.
+
+        Args:
+            failure_threshold (int): The number of consecutive failures opening the circuit.
+            reset_timeout (float): The time in seconds before a probe is let through an open circuit.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    @property
+    def retry_after(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_timeout - monotonic())
+
+    def available(self) -> bool:
+        """
+        Whether a request would be let through, without reserving the probe of a half-open circuit.
+        """
+        return self.opened_at is None or (self.retry_after == 0 and not self._probing)
+
+    def allow(self) -> bool:
+        """
+        Whether to send a request, reserving the probe if the circuit is half-open.
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self.retry_after > 0 or self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def cancel_probe(self):
+        """
+        Free the probe of a half-open circuit whose request was abandoned before the backend answered.
+        """
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> bool:
+        """
+        Record a failure of the backend.
+
+        Returns:
+            bool: Whether the circuit has just opened.
+        """
+        with self._lock:
+            self.failures += 1
+            was_open = self.opened_at is not None
+            if self._probing or self.failures >= self.failure_threshold:
+                self.opened_at = monotonic()
+            self._probing = False
+            return not was_open and self.opened_at is not None
+
+    def trip(self):
+        """
+        Open the circuit, e.g. after a failed health check.
+        """
+        with self._lock:
+            self.failures = max(self.failures, self.failure_threshold)
+            self.opened_at = monotonic()
+            self._probing = False
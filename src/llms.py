@@ -2,8 +2,11 @@ import asyncio
 import base64
 import os
 import re
-from dataclasses import asdict, dataclass
+import threading
+from copy import copy
+from dataclasses import asdict, dataclass, is_dataclass
 from math import ceil
+from time import sleep
 import json
 import jsonlines
 import requests
@@ -11,13 +14,27 @@ import tiktoken
 import yaml
 from FlagEmbedding import BGEM3FlagModel
 from jinja2 import Environment, Template
-from openai import OpenAI
+from openai import AsyncOpenAI, BadRequestError, OpenAI
 from PIL import Image
 from torch import Tensor, cosine_similarity
 from concurrent.futures import CancelledError
-
+from weakref import WeakKeyDictionary
+
+from image_payload import image_url
+from llm_cache import ResponseCache
+from llm_resilience import (
+    CANCELLED,
+    OVERLOADED,
+    SUCCESS,
+    TRANSIENT,
+    AIMDLimiter,
+    CircuitBreaker,
+    CircuitOpenError,
+    RetryPolicy,
+    classify_error,
+)
 from model_utils import get_text_embedding
-from utils import get_json_from_response, pexists, pjoin, print, tenacity
+from utils import JSONObjectStream, ResponseParseError, get_json_from_response, pexists, pjoin, print
 
 ENCODING = tiktoken.encoding_for_model("gpt-4o")
 
@@ -69,28 +86,248 @@ class OnlineClient:
         self,
         api_base: str = None,
         api_key: str = "None",
+        max_concurrency: int = 8,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30,
     ) -> None:
-        self.apiclient = OpenAI(base_url=api_base, api_key=api_key)
+        # retries are left to the RetryPolicy of the LLM, which knows which errors are worth retrying
+        self.apiclient = OpenAI(base_url=api_base, api_key=api_key, max_retries=0)
         assert (
             ("OPENAI_API_KEY" in os.environ) or (api_key != "None")
         ), "You should provide an OpenAI API key environment variable, even it's mocked"
         self.api_key = api_key
         self.api_base = api_base
+        self.max_concurrency = max_concurrency
+        self.limiter = AIMDLimiter(max_limit=max_concurrency)
+        self.breaker = CircuitBreaker(failure_threshold=failure_threshold, reset_timeout=reset_timeout)
+        # async clients are bound to the event loop they are used in
+        self._async_clients = WeakKeyDictionary()
+
+    def completion(self, model, messages, **params):
+        self._check_circuit()
+        token = None
+        outcome = CANCELLED
+        try:
+            token = self.limiter.acquire()
+            completion = self.apiclient.chat.completions.create(
+                model=model, messages=messages, **params
+            )
+            outcome = SUCCESS
+        except Exception as e:
+            outcome = classify_error(e)
+            raise
+        finally:
+            self._record(token, outcome)
+        response = completion.choices[0].message.content
+        return response
 
-    def completion(self, model, messages):
-        completion = self.apiclient.chat.completions.create(
-            model=model, messages=messages
-        )        
+    async def acompletion(self, model, messages, **params):
+        apiclient = self._get_async_client()
+        self._check_circuit()
+        # released whatever happens, including cancellation while waiting for a slot or the response,
+        # which would otherwise hold the probe of a half-open circuit forever
+        token = None
+        outcome = CANCELLED
+        try:
+            token = await self.limiter.aacquire()
+            completion = await apiclient.chat.completions.create(
+                model=model, messages=messages, **params
+            )
+            outcome = SUCCESS
+        except Exception as e:
+            outcome = classify_error(e)
+            raise
+        finally:
+            self._record(token, outcome)
         response = completion.choices[0].message.content
         return response
 
+    def stream_completion(self, model, messages, **params):
+        """
+        Stream the text chunks of a completion.
+        """
+        self._check_circuit()
+        token = None
+        outcome = CANCELLED
+        try:
+            token = self.limiter.acquire()
+            stream = self.apiclient.chat.completions.create(
+                model=model, messages=messages, stream=True, **params
+            )
+            for chunk in stream:
+                if len(chunk.choices) != 0 and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+            outcome = SUCCESS
+        except Exception as e:
+            outcome = classify_error(e)
+            raise
+        finally:
+            self._record(token, outcome)
+
+    def _check_circuit(self):
+        if not self.breaker.allow():
+            raise CircuitOpenError(self.api_base, self.breaker.retry_after)
+
+    def _record(self, token: float | None, outcome: str):
+        """
+        Feed the outcome of a request to the concurrency limiter and the circuit breaker.
+
+        Args:
+            token (float | None): The token of the limiter slot of the request, None if it did not get one.
+            outcome (str): `success`, `cancelled`, or the class of the error as returned by `classify_error`.
+        """
+        if token is not None:
+            self.limiter.release(token, outcome)
+        if outcome == CANCELLED:
+            # the backend did not answer, the probe of a half-open circuit is left to the next request
+            self.breaker.cancel_probe()
+        elif outcome in (OVERLOADED, TRANSIENT):
+            if self.breaker.record_failure():
+                print(f"Circuit of backend {self.api_base} opened after {self.breaker.failures} consecutive failures")
+        else:
+            # a client error (e.g. 400) still means the backend is up
+            self.breaker.record_success()
+
+    def _get_async_client(self):
+        """
+        Get the async client of the running event loop.
+        """
+        loop = asyncio.get_running_loop()
+        if loop not in self._async_clients:
+            self._async_clients[loop] = AsyncOpenAI(
+                base_url=self.api_base, api_key=self.api_key, max_retries=0
+            )
+        return self._async_clients[loop]
+
     def list_models(self):
         self.apiclient.models.list()
 
     def close(self):
         self.apiclient.close()
+        self._async_clients.clear()
+
 
 
+class BackendPool:
+    """
+    A pool of OpenAI-compatible servers (e.g. vLLM replicas) serving the same model.
+    Requests are routed to the replica with the least outstanding requests among those with a closed circuit,
+    replicas failing repeatedly are ejected by their circuit breaker and re-admitted once they pass a health check.
+    """
+
+    def __init__(
+        self,
+        api_bases: list[str],
+        api_key: str = "None",
+        max_concurrency: int = 8,
+        max_failures: int = 3,
+        health_check_interval: float = 30,
+    ) -> None:
+        """
+        Initialize the BackendPool.
+
+        Args:
+            api_bases (list[str]): The base URLs of the replicas.
+            api_key (str): The API key shared by the replicas.
+            max_concurrency (int): The maximum number of in-flight requests per replica.
+            max_failures (int): The number of consecutive failures after which a replica is ejected.
+            health_check_interval (float): The interval in seconds between health checks of ejected replicas.
+        """
+        self.clients = [
+            OnlineClient(
+                api_base=api_base,
+                api_key=api_key,
+                max_concurrency=max_concurrency,
+                failure_threshold=max_failures,
+                reset_timeout=health_check_interval,
+            )
+            for api_base in api_bases
+        ]
+        self.api_bases = api_bases
+        self.health_check_interval = health_check_interval
+        self.outstanding = {client: 0 for client in self.clients}
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._health_thread = threading.Thread(target=self._health_check_loop, daemon=True)
+        self._health_thread.start()
+
+    def _acquire(self) -> OnlineClient:
+        """
+        Pick the available replica with the least outstanding requests.
+        """
+        with self._lock:
+            candidates = [c for c in self.clients if c.breaker.available()]
+            if len(candidates) == 0:
+                # every replica is ejected, the one reopening first refuses with its retry delay
+                client = min(self.clients, key=lambda c: c.breaker.retry_after)
+            else:
+                client = min(
+                    candidates,
+                    key=lambda c: (self.outstanding[c] / c.limiter.limit, c.breaker.failures),
+                )
+            self.outstanding[client] += 1
+            return client
+
+    def _release(self, client: OnlineClient):
+        with self._lock:
+            self.outstanding[client] -= 1
+
+    def completion(self, model, messages, **params):
+        client = self._acquire()
+        try:
+            return client.completion(model, messages, **params)
+        finally:
+            self._release(client)
+
+    async def acompletion(self, model, messages, **params):
+        client = self._acquire()
+        try:
+            return await client.acompletion(model, messages, **params)
+        finally:
+            self._release(client)
+
+    def stream_completion(self, model, messages, **params):
+        client = self._acquire()
+        try:
+            yield from client.stream_completion(model, messages, **params)
+        finally:
+            self._release(client)
+
+    def health_check(self) -> int:
+        """
+        Probe every replica, ejecting unreachable ones and re-admitting recovered ones.
+
+        Returns:
+            int: The number of healthy replicas.
+        """
+        healthy = 0
+        for client in self.clients:
+            try:
+                client.list_models()
+            except Exception as e:
+                print(f"Health check of backend {client.api_base} failed: {e}")
+                client.breaker.trip()
+                continue
+            if client.breaker.is_open:
+                print(f"Re-admitting backend {client.api_base}")
+            client.breaker.record_success()
+            healthy += 1
+        return healthy
+
+    def _health_check_loop(self):
+        while not self._closed.wait(self.health_check_interval):
+            if any(client.breaker.is_open for client in self.clients):
+                self.health_check()
+
+    def list_models(self):
+        if self.health_check() == 0:
+            raise RuntimeError(f"No healthy backend in {self.api_bases}")
+
+    def close(self):
+        self._closed.set()
+        for client in self.clients:
+            client.close()
+
 
 class OfflineClient:
     """
@@ -107,13 +344,21 @@ class OfflineClient:
         self.gen_config = gen_config
         self.model = model
 
-    def completion(self, model, messages):
+    def completion(self, model, messages, **params):
+        # constrained decoding is not wired for the offline pipeline, the validators of the callers still apply
         try:
             completion = self.pipe(messages, gen_config=self.gen_config)
         except CancelledError:
             pass
         response = completion.text
         return response
+
+    async def acompletion(self, model, messages, **params):
+        # the offline pipeline is not safe to share across coroutines, run it in place
+        return self.completion(model, messages, **params)
+
+    def stream_completion(self, model, messages, **params):
+        yield self.completion(model, messages, **params)
     
     def list_models(self):
         print(self.model)
@@ -129,26 +374,47 @@ class LLM:
     def __init__(
         self,
         model: str = "gpt-4o-2024-08-06",
-        api_base: str = None,
+        api_base: str | list[str] = None,
         use_batch: bool = False,
         api_key: str = "None",
         print_message: bool = True,
         offline_inference: bool = False,
         vision_config: None = None,
-        gen_config: None = None
+        gen_config: None = None,
+        max_concurrency: int = 8,
+        cache: ResponseCache | str = None,
+        image_size: int = None,
+        image_quality: int = None,
+        image_transport: str = "base64",
+        media_root: str | list[str] = None,
+        retry_policy: RetryPolicy = None,
+        structured_output: bool = True,
     ) -> None:
         """
         Initialize the LLM.
 
         Args:
             model (str): The model name.
-            api_base (str): The base URL for the API.
+            api_base (str | list[str]): The base URL for the API, or the URLs of replicas to balance the load across.
             use_batch (bool): Whether to use OpenAI's Batch API, which is single thread only.
+            max_concurrency (int): The maximum number of in-flight requests of `acall` and `map`.
+            cache (ResponseCache | str): The response cache or the path of its database, None to disable caching.
+            image_size (int): The effective resolution of the model, larger images are downscaled before sending.
+            image_quality (int): The JPEG quality images are recompressed to, None to send the original bytes.
+            image_transport (str): How images are sent: inlined as `base64`, or as `file` / `http` urls for servers on the same machine.
+            media_root (str | list[str]): The directories served to the model server with the `http` transport, `runs` by default.
+            retry_policy (RetryPolicy): How failed requests and unparsable responses are retried.
+            structured_output (bool): Whether to send the `response_format` of calls, i.e. use constrained decoding.
         """
         self.offline = offline_inference
 
         if not self.offline:
-            self.client = OnlineClient(api_base=api_base, api_key=api_key)
+            if isinstance(api_base, list) and len(api_base) > 1:
+                self.client = BackendPool(api_bases=api_base, api_key=api_key, max_concurrency=max_concurrency)
+            else:
+                if isinstance(api_base, list):
+                    api_base = api_base[0]
+                self.client = OnlineClient(api_base=api_base, api_key=api_key, max_concurrency=max_concurrency)
             if use_batch:
                 from oaib import Auto
                 self.oai_batch = Auto(loglevel=0)
@@ -162,8 +428,16 @@ class LLM:
 
         self.model = model
         self.print_message = print_message
+        if isinstance(cache, str):
+            cache = ResponseCache(cache)
+        self.cache = cache
+        self.image_size = image_size
+        self.image_quality = image_quality
+        self.image_transport = image_transport
+        self.media_root = media_root
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.structured_output = structured_output
 
-    @tenacity
     def __call__(
         self,
         content: str,
@@ -175,6 +449,8 @@ class LLM:
         image_first: bool = False,
         return_json: bool = False,
         return_message: bool = False,
+        cache: bool = True,
+        response_format: dict = None,
     ) -> str | dict | list:
         """
         Call the language model with a prompt and optional files.
@@ -188,10 +464,213 @@ class LLM:
             delay_batch (bool): Whether to delay return of response.
             return_json (bool): Whether to return the response as JSON.
             return_message (bool): Whether to return the message.
+            cache (bool): Whether to use the response cache for this call.
+            response_format (dict): The OpenAI `response_format`, e.g. a JSON schema to constrain the output to.
+
+        Returns:
+            str | dict | list: The response from the model.
+        """
+        params = self._request_params(response_format)
+        for attempt in range(self.retry_policy.max_parse_retries + 1):
+            system, history_msg, message = self._prepare_messages(
+                content, images, files, system_message, history, image_first
+            )
+
+            if self._use_batch:
+                result = run_async(self._run_batch(system + history_msg + message, delay_batch, **params))
+                if delay_batch:
+                    return
+                try:
+                    response = result.to_dict()["result"][0]["choices"][0]["message"][
+                        "content"
+                    ]
+                except Exception as e:
+                    print("Failed to get response from batch")
+                    raise e
+                cache_key = None
+            else:
+                cache_key = self._cache_key(system + history_msg + message, cache, **params)
+                response = self.cache.get(cache_key) if cache_key is not None else None
+                if response is None:
+                    self._print_request(system, history_msg, message)
+                    response = self._complete(system + history_msg + message, params)
+                    self._print_response(response)
+
+            try:
+                return self._post_process(response, message, return_json, return_message, cache_key)
+            except ResponseParseError as e:
+                self._on_parse_error(e, attempt)
+
+    async def acall(
+        self,
+        content: str,
+        images: list[str] = None,
+        files: list[str] = None,
+        system_message: str = None,
+        history: list = None,
+        image_first: bool = False,
+        return_json: bool = False,
+        return_message: bool = False,
+        cache: bool = True,
+        response_format: dict = None,
+    ) -> str | dict | list:
+        """
+        Coroutine version of `__call__`, the number of concurrent requests is bounded by `max_concurrency`.
+
+        Args:
+            content (str): The prompt content.
+            images (list[str]): A list of image file paths.
+            files (list[str]): A list of file paths (PDF, etc.) to be processed.
+            system_message (str): The system message.
+            history (list): The conversation history.
+            return_json (bool): Whether to return the response as JSON.
+            return_message (bool): Whether to return the message.
+            cache (bool): Whether to use the response cache for this call.
+            response_format (dict): The OpenAI `response_format`, e.g. a JSON schema to constrain the output to.
 
         Returns:
             str | dict | list: The response from the model.
         """
+        assert not self._use_batch, "acall is not supported with the Batch API"
+        params = self._request_params(response_format)
+        for attempt in range(self.retry_policy.max_parse_retries + 1):
+            system, history_msg, message = self._prepare_messages(
+                content, images, files, system_message, history, image_first
+            )
+            cache_key = self._cache_key(system + history_msg + message, cache, **params)
+            response = self.cache.get(cache_key) if cache_key is not None else None
+            if response is None:
+                self._print_request(system, history_msg, message)
+                response = await self._acomplete(system + history_msg + message, params)
+                self._print_response(response)
+            try:
+                return self._post_process(response, message, return_json, return_message, cache_key)
+            except ResponseParseError as e:
+                self._on_parse_error(e, attempt)
+
+    def stream(
+        self,
+        content: str,
+        images: list[str] = None,
+        files: list[str] = None,
+        system_message: str = None,
+        history: list = None,
+        image_first: bool = False,
+        return_message: bool = False,
+        cache: bool = True,
+        response_format: dict = None,
+    ):
+        """
+        Call the language model and stream the members of the JSON object it responds with,
+        each member is yielded as soon as it is complete.
+
+        Args:
+            content (str): The prompt content.
+            images (list[str]): A list of image file paths.
+            files (list[str]): A list of file paths (PDF, etc.) to be processed.
+            system_message (str): The system message.
+            history (list): The conversation history.
+            return_message (bool): Whether to return the message.
+            cache (bool): Whether to use the response cache for this call.
+            response_format (dict): The OpenAI `response_format`, e.g. a JSON schema to constrain the output to.
+
+        Yields:
+            tuple[str, object]: The (key, value) members of the response object.
+
+        Returns:
+            dict | tuple[dict, list]: The parsed response (and the message), as the value of the generator.
+        """
+        assert not self._use_batch, "stream is not supported with the Batch API"
+        params = self._request_params(response_format)
+        system, history_msg, message = self._prepare_messages(
+            content, images, files, system_message, history, image_first
+        )
+        cache_key = self._cache_key(system + history_msg + message, cache, **params)
+        response = self.cache.get(cache_key) if cache_key is not None else None
+        if response is not None:
+            yield from JSONObjectStream().feed(response)
+        else:
+            self._print_request(system, history_msg, message)
+            response = yield from self._stream_complete(system + history_msg + message, params)
+            self._print_response(response)
+        return self._post_process(response, message, True, return_message, cache_key)
+
+    def _stream_complete(self, messages: list, params: dict):
+        """
+        Stream a request, retried under the retry policy as long as nothing has been yielded yet.
+
+        Returns:
+            str: The full response text, as the value of the generator.
+        """
+        for attempt in range(self.retry_policy.max_attempts):
+            parser = JSONObjectStream()
+            yielded = False
+            try:
+                for chunk in self.client.stream_completion(model=self.model, messages=messages, **params):
+                    for member in parser.feed(chunk):
+                        yielded = True
+                        yield member
+                return parser.buffer
+            except BadRequestError as e:
+                if yielded or not self._rejects_response_format(e, params):
+                    raise
+                self._disable_structured_output(e)
+                params = {}
+            except Exception as e:
+                if yielded or not self.retry_policy.should_retry(attempt, e):
+                    raise
+                sleep(self.retry_policy.delay(attempt, e))
+        raise RuntimeError(f"Failed to stream a response from {self.model}")
+
+    def map(
+        self,
+        prompts: list[str] | str,
+        images: list[list[str] | str] = None,
+        return_exceptions: bool = False,
+        **kwargs,
+    ) -> list:
+        """
+        Call the language model on a batch of prompts concurrently and wait for all responses.
+
+        Args:
+            prompts (list[str] | str): The prompts, a single prompt is shared by all images.
+            images (list[list[str] | str]): The images of each prompt.
+            return_exceptions (bool): Whether to return exceptions in place of failed responses instead of raising.
+            **kwargs: Additional arguments passed to `acall`.
+
+        Returns:
+            list: The responses in the same order as the prompts.
+        """
+        if isinstance(prompts, str):
+            assert images is not None, "images are required when a single prompt is given"
+            prompts = [prompts] * len(images)
+        if images is None:
+            images = [None] * len(prompts)
+        assert len(prompts) == len(images), "prompts and images must have the same length"
+
+        async def _gather():
+            return await asyncio.gather(
+                *[
+                    self.acall(prompt, images=image, **kwargs)
+                    for prompt, image in zip(prompts, images)
+                ],
+                return_exceptions=return_exceptions,
+            )
+
+        return run_async(_gather())
+
+    def _prepare_messages(
+        self,
+        content: str,
+        images: list[str] = None,
+        files: list[str] = None,
+        system_message: str = None,
+        history: list = None,
+        image_first: bool = False,
+    ):
+        """
+        Build the system, history and user messages of a request.
+        """
         if content.startswith("You are"):
             system_message, content = content.split("\n", 1)
         if history is None:
@@ -228,38 +707,94 @@ class LLM:
             system, message = self.format_message_with_files(content, images, file_contents, system_message)
         else:
             system, message = self.format_message(content, images, system_message, image_first=image_first)
-        
-        if self._use_batch:
-            result = run_async(self._run_batch(system + history + message, delay_batch))
-            if delay_batch:
-                return
-            try:
-                response = result.to_dict()["result"][0]["choices"][0]["message"][
-                    "content"
-                ]
-            except Exception as e:
-                print("Failed to get response from batch")
-                raise e
-        else:
-            # filter out base64 images and files
-            try:
-                message_to_print = json.dumps(message, ensure_ascii=False)
-                pattern = r'(data:(image|application)/[a-zA-Z]+;base64,)([A-Za-z0-9+/=]+)'
-                message_to_print = re.sub(pattern, r'\1<BASE64_DATA_REDACTED>', message_to_print)[:10000]
-            except Exception as e:
-                message_to_print = str(message)[:10000]
-            
-            if self.print_message:
-                print(f"sending messages to: {self.model}, message (truncated): {system + history + [message_to_print]}")
+        return system, history, message
 
-            response = self.client.completion(model=self.model, messages=system + history + message)
-            
-            if self.print_message:
-                print(f"response from {self.model}: {response}")
+    def _print_request(self, system: list, history: list, message: list):
+        if not self.print_message:
+            return
+        # filter out base64 images and files
+        try:
+            message_to_print = json.dumps(message, ensure_ascii=False)
+            pattern = r'(data:(image|application)/[a-zA-Z]+;base64,)([A-Za-z0-9+/=]+)'
+            message_to_print = re.sub(pattern, r'\1<BASE64_DATA_REDACTED>', message_to_print)[:10000]
+        except Exception as e:
+            message_to_print = str(message)[:10000]
+        print(f"sending messages to: {self.model}, message (truncated): {system + history + [message_to_print]}")
+
+    def _print_response(self, response: str):
+        if self.print_message:
+            print(f"response from {self.model}: {response}")
 
+    def _request_params(self, response_format: dict = None) -> dict:
+        """
+        Get the extra request parameters of a call.
+        """
+        if response_format is None or not self.structured_output:
+            return {}
+        return {"response_format": response_format}
+
+    def _complete(self, messages: list, params: dict) -> str:
+        """
+        Send a request under the retry policy, without `response_format` if the server does not support it.
+        """
+        try:
+            return self.retry_policy.call(self.client.completion, model=self.model, messages=messages, **params)
+        except BadRequestError as e:
+            if not self._rejects_response_format(e, params):
+                raise
+            self._disable_structured_output(e)
+        return self.retry_policy.call(self.client.completion, model=self.model, messages=messages)
+
+    async def _acomplete(self, messages: list, params: dict) -> str:
+        """
+        Coroutine version of `_complete`.
+        """
+        try:
+            return await self.retry_policy.acall(self.client.acompletion, model=self.model, messages=messages, **params)
+        except BadRequestError as e:
+            if not self._rejects_response_format(e, params):
+                raise
+            self._disable_structured_output(e)
+        return await self.retry_policy.acall(self.client.acompletion, model=self.model, messages=messages)
+
+    @staticmethod
+    def _rejects_response_format(error: BadRequestError, params: dict) -> bool:
+        message = str(error).lower()
+        return "response_format" in params and any(
+            keyword in message for keyword in ("response_format", "json_schema", "guided")
+        )
+
+    def _disable_structured_output(self, error: Exception):
+        print(f"{self.model} rejected the response format, falling back to unconstrained decoding: {error}")
+        self.structured_output = False
+
+    def _on_parse_error(self, error: ResponseParseError, attempt: int):
+        """
+        Resample an unparsable response right away, a server error backoff would not help here.
+        """
+        if attempt >= self.retry_policy.max_parse_retries:
+            raise error
+        print(f"Resampling unparsable response from {self.model} ({attempt + 1}/{self.retry_policy.max_parse_retries}): {error}")
+
+    def _cache_key(self, messages: list, cache: bool = True, **params) -> str | None:
+        """
+        Get the response cache key of a request, None if the cache is disabled.
+        """
+        if self.cache is None or not cache:
+            return None
+        if self.offline and self.client.gen_config is not None:
+            # the sampling parameters of offline inference are set on the pipeline rather than sent with requests
+            gen_config = self.client.gen_config
+            params = {**params, "gen_config": asdict(gen_config) if is_dataclass(gen_config) else gen_config}
+        return self.cache.make_key(self.model, messages, **params)
+
+    def _post_process(self, response: str, message: list, return_json: bool, return_message: bool, cache_key: str = None):
         message.append({"role": "assistant", "content": response})
         if return_json:
             response = get_json_from_response(response)
+        # only cache the responses that could be parsed
+        if cache_key is not None:
+            self.cache.put(cache_key, message[-1]["content"])
         if return_message:
             response = (response, message)
         return response
@@ -279,11 +814,12 @@ class LLM:
             import pdb; pdb.set_trace()
             return False
 
-    async def _run_batch(self, messages: list, delay_batch: bool = False):
+    async def _run_batch(self, messages: list, delay_batch: bool = False, **params):
         await self.oai_batch.add(
             "chat.completions.create",
             model=self.model,
             messages=messages,
+            **params,
         )
         if delay_batch:
             return
@@ -312,15 +848,7 @@ class LLM:
             if not isinstance(images, list):
                 images = [images]
             for image in images:
-                with open(image, "rb") as f:
-                    image_parts.append(
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64.b64encode(f.read()).decode('utf-8')}"
-                            },
-                        }
-                    )
+                image_parts.append(self._image_part(image))
         
         if image_first:
             user_content = image_parts + [text_part]
@@ -331,6 +859,23 @@ class LLM:
 
         return system, message
 
+    def _image_part(self, image: str) -> dict:
+        """
+        Build the message part of an image, sent with the transport of the model.
+        """
+        return {
+            "type": "image_url",
+            "image_url": {
+                "url": image_url(
+                    image,
+                    self.image_transport,
+                    self.image_size,
+                    self.image_quality,
+                    self.media_root,
+                )
+            },
+        }
+
     def format_message_with_files(
         self,
         content: str,
@@ -358,15 +903,7 @@ class LLM:
             if not isinstance(images, list):
                 images = [images]
             for image in images:
-                with open(image, "rb") as f:
-                    message[0]["content"].append(
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64.b64encode(f.read()).decode('utf-8')}"
-                            },
-                        }
-                    )
+                message[0]["content"].append(self._image_part(image))
         
         # Add other file contents if provided
         if file_contents is not None:
@@ -425,6 +962,31 @@ class Turn:
         return self is other
 
 
+_MISSING = object()
+
+
+def fill_schema(schema, schema_args: dict):
+    """
+    Substitute the `$name` placeholders of a JSON schema, e.g. `enum: $layouts`.
+    Keywords whose placeholder is not given are dropped, so a schema only constrains what is known at call time.
+
+    Args:
+        schema: The JSON schema, or a part of it.
+        schema_args (dict): The values of the placeholders.
+
+    Returns:
+        The filled schema.
+    """
+    if isinstance(schema, str) and schema.startswith("$"):
+        return schema_args.get(schema[1:], _MISSING)
+    if isinstance(schema, dict):
+        filled = {k: fill_schema(v, schema_args) for k, v in schema.items()}
+        return {k: v for k, v in filled.items() if v is not _MISSING}
+    if isinstance(schema, list):
+        return [v for v in (fill_schema(v, schema_args) for v in schema) if v is not _MISSING]
+    return schema
+
+
 class Role:
     """
     An agent, defined by its instruction template and model.
@@ -461,6 +1023,9 @@ class Role:
         self.record_cost = record_cost
         self.text_model = text_model
         self.return_json = config["return_json"]
+        # optional JSON schema the output is constrained to, see `fill_schema` for its placeholders
+        self.json_schema = config.get("json_schema", None)
+        self._response_format = None
         self.system_message = config["system_prompt"]
         self.prompt_args = set(config["jinja_args"])
         self.template = env.from_string(config["template"])
@@ -521,6 +1086,27 @@ class Role:
             for turn in self.history:
                 writer.write(turn.to_dict())
 
+    def fork(self) -> "Role":
+        """
+        Copy the role with an empty history, so that independent tasks (e.g. slides) can call it concurrently.
+        """
+        role = copy(self)
+        role.history = []
+        role.input_tokens = 0
+        role.output_tokens = 0
+        role._response_format = None
+        return role
+
+    def merge(self, other: "Role"):
+        """
+        Append the history and cost of a forked role.
+        """
+        for turn in other.history:
+            turn.id = len(self.history)
+            self.history.append(turn)
+        self.input_tokens += other.input_tokens
+        self.output_tokens += other.output_tokens
+
     def retry(self, feedback: str, traceback: str, error_idx: int):
         """
         Retry a failed turn with feedback and traceback.
@@ -530,11 +1116,14 @@ class Role:
         history = []
         for turn in self.history[-error_idx:]:
             history.extend(turn.message)
-        response, message = self.llm(
+        _, message = self.llm(
             prompt,
             history=history,
+            return_json=self.return_json,
             return_message=True,
+            response_format=self._response_format,
         )
+        response = message[-1]["content"]
         turn = Turn(
             id=len(self.history),
             prompt=prompt,
@@ -543,6 +1132,22 @@ class Role:
         )
         return self.__post_process__(response, self.history[-error_idx:], turn)
 
+    def get_response_format(self, schema_args: dict = None) -> dict | None:
+        """
+        Get the `response_format` constraining the output to the role's JSON schema, None if it has none.
+        """
+        if self.json_schema is None:
+            return None
+        return {
+            "type": "json_schema",
+            "json_schema": {
+                "name": self.name,
+                "schema": fill_schema(self.json_schema, schema_args or {}),
+                # the schemas map free-form slide titles to objects, which strict mode cannot express
+                "strict": False,
+            },
+        }
+
     def __repr__(self) -> str:
         return f"Role(name={self.name}, model={self.model})"
 
@@ -551,6 +1156,7 @@ class Role:
         images: list[str] = None,
         recent: int = 0,
         similar: int = 0,
+        schema_args: dict = None,
         **jinja_args,
     ):
         """
@@ -560,31 +1166,70 @@ class Role:
             images (list[str]): A list of image file paths.
             recent (int): The number of recent turns to include.
             similar (int): The number of similar turns to include.
+            schema_args (dict): The values of the placeholders of the role's JSON schema.
             **jinja_args: Additional arguments for the Jinja2 template.
 
         Returns:
             The response from the role.
         """
-        if isinstance(images, str):
-            images = [images]
-        assert self.prompt_args == set(jinja_args.keys()), "Invalid arguments"
-        prompt = self.template.render(**jinja_args)
-        history = self.get_history(similar, recent, prompt)
-        history_msg = []
-        for turn in history:
-            history_msg.extend(turn.message)
-            
-        # print(f"prompt: {prompt}")
-        # print(f"system_message: {self.system_message}")
-        # print(f"history_msg: {history_msg}")
+        images, prompt, history, history_msg = self._prepare_prompt(images, recent, similar, jinja_args)
+        self._response_format = self.get_response_format(schema_args)
+        # parsed by the LLM too, so that an unparsable response is resampled rather than cached
+        _, message = self.llm(
+            prompt,
+            system_message=self.system_message,
+            history=history_msg,
+            images=images,
+            return_json=self.return_json,
+            return_message=True,
+            response_format=self._response_format,
+        )
+        response = message[-1]["content"]
+        turn = Turn(
+            id=len(self.history),
+            prompt=prompt,
+            response=response,
+            message=message,
+            images=images,
+        )
+        return self.__post_process__(response, history, turn, similar)
 
-        response, message = self.llm(
+    def stream(
+        self,
+        images: list[str] = None,
+        recent: int = 0,
+        similar: int = 0,
+        schema_args: dict = None,
+        **jinja_args,
+    ):
+        """
+        Streaming version of `__call__` for roles responding with a JSON object.
+
+        Args:
+            images (list[str]): A list of image file paths.
+            recent (int): The number of recent turns to include.
+            similar (int): The number of similar turns to include.
+            schema_args (dict): The values of the placeholders of the role's JSON schema.
+            **jinja_args: Additional arguments for the Jinja2 template.
+
+        Yields:
+            tuple[str, object]: The (key, value) members of the response, as soon as each is complete.
+
+        Returns:
+            The response from the role, as the value of the generator.
+        """
+        assert self.return_json, f"Role {self.name} does not respond with JSON"
+        images, prompt, history, history_msg = self._prepare_prompt(images, recent, similar, jinja_args)
+        self._response_format = self.get_response_format(schema_args)
+        _, message = yield from self.llm.stream(
             prompt,
             system_message=self.system_message,
             history=history_msg,
             images=images,
             return_message=True,
+            response_format=self._response_format,
         )
+        response = message[-1]["content"]
         turn = Turn(
             id=len(self.history),
             prompt=prompt,
@@ -594,6 +1239,20 @@ class Role:
         )
         return self.__post_process__(response, history, turn, similar)
 
+    def _prepare_prompt(self, images: list[str], recent: int, similar: int, jinja_args: dict):
+        """
+        Render the prompt and gather the history of a call.
+        """
+        if isinstance(images, str):
+            images = [images]
+        assert self.prompt_args == set(jinja_args.keys()), "Invalid arguments"
+        prompt = self.template.render(**jinja_args)
+        history = self.get_history(similar, recent, prompt)
+        history_msg = []
+        for turn in history:
+            history_msg.extend(turn.message)
+        return images, prompt, history, history_msg
+
     def __post_process__(
         self, response: str, history: list[Turn], turn: Turn, similar: int = 0
     ):
@@ -624,6 +1283,34 @@ def get_model_names(llms):
         return "+".join(llm.model for llm in llms)
 
 
+def connect_api_servers(server_urls: list[str] | str, api_key: str = "dummy-key", **kwargs) -> LLM:
+    """
+    Create an LLM served by one or more OpenAI-compatible API servers (e.g. vllm or lmdeploy),
+    using the model served by the first reachable server.
+
+    Args:
+        server_urls (list[str] | str): The server URLs, without the `/v1` suffix.
+        api_key (str): The API key of the servers.
+        **kwargs: Additional arguments passed to LLM.
+
+    Returns:
+        LLM: The LLM balancing requests across the servers.
+    """
+    if isinstance(server_urls, str):
+        server_urls = [server_urls]
+    api_bases = [f"{url.rstrip('/')}/v1" for url in server_urls]
+    model_name = None
+    for api_base in api_bases:
+        try:
+            model_name = OpenAI(api_key=api_key, base_url=api_base).models.list().data[0].id
+            break
+        except Exception as e:
+            print(f"Failed to list models of {api_base}: {e}")
+    if model_name is None:
+        raise RuntimeError(f"None of the API servers {server_urls} is reachable")
+    return LLM(model=model_name, api_base=api_bases, api_key=api_key, **kwargs)
+
+
 # Set up your fallback logic: if you have multiple possible LLMs, handle that in code below
 def setup_models(language_model, vision_model):
     """
@@ -0,0 +1,315 @@
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable
+
+import numpy as np
+
+# the url of the model daemon, e.g. http://127.0.0.1:8765; the models are loaded in-process when unset
+DAEMON_ENV = "SLIDETAILOR_MODEL_DAEMON"
+
+
+class ModelDaemonError(RuntimeError):
+    """
+    Raised when a request to the model daemon fails.
+    """
+
+
+class ModelDaemonClient:
+    """
+    A client of the model daemon, see `ModelDaemon`.
+    """
+
+    def __init__(self, url: str, timeout: float = 1800):
+        """
+        Initialize the ModelDaemonClient.
+
+        Args:
+            url (str): The base url of the daemon.
+            timeout (float): The timeout of a request in seconds, PDF parsing may take minutes.
+        """
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def _post(self, endpoint: str, payload: dict) -> dict:
+        request = urllib.request.Request(
+            f"{self.url}/{endpoint}",
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            raise ModelDaemonError(f"{endpoint} failed: {e.read().decode('utf-8', 'replace')}") from e
+        except urllib.error.URLError as e:
+            raise ModelDaemonError(f"Model daemon at {self.url} is unreachable: {e.reason}") from e
+
+    def parse_pdf(self, pdf_path: str, parsed_pdf_dir: str) -> str:
+        """
+        Parse a PDF file with marker, extracting its text, images, tables and equations into `parsed_pdf_dir`.
+        The daemon runs on the same machine, so the paths are sent as absolute paths.
+        """
+        os.makedirs(parsed_pdf_dir, exist_ok=True)
+        payload = {"pdf_path": os.path.abspath(pdf_path), "parsed_pdf_dir": os.path.abspath(parsed_pdf_dir)}
+        return self._post("parse_pdf", payload)["text"]
+
+    def embed_text(self, texts: list[str]) -> list[list[float]]:
+        return self._post("embed_text", {"texts": texts})["embeddings"]
+
+    def embed_image(self, image_paths: list[str]) -> list[list[float]]:
+        paths = [os.path.abspath(path) for path in image_paths]
+        return self._post("embed_image", {"paths": paths})["embeddings"]
+
+    def health(self) -> dict:
+        with urllib.request.urlopen(f"{self.url}/health", timeout=10) as response:
+            return json.loads(response.read())
+
+
+_CLIENTS: dict[str, ModelDaemonClient] = {}
+
+
+def get_daemon_client() -> ModelDaemonClient | None:
+    """
+    Get the client of the model daemon configured by the `SLIDETAILOR_MODEL_DAEMON` environment variable, if any.
+    """
+    url = os.environ.get(DAEMON_ENV)
+    if not url:
+        return None
+    if url not in _CLIENTS:
+        _CLIENTS[url] = ModelDaemonClient(url)
+    return _CLIENTS[url]
+
+
+class RemoteTextModel:
+    """
+    A stand-in for BGEM3FlagModel embedding texts through the model daemon.
+    """
+
+    device = "cpu"
+
+    def __init__(self, client: ModelDaemonClient):
+        self.client = client
+
+    def encode(self, text: str | list[str], **kwargs) -> dict:
+        if isinstance(text, str):
+            return {"dense_vecs": np.array(self.client.embed_text([text])[0], dtype=np.float32)}
+        return {"dense_vecs": np.array(self.client.embed_text(list(text)), dtype=np.float32)}
+
+
+class RemoteImageModel:
+    """
+    A stand-in for the ViT image model embedding images through the model daemon, see `get_image_embedding`.
+    """
+
+    device = "cpu"
+
+    def __init__(self, client: ModelDaemonClient):
+        self.client = client
+
+    def embed(self, image_paths: list[str]) -> list:
+        import torch
+
+        return [torch.tensor(embedding) for embedding in self.client.embed_image(image_paths)]
+
+
+class Batcher:
+    """
+    Gather the requests of concurrent clients into batches, run by a single worker thread.
+    A batch is closed when it holds `max_batch_size` items or `batch_window` seconds after its first request.
+    """
+
+    def __init__(self, func: Callable[[list], list], max_batch_size: int = 64, batch_window: float = 0.01):
+        """
+        Initialize the Batcher and start its worker thread.
+
+        Args:
+            func (Callable): The function run on the concatenated items of a batch, returning one result per item.
+            max_batch_size (int): The maximum number of items of a batch, a larger request is a batch of its own.
+            batch_window (float): The time in seconds a batch waits for more requests.
+        """
+        self.func = func
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window
+        self._requests = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, items: list) -> list:
+        """
+        Run `func` on `items` as part of a batch, blocking until the results are ready.
+        """
+        future = Future()
+        self._requests.put((list(items), future))
+        return future.result()
+
+    def _run(self):
+        while True:
+            batch = [self._requests.get()]
+            size = len(batch[0][0])
+            deadline = time.monotonic() + self.batch_window
+            while size < self.max_batch_size:
+                try:
+                    items, future = self._requests.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                batch.append((items, future))
+                size += len(items)
+            try:
+                results = self.func([item for items, _ in batch for item in items])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for items, future in batch:
+                future.set_result(results[: len(items)])
+                results = results[len(items) :]
+
+
+class ModelDaemon:
+    """
+    A localhost HTTP server hosting the marker, BGE-M3 and ViT models once for all the worker processes
+    of a machine, batching the embedding requests of concurrent clients.
+
+    Endpoints (POST, JSON):
+        /parse_pdf: {"pdf_path", "parsed_pdf_dir"} -> {"text"}, parsed one PDF at a time.
+        /embed_text: {"texts"} -> {"embeddings"}.
+        /embed_image: {"paths"} -> {"embeddings"}.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8765,
+        device: str = "cuda:0",
+        max_batch_size: int = 64,
+        batch_window: float = 0.01,
+    ):
+        """
+        Initialize the ModelDaemon, the models are loaded on first use.
+
+        Args:
+            host (str): The host to bind, localhost only by default.
+            port (int): The port to bind.
+            device (str): The device of the models.
+            max_batch_size (int): The maximum number of texts or images embedded at once.
+            batch_window (float): The time in seconds a batch waits for more requests.
+        """
+        self.device = device
+        self.endpoints = {
+            "parse_pdf": Batcher(self._parse_pdf, max_batch_size=1, batch_window=0),
+            "embed_text": Batcher(self._embed_text, max_batch_size, batch_window),
+            "embed_image": Batcher(self._embed_image, max_batch_size, batch_window),
+        }
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.host, self.port = self.httpd.server_address[:2]
+
+    def _parse_pdf(self, requests: list[dict]) -> list[dict]:
+        from model_registry import MODEL_REGISTRY
+        from pdf_parsing import _parse_with_marker
+
+        request = requests[0]
+        os.makedirs(request["parsed_pdf_dir"], exist_ok=True)
+        with MODEL_REGISTRY.use("marker", self.device) as marker_model:
+            text = _parse_with_marker(request["pdf_path"], request["parsed_pdf_dir"], marker_model)
+        return [{"text": text}]
+
+    def _embed_text(self, texts: list[str]) -> list[list[float]]:
+        from model_registry import MODEL_REGISTRY
+
+        with MODEL_REGISTRY.use("text", self.device) as text_model:
+            return text_model.encode(texts, batch_size=len(texts))["dense_vecs"].tolist()
+
+    def _embed_image(self, paths: list[str]) -> list[list[float]]:
+        from model_registry import MODEL_REGISTRY
+        from model_utils import embed_images
+
+        with MODEL_REGISTRY.use("image", self.device) as (extractor, image_model):
+            embeddings = embed_images(paths, extractor, image_model, batchsize=len(paths))
+        return [embedding.float().cpu().tolist() for embedding in embeddings]
+
+    def handle(self, endpoint: str, payload: dict) -> dict:
+        if endpoint == "parse_pdf":
+            return self.endpoints["parse_pdf"].submit([payload])[0]
+        if endpoint == "embed_text":
+            return {"embeddings": self.endpoints["embed_text"].submit(payload["texts"])}
+        if endpoint == "embed_image":
+            return {"embeddings": self.endpoints["embed_image"].submit(payload["paths"])}
+        raise KeyError(endpoint)
+
+    def _make_handler(self):
+        daemon = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, status: int, body: dict):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path.strip("/") != "health":
+                    return self._reply(404, {"error": f"Unknown endpoint {self.path}"})
+                from model_registry import MODEL_REGISTRY
+
+                self._reply(200, {"status": "ok", "models": MODEL_REGISTRY.stats()})
+
+            def do_POST(self):
+                endpoint = self.path.strip("/")
+                if endpoint not in daemon.endpoints:
+                    return self._reply(404, {"error": f"Unknown endpoint {self.path}"})
+                try:
+                    payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                    self._reply(200, daemon.handle(endpoint, payload))
+                except Exception as e:
+                    print(f"[ERROR] {endpoint} failed: {e}")
+                    self._reply(500, {"error": str(e)})
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def serve_forever(self):
+        print(f"[INFO] Model daemon listening on {self.url}, set {DAEMON_ENV}={self.url} to use it")
+        self.httpd.serve_forever()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Host the local models (marker, BGE-M3, ViT) for all worker processes")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Host to bind, localhost only by default")
+    parser.add_argument("--port", type=int, default=8765, help="Port to bind")
+    parser.add_argument("--device", type=str, default="cuda:0", help="Device of the models")
+    parser.add_argument("--max_batch_size", type=int, default=64, help="Maximum number of texts or images embedded at once")
+    parser.add_argument("--batch_window", type=float, default=0.01,
+                        help="Time in seconds a batch waits for requests of other clients")
+    args = parser.parse_args()
+
+    # the daemon hosts the models itself
+    os.environ.pop(DAEMON_ENV, None)
+    daemon = ModelDaemon(args.host, args.port, args.device, args.max_batch_size, args.batch_window)
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        daemon.close()
+
+
+if __name__ == "__main__":
+    main()
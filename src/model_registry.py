@@ -0,0 +1,226 @@
+import gc
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable
+
+from utils import print
+
+
+def _load_marker(device: str):
+    import torch
+    from marker.models import create_model_dict
+
+    return create_model_dict(device=device, dtype=torch.float16)
+
+
+def _load_text(device: str):
+    from model_utils import get_text_model
+
+    return get_text_model(device=device)
+
+
+def _load_image(device: str):
+    from model_utils import get_image_model
+
+    return get_image_model(device=device)
+
+
+# loaders of the models shared by the pipeline, called with the device
+LOADERS: dict[str, Callable[[str], Any]] = {
+    "marker": _load_marker,
+    "text": _load_text,
+    "image": _load_image,
+}
+
+
+def model_nbytes(model: Any, _seen: set = None) -> int:
+    """
+    Estimate the memory held by a model from the size of its parameters and buffers,
+    walking through the containers and wrappers (e.g. BGEM3FlagModel.model) it is made of.
+    """
+    import torch
+
+    _seen = set() if _seen is None else _seen
+    if id(model) in _seen:
+        return 0
+    _seen.add(id(model))
+    if isinstance(model, torch.nn.Module):
+        tensors = list(model.parameters()) + list(model.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors)
+    if isinstance(model, dict):
+        return sum(model_nbytes(v, _seen) for v in model.values())
+    if isinstance(model, (list, tuple)):
+        return sum(model_nbytes(v, _seen) for v in model)
+    if hasattr(model, "model"):
+        return model_nbytes(model.model, _seen)
+    return 0
+
+
+def free_memory():
+    """
+    Release the memory of unloaded models, including the blocks cached by the torch CUDA allocator.
+    """
+    gc.collect()
+    try:
+        import torch
+    except ImportError:
+        return
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+class _Entry:
+    def __init__(self, model: Any, nbytes: int):
+        self.model = model
+        self.nbytes = nbytes
+        self.refs = 0
+
+
+class ModelRegistry:
+    """
+    A process-wide registry of the local models, loaded on first use and kept until unloaded,
+    so that the tasks run by a process share one instance of each model per device.
+
+    Models in use (see `use`) are reference counted; when a memory budget is set, loading a model
+    evicts the least recently used models that are not in use until the loaded ones fit in it.
+    """
+
+    def __init__(self, memory_budget: int = None, loaders: dict[str, Callable[[str], Any]] = None):
+        """
+        Initialize the ModelRegistry.
+
+        Args:
+            memory_budget (int): The memory in bytes the loaded models may hold, None for no limit.
+            loaders (dict[str, Callable]): The model loaders by name, called with the device.
+        """
+        self.memory_budget = memory_budget
+        self.loaders = dict(LOADERS if loaders is None else loaders)
+        self._entries: OrderedDict[tuple[str, str], _Entry] = OrderedDict()
+        self._lock = threading.RLock()
+        self._loading: dict[tuple[str, str], threading.Lock] = {}
+
+    @property
+    def loaded_bytes(self) -> int:
+        return sum(entry.nbytes for entry in self._entries.values())
+
+    def register(self, name: str, loader: Callable[[str], Any]):
+        """
+        Register the loader of a model, replacing the previous one.
+        """
+        self.loaders[name] = loader
+
+    def get(self, name: str, device: str = None) -> Any:
+        """
+        Get a model, loading it if it is not loaded yet.
+        The model is not reserved and may be evicted by a later load, use `use` to keep it loaded.
+
+        Args:
+            name (str): The name of the model, one of the registered loaders.
+            device (str): The device of the model.
+
+        Returns:
+            Any: The model as returned by its loader.
+        """
+        return self._load(name, device, reserve=False)
+
+    def acquire(self, name: str, device: str = None) -> Any:
+        """
+        Get a model and keep it loaded until the matching `release`.
+        """
+        return self._load(name, device, reserve=True)
+
+    def release(self, name: str, device: str = None):
+        with self._lock:
+            entry = self._entries.get((name, device))
+            if entry is not None and entry.refs > 0:
+                entry.refs -= 1
+                # models loaded while this one was in use may have been left over the budget
+                self._evict(keep=None)
+
+    @contextmanager
+    def use(self, name: str, device: str = None):
+        """
+        Use a model within a `with` block, during which it will not be evicted.
+        """
+        model = self.acquire(name, device)
+        try:
+            yield model
+        finally:
+            self.release(name, device)
+
+    def unload(self, name: str = None, device: str = None, force: bool = False) -> bool:
+        """
+        Unload a model, or every model when `name` is None.
+
+        Args:
+            name (str): The name of the model.
+            device (str): The device of the model, every device when None.
+            force (bool): Whether to unload models that are in use.
+
+        Returns:
+            bool: Whether some model was unloaded.
+        """
+        with self._lock:
+            keys = [
+                key
+                for key, entry in self._entries.items()
+                if (name is None or key[0] == name)
+                and (device is None or key[1] == device)
+                and (force or entry.refs == 0)
+            ]
+            for key in keys:
+                del self._entries[key]
+                print(f"[INFO] Unloaded model {key[0]} on {key[1]}")
+        if keys:
+            free_memory()
+        return bool(keys)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                f"{name}@{device}": {"bytes": entry.nbytes, "refs": entry.refs}
+                for (name, device), entry in self._entries.items()
+            }
+
+    def _load(self, name: str, device: str, reserve: bool) -> Any:
+        assert name in self.loaders, f"Unknown model {name}"
+        key = (name, device)
+        with self._lock:
+            loading = self._loading.setdefault(key, threading.Lock())
+        # loads of the same model wait for each other, loads of different models do not
+        with loading:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    entry.refs += reserve
+                    return entry.model
+            print(f"[INFO] Loading model {name} on {device}")
+            model = self.loaders[name](device)
+            entry = _Entry(model, model_nbytes(model))
+            entry.refs += reserve
+            with self._lock:
+                self._entries[key] = entry
+                self._evict(keep=key)
+            return model
+
+    def _evict(self, keep: tuple[str, str] | None):
+        if self.memory_budget is None:
+            return
+        evicted = False
+        for key in list(self._entries):
+            if self.loaded_bytes <= self.memory_budget:
+                break
+            if key == keep or self._entries[key].refs > 0:
+                continue
+            del self._entries[key]
+            evicted = True
+            print(f"[INFO] Evicted model {key[0]} on {key[1]} to fit the memory budget")
+        if evicted:
+            free_memory()
+        if self.loaded_bytes > self.memory_budget:
+            print(f"[WARNING] Loaded models exceed the memory budget of {self.memory_budget / 1024**3:.1f}GB")
+
+
+MODEL_REGISTRY = ModelRegistry()
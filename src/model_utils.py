@@ -11,15 +11,19 @@ from PIL import Image
 from torchvision.transforms.functional import InterpolationMode
 from transformers import AutoFeatureExtractor, AutoModel
 
+from model_daemon import RemoteImageModel, RemoteTextModel, get_daemon_client
 from presentation import Presentation, SlidePage
 from utils import is_image_path, pjoin
 
 device_count = torch.cuda.device_count()
 
+TEXT_MODEL_NAME = "BAAI/bge-m3"
+IMAGE_MODEL_NAME = "google/vit-base-patch16-224-in21k"
+
 
 def get_text_model(device: str = None) -> BGEM3FlagModel:
     """
-    Initialize and return a text model.
+    Initialize and return a text model, or a client of the model daemon if one is configured.
 
     Args:
         device (str): The device to run the model on.
@@ -27,8 +31,11 @@ def get_text_model(device: str = None) -> BGEM3FlagModel:
     Returns:
         BGEM3FlagModel: The initialized text model.
     """
+    client = get_daemon_client()
+    if client is not None:
+        return RemoteTextModel(client)
     return BGEM3FlagModel(
-        "BAAI/bge-m3",
+        TEXT_MODEL_NAME,
         use_fp16=True,
         device=device,
     )
@@ -36,7 +43,8 @@ def get_text_model(device: str = None) -> BGEM3FlagModel:
 
 def get_image_model(device: str = None):
     """
-    Initialize and return an image model and its feature extractor.
+    Initialize and return an image model and its feature extractor,
+    or a client of the model daemon (without extractor) if one is configured.
 
     Args:
         device (str): The device to run the model on.
@@ -44,7 +52,10 @@ def get_image_model(device: str = None):
     Returns:
         tuple: A tuple containing the feature extractor and the image model.
     """
-    model_base = "google/vit-base-patch16-224-in21k"
+    client = get_daemon_client()
+    if client is not None:
+        return None, RemoteImageModel(client)
+    model_base = IMAGE_MODEL_NAME
     return (
         AutoFeatureExtractor.from_pretrained(
             model_base,
@@ -86,20 +97,20 @@ def get_text_embedding(
     return result
 
 
-def get_image_embedding(
-    image_dir: str, extractor, model, batchsize: int = 16
-) -> dict[str, torch.Tensor]:
+def embed_images(
+    image_paths: list[str], extractor, model, batchsize: int = 16
+) -> list[torch.Tensor]:
     """
-    Generate image embeddings for images in a directory.
+    Generate image embeddings for a list of image files.
 
     Args:
-        image_dir (str): The directory containing images.
+        image_paths (list[str]): The image file paths.
         extractor: The feature extractor for images.
         model: The model used for generating embeddings.
         batchsize (int): The batch size for processing images.
 
     Returns:
-        dict: A dictionary mapping image filenames to their embeddings.
+        list: The flattened embeddings of the images, in order.
     """
     transform = T.Compose(
         [
@@ -110,17 +121,39 @@ def get_image_embedding(
         ]
     )
 
-    inputs = []
     embeddings = []
+    for i in range(0, len(image_paths), batchsize):
+        inputs = [
+            transform(Image.open(path).convert("RGB"))
+            for path in image_paths[i : i + batchsize]
+        ]
+        batch = {"pixel_values": torch.stack(inputs).to(model.device)}
+        embeddings.extend(model(**batch).last_hidden_state.detach())
+    return [embedding.flatten() for embedding in embeddings]
+
+
+def get_image_embedding(
+    image_dir: str, extractor, model, batchsize: int = 16
+) -> dict[str, torch.Tensor]:
+    """
+    Generate image embeddings for images in a directory.
+
+    Args:
+        image_dir (str): The directory containing images.
+        extractor: The feature extractor for images, None for a RemoteImageModel.
+        model: The model used for generating embeddings.
+        batchsize (int): The batch size for processing images.
+
+    Returns:
+        dict: A dictionary mapping image filenames to their embeddings.
+    """
     images = [i for i in sorted(os.listdir(image_dir)) if is_image_path(i)]
-    for file in images:
-        image = Image.open(pjoin(image_dir, file)).convert("RGB")
-        inputs.append(transform(image))
-        if len(inputs) % batchsize == 0 or file == images[-1]:
-            batch = {"pixel_values": torch.stack(inputs).to(model.device)}
-            embeddings.extend(model(**batch).last_hidden_state.detach())
-            inputs.clear()
-    return {image: embedding.flatten() for image, embedding in zip(images, embeddings)}
+    image_paths = [pjoin(image_dir, image) for image in images]
+    if isinstance(model, RemoteImageModel):
+        embeddings = model.embed(image_paths)
+    else:
+        embeddings = embed_images(image_paths, extractor, model, batchsize)
+    return dict(zip(images, embeddings))
 
 
 def images_cosine_similarity(embeddings: list[torch.Tensor]) -> torch.Tensor:
@@ -51,12 +51,17 @@ class ImageLabler:
         Generate captions for images in the presentation.
         """
         caption_prompt = open("prompts/caption.txt").read()
-        for image, stats in self.image_stats.items():
-            if "caption" not in stats:
-                stats["caption"] = self.vision_model(
-                    caption_prompt, pjoin(self.config.IMAGE_DIR, image)
-                )
-                print("captioned", image, ": ", stats["caption"])
+        uncaptioned = [
+            image for image, stats in self.image_stats.items() if "caption" not in stats
+        ]
+        if len(uncaptioned) != 0:
+            captions = self.vision_model.map(
+                caption_prompt,
+                images=[pjoin(self.config.IMAGE_DIR, image) for image in uncaptioned],
+            )
+            for image, caption in zip(uncaptioned, captions):
+                self.image_stats[image]["caption"] = caption
+                print("captioned", image, ": ", caption)
         json.dump(
             self.image_stats,
             open(self.stats_file, "w"),
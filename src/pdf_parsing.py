@@ -1,8 +1,8 @@
 import json
 import os
 import PIL.Image
+from collections import defaultdict
 
-from pdf2image import convert_from_path
 import re
 
 # put into functions
@@ -13,6 +13,8 @@ import re
 
 from utils import is_image_path, pjoin
 from doc_handling import refine_document
+from model_daemon import get_daemon_client
+from rasterize import ImageWriter, iter_pdf_pages
 
 
 A4_PAGE_WIDTH = 596
@@ -30,6 +32,9 @@ def parse_pdf(
     Returns:
         str: The full text extracted from the PDF.
     """
+    client = get_daemon_client()
+    if client is not None:
+        return client.parse_pdf(pdf_path, output_path)
     full_text, _, _ = parse_with_converter(pdf_path, output_path, marker_model)
     return full_text
 
@@ -41,9 +46,11 @@ def parsing_pdf_with_caption(
     language_model,
     caption=True,
     use_cache=True,
+    text_content: str = None,
 ) -> str:
     """
     Parse a PDF file and extract text and images with captions.
+    If `text_content` is given, the PDF has already been parsed into `parsed_pdf_dir` by `marker_parse_pdf`.
     """
     os.makedirs(parsed_pdf_dir, exist_ok=True)
     
@@ -58,17 +65,10 @@ def parsing_pdf_with_caption(
 
 
     if not os.path.exists(refined_doc_json_path) or not os.path.exists(text_content_path) or not use_cache:
-        print("[INFO] Parsing PDF ...")
-        # Get text content and document object in one call
-        text_content, document, _ = parse_with_converter(pdf_path, parsed_pdf_dir, marker_model)
-
-        # Extract tables as images using TableImageConverter, reusing the document
-        print("[INFO] Extracting tables & equations as images...")
-        table_converter = TableImageConverter(artifact_dict=marker_model)
-        equation_converter = EquationImageConverter(artifact_dict=marker_model)
-
-        table_results = table_converter(pdf_path, output_dir=parsed_pdf_dir, dpi=150, padding_px=5, document=document)
-        equation_results = equation_converter(pdf_path, output_dir=parsed_pdf_dir, dpi=150, padding_px=10, document=document)
+        if text_content is None and get_daemon_client() is not None:
+            text_content = get_daemon_client().parse_pdf(pdf_path, parsed_pdf_dir)
+        elif text_content is None:
+            text_content = _parse_with_marker(pdf_path, parsed_pdf_dir, marker_model)
         
         if not os.path.exists(caption_json_path):
             with open(CAPTION_PROMPT_PATH, "r", encoding="utf-8") as f:
@@ -76,25 +76,29 @@ def parsing_pdf_with_caption(
             images_info = {}
             
             # Process all image files in the directory (including regular images, tables, and equations)
+            img_paths, prompts = [], []
             for k in os.listdir(parsed_pdf_dir):
                 if is_image_path(k):
-                    img_path = pjoin(parsed_pdf_dir, k)
-                    try:
-                        # Use different prompt prefixes based on image type
-                        if "table_" in k:
-                            specialized_prompt = "This is a table extracted from a document. Briefly describe the content, structure, and purpose of this table. " + caption_prompt
-                            text_cap = vision_model(specialized_prompt, [img_path])
-                        elif "equation_" in k:
-                            specialized_prompt = "This is a mathematical equation extracted from a document. Briefly describe the meaning, components, and purpose of this equation. " + caption_prompt
-                            text_cap = vision_model(specialized_prompt, [img_path])
-                        else:  # regular images from the pdf
-                            text_cap = vision_model(caption_prompt, [img_path])
-                            
-                        with PIL.Image.open(img_path) as img:
-                            size = img.size
-                        images_info[img_path] = [text_cap, size]
-                    except Exception as e:
-                        print(f"[ERROR] Could not caption {k}: {str(e)}")
+                    # Use different prompt prefixes based on image type
+                    if "table_" in k:
+                        specialized_prompt = "This is a table extracted from a document. Briefly describe the content, structure, and purpose of this table. " + caption_prompt
+                    elif "equation_" in k:
+                        specialized_prompt = "This is a mathematical equation extracted from a document. Briefly describe the meaning, components, and purpose of this equation. " + caption_prompt
+                    else:  # regular images from the pdf
+                        specialized_prompt = caption_prompt
+                    img_paths.append(pjoin(parsed_pdf_dir, k))
+                    prompts.append(specialized_prompt)
+
+            text_caps = vision_model.map(
+                prompts, images=[[img_path] for img_path in img_paths], return_exceptions=True
+            )
+            for img_path, text_cap in zip(img_paths, text_caps):
+                if isinstance(text_cap, Exception):
+                    print(f"[ERROR] Could not caption {os.path.basename(img_path)}: {str(text_cap)}")
+                    continue
+                with PIL.Image.open(img_path) as img:
+                    size = img.size
+                images_info[img_path] = [text_cap, size]
             
             with open(caption_json_path, "w", encoding="utf-8") as f:
                 json.dump(images_info, f, ensure_ascii=False, indent=4)
@@ -124,6 +128,55 @@ def parsing_pdf_with_caption(
     return text_content_w_captions
 
 
+def _parse_with_marker(pdf_path: str, parsed_pdf_dir: str, marker_model: dict) -> str:
+    """
+    Parse a PDF file with marker, extracting its text, images, tables and equations into `parsed_pdf_dir`.
+    """
+    print("[INFO] Parsing PDF ...")
+    # Get text content and document object in one call
+    text_content, document, _ = parse_with_converter(pdf_path, parsed_pdf_dir, marker_model)
+
+    # Extract tables as images using TableImageConverter, reusing the document
+    print("[INFO] Extracting tables & equations as images...")
+    table_converter = TableImageConverter(artifact_dict=marker_model)
+    equation_converter = EquationImageConverter(artifact_dict=marker_model)
+
+    table_results = table_converter(pdf_path, output_dir=parsed_pdf_dir, dpi=150, padding_px=5, document=document)
+    equation_results = equation_converter(pdf_path, output_dir=parsed_pdf_dir, dpi=150, padding_px=10, document=document)
+    return text_content
+
+
+def is_parsed(parsed_pdf_dir: str) -> bool:
+    """
+    Whether `parsing_pdf_with_caption` has already parsed a PDF into `parsed_pdf_dir`, so marker is not needed.
+    """
+    return os.path.exists(pjoin(parsed_pdf_dir, "refined_doc.json")) and os.path.exists(pjoin(parsed_pdf_dir, "source.md"))
+
+
+def marker_parse_pdf(pdf_path: str, parsed_pdf_dir: str, device: str = "cuda:0") -> str:
+    """
+    Parse a PDF file with marker, using the marker models of the process-wide model registry,
+    or of the model daemon if one is configured.
+    Meant to run in a separate worker process (see `agentic_loop.stage_graph`), so marker does not hold
+    the GIL of the stages waiting on LLMs; the captions are added by `parsing_pdf_with_caption(text_content=...)`.
+
+    Args:
+        pdf_path (str): The path to the PDF file.
+        parsed_pdf_dir (str): The directory to save the extracted content.
+        device (str): The device of the marker models.
+
+    Returns:
+        str: The full text extracted from the PDF.
+    """
+    client = get_daemon_client()
+    if client is not None:
+        return client.parse_pdf(pdf_path, parsed_pdf_dir)
+    from model_registry import MODEL_REGISTRY
+    os.makedirs(parsed_pdf_dir, exist_ok=True)
+    with MODEL_REGISTRY.use("marker", device) as marker_model:
+        return _parse_with_marker(pdf_path, parsed_pdf_dir, marker_model)
+
+
 def add_captions_to_markdown(text_content, caption_json_path):
     """
     Enhances the markdown content by replacing image paths with their captions
@@ -328,65 +381,66 @@ class TableImageConverter:
             print("No table regions found with bounding boxes.")
             return {}
         
-        # Convert PDF pages to images
-        pdf_images = convert_from_path(pdf_path, dpi=dpi)
-        
+        # Render only the pages with tables, a few at a time, and save the crops in writer threads
         table_images = {}
+        regions_by_page = defaultdict(list)
         for idx, region in enumerate(table_regions):
-            page_idx = region['page_idx']
-            bbox = region['bbox']  # This is now normalized
-            block_id = region['block_id']
-            source = region.get('source', 'unknown')
-            
-            if page_idx >= len(pdf_images):
-                print(f"Skipping table on page {page_idx+1} - page out of range")
-                continue
-                
-            # Get page image
-            page_img = pdf_images[page_idx]
-            width, height = page_img.size
+            regions_by_page[region['page_idx']].append((idx, region))
+        rendered_pages = set()
+        with ImageWriter() as writer:
+            for page_num, page_img in iter_pdf_pages(pdf_path, dpi=dpi, pages=[p + 1 for p in regions_by_page]):
+                page_idx = page_num - 1
+                rendered_pages.add(page_idx)
+                for idx, region in regions_by_page[page_idx]:
+                    bbox = region['bbox']  # This is normalized
+                    block_id = region['block_id']
+                    source = region.get('source', 'unknown')
+                    width, height = page_img.size
             
-            x0, y0, x1, y1 = bbox
+                    x0, y0, x1, y1 = bbox
             
-            # Skip too small table regions (h or w is less than 5% of the page)
-            if x1 - x0 < 0.05 or y1 - y0 < 0.05:
-                print(f"Skipping too small table with region: {x0},{y0},{x1},{y1}")
-                continue
+                    # Skip too small table regions (h or w is less than 5% of the page)
+                    if x1 - x0 < 0.05 or y1 - y0 < 0.05:
+                        print(f"Skipping too small table with region: {x0},{y0},{x1},{y1}")
+                        continue
             
-            # Convert normalized coordinates to pixel coordinates directly
-            x0 = max(0, int(bbox[0] * width) - padding_px)
-            y0 = max(0, int(bbox[1] * height) - padding_px)
-            x1 = min(width, int(bbox[2] * width) + padding_px)
-            y1 = min(height, int(bbox[3] * height) + padding_px)
+                    # Convert normalized coordinates to pixel coordinates directly
+                    x0 = max(0, int(bbox[0] * width) - padding_px)
+                    y0 = max(0, int(bbox[1] * height) - padding_px)
+                    x1 = min(width, int(bbox[2] * width) + padding_px)
+                    y1 = min(height, int(bbox[3] * height) + padding_px)
             
-            # Skip invalid regions
-            if x0 >= x1 or y0 >= y1:
-                print(f"Skipping invalid table with region: {x0},{y0},{x1},{y1}")
-                continue
+                    # Skip invalid regions
+                    if x0 >= x1 or y0 >= y1:
+                        print(f"Skipping invalid table with region: {x0},{y0},{x1},{y1}")
+                        continue
                 
 
                 
-            # Crop the table region
-            try:
-                table_img = page_img.crop((x0, y0, x1, y1))
+                    # Crop the table region
+                    try:
+                        table_img = page_img.crop((x0, y0, x1, y1))
                 
-                # Validate this looks like a table - check for minimum size and content
-                img_width, img_height = table_img.size
+                        # Validate this looks like a table - check for minimum size and content
+                        img_width, img_height = table_img.size
                 
-                # Generate a filename for the table image indicating source
-                img_filename = f"_page_{page_idx+1}_Table_{idx+1}.png"
+                        # Generate a filename for the table image indicating source
+                        img_filename = f"_page_{page_idx+1}_Table_{idx+1}.png"
                 
-                # Save the image if output_dir is provided
-                if output_dir:
-                    os.makedirs(output_dir, exist_ok=True)
-                    img_path = os.path.join(output_dir, img_filename)
-                    table_img.save(img_path)
+                        # Save the image if output_dir is provided
+                        if output_dir:
+                            os.makedirs(output_dir, exist_ok=True)
+                            img_path = os.path.join(output_dir, img_filename)
+                            writer.save(table_img, img_path)
                 
-                # Add to the dictionary
-                table_images[img_filename] = table_img
-                print(f"Extracted table {idx+1} from page {page_idx+1} [{source}]: {x0},{y0} to {x1},{y1}")
-            except Exception as e:
-                print(f"Error extracting table region: {str(e)}")
+                        # Add to the dictionary
+                        table_images[img_filename] = table_img
+                        print(f"Extracted table {idx+1} from page {page_idx+1} [{source}]: {x0},{y0} to {x1},{y1}")
+                    except Exception as e:
+                        print(f"Error extracting table region: {str(e)}")
+        
+        for page_idx in sorted(regions_by_page.keys() - rendered_pages):
+            print(f"Skipping table on page {page_idx+1} - page out of range")
         
         return table_images
                 
@@ -532,70 +586,70 @@ class EquationImageConverter:
             print("No equation regions found with bounding boxes.")
             return {}
         
-        # Convert PDF pages to images
-        from pdf2image import convert_from_path
-        pdf_images = convert_from_path(pdf_path, dpi=dpi)
-        
+        # Render only the pages with equations, a few at a time, and save the crops in writer threads
         equation_images = {}
+        regions_by_page = defaultdict(list)
         for idx, region in enumerate(equation_regions):
-            page_idx = region['page_idx']
-            bbox = region['bbox']  # This is normalized
-            block_id = region['block_id']
-            source = region.get('source', 'unknown')
-            latex = region.get('latex', '')
+            regions_by_page[region['page_idx']].append((idx, region))
+        rendered_pages = set()
+        with ImageWriter() as writer:
+            for page_num, page_img in iter_pdf_pages(pdf_path, dpi=dpi, pages=[p + 1 for p in regions_by_page]):
+                page_idx = page_num - 1
+                rendered_pages.add(page_idx)
+                for idx, region in regions_by_page[page_idx]:
+                    bbox = region['bbox']  # This is normalized
+                    block_id = region['block_id']
+                    source = region.get('source', 'unknown')
+                    latex = region.get('latex', '')
+                    width, height = page_img.size
             
-            if page_idx >= len(pdf_images):
-                print(f"Skipping equation on page {page_idx+1} - page out of range")
-                continue
-                
-            # Get page image
-            page_img = pdf_images[page_idx]
-            width, height = page_img.size
+                    x0, y0, x1, y1 = bbox
             
-            x0, y0, x1, y1 = bbox
+                    # Skip too small equation regions (h or w is less than 1% of the page)
+                    # Equations are often smaller than tables, so we use a smaller threshold
+                    if x1 - x0 < 0.01 or y1 - y0 < 0.01:
+                        print(f"Skipping too small equation with region: {x0},{y0},{x1},{y1}")
+                        continue
             
-            # Skip too small equation regions (h or w is less than 1% of the page)
-            # Equations are often smaller than tables, so we use a smaller threshold
-            if x1 - x0 < 0.01 or y1 - y0 < 0.01:
-                print(f"Skipping too small equation with region: {x0},{y0},{x1},{y1}")
-                continue
+                    # Convert normalized coordinates to pixel coordinates directly
+                    x0 = max(0, int(bbox[0] * width) - padding_px)
+                    y0 = max(0, int(bbox[1] * height) - padding_px)
+                    x1 = min(width, int(bbox[2] * width) + padding_px)
+                    y1 = min(height, int(bbox[3] * height) + padding_px)
             
-            # Convert normalized coordinates to pixel coordinates directly
-            x0 = max(0, int(bbox[0] * width) - padding_px)
-            y0 = max(0, int(bbox[1] * height) - padding_px)
-            x1 = min(width, int(bbox[2] * width) + padding_px)
-            y1 = min(height, int(bbox[3] * height) + padding_px)
-            
-            # Skip invalid regions
-            if x0 >= x1 or y0 >= y1:
-                print(f"Skipping invalid equation with region: {x0},{y0},{x1},{y1}")
-                continue
+                    # Skip invalid regions
+                    if x0 >= x1 or y0 >= y1:
+                        print(f"Skipping invalid equation with region: {x0},{y0},{x1},{y1}")
+                        continue
                 
-            # Crop the equation region
-            try:
-                equation_img = page_img.crop((x0, y0, x1, y1))
+                    # Crop the equation region
+                    try:
+                        equation_img = page_img.crop((x0, y0, x1, y1))
                 
-                # Generate a filename for the equation image
-                img_filename = f"_page_{page_idx+1}_Equation_{idx+1}.png"
+                        # Generate a filename for the equation image
+                        img_filename = f"_page_{page_idx+1}_Equation_{idx+1}.png"
                 
-                # Save the image if output_dir is provided
-                if output_dir:
-                    import os
-                    os.makedirs(output_dir, exist_ok=True)
-                    img_path = os.path.join(output_dir, img_filename)
-                    equation_img.save(img_path)
+                        # Save the image if output_dir is provided
+                        if output_dir:
+                            import os
+                            os.makedirs(output_dir, exist_ok=True)
+                            img_path = os.path.join(output_dir, img_filename)
+                            writer.save(equation_img, img_path)
                     
-                    # Also save the LaTeX if available
-                    if save_latex and latex:
-                        latex_filename = os.path.join(output_dir, f"_page_{page_idx+1}_Equation_{idx+1}.tex")
-                        with open(latex_filename, 'w', encoding='utf-8') as f:
-                            f.write(latex)
+                            # Also save the LaTeX if available
+                            if save_latex and latex:
+                                latex_filename = os.path.join(output_dir, f"_page_{page_idx+1}_Equation_{idx+1}.tex")
+                                with open(latex_filename, 'w', encoding='utf-8') as f:
+                                    f.write(latex)
                 
-                # Add to the dictionary
-                equation_images[img_filename] = equation_img
-                print(f"Extracted equation {idx+1} from page {page_idx+1} [{source}]: {x0},{y0} to {x1},{y1}")
-            except Exception as e:
-                print(f"Error extracting equation region: {str(e)}")
+                        # Add to the dictionary
+                        equation_images[img_filename] = equation_img
+                        print(f"Extracted equation {idx+1} from page {page_idx+1} [{source}]: {x0},{y0} to {x1},{y1}")
+                    except Exception as e:
+                        print(f"Error extracting equation region: {str(e)}")
+        
+        for page_idx in sorted(regions_by_page.keys() - rendered_pages):
+            print(f"Skipping equation on page {page_idx+1} - page out of range")
         
         return equation_images
                 
@@ -1,7 +1,11 @@
+import hashlib
 import json
 import os
+import queue
+import threading
 import traceback
 from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor
 from copy import deepcopy
 from dataclasses import dataclass, field
 from datetime import datetime
@@ -39,6 +43,9 @@ class PPTGen(ABC):
         force_pages: bool = False,
         error_exit: bool = True,
         record_cost: bool = True,
+        stream_outline: bool = True,
+        parallel_slides: int = 1,
+        resume: bool = False,
         **kwargs,
     ):
         """
@@ -50,12 +57,21 @@ class PPTGen(ABC):
             force_pages (bool): Whether to force a specific number of pages.
             error_exit (bool): Whether to exit on error.
             record_cost (bool): Whether to record the cost of generation.
+            stream_outline (bool): Whether to generate slides while the layout outline is still streamed.
+            parallel_slides (int): The number of slides generated concurrently, 1 to generate them one by one.
+            resume (bool): Whether to resume an interrupted generation in the same run directory, reusing its outline
+                and replaying the checkpointed slides without LLM calls.
             **kwargs: Additional arguments.
         """
         self.text_model = text_model
         self.retry_times = retry_times
         self.force_pages = force_pages
         self.error_exit = error_exit
+        self.stream_outline = stream_outline
+        self.parallel_slides = parallel_slides
+        self.resume = resume
+        # python-pptx objects are not thread-safe
+        self._build_lock = threading.Lock()
         
         self.llm = language_model
         self.vision_model = vision_model
@@ -143,37 +159,62 @@ class PPTGen(ABC):
             )
         succ_flag = True
         code_executor = CodeExecutor(self.retry_times)
+        # slides generated while the outline was streamed, by (index, title)
+        streamed_slides = {}
+        pool = ThreadPoolExecutor(self.parallel_slides) if self.parallel_slides > 1 else None
         
-        # if presentation outline is given, use it
-        if presentation_outline:
-            print(f"generate_presentation with given outline: {presentation_outline}")
-            self.outline = presentation_outline
-        else:
-            if self.pref_guidelines:
-                # Use the two-stage outline generation process when preference guidelines are provided
-                self.outline = self._generate_outline_2_stage_with_guidelines(num_slides)
+        try:
+            outline_file = pjoin(self.config.RUN_DIR, "presentation_outline.json")
+            if not presentation_outline and self.resume and pexists(outline_file):
+                print(f"resuming generation with the outline of {outline_file}")
+                presentation_outline = json.load(open(outline_file))
+            # if presentation outline is given, use it
+            if presentation_outline:
+                print(f"generate_presentation with given outline: {presentation_outline}")
+                self.outline = presentation_outline
             else:
-                self.outline = self._generate_outline(num_slides)
-            
-        self.simple_outline = "\n".join(
-            [
-                f"Slide {slide_idx+1}: {slide_title}"
-                for slide_idx, slide_title in enumerate(self.outline)
-            ]
-        )
-        generated_slides = []
-        print(f"generating {num_slides} slides, with {len(self.outline)} outlines")
-        for slide_data in enumerate(self.outline.items()):
-            if self.force_pages and slide_data[0] == num_slides:
-                break
-            print(f"generating slide {slide_data[0]+1}...")
-            slide = self._generate_slide(slide_data, code_executor, self.config.RUN_DIR)
-            if slide is not None:
-                generated_slides.append(slide)
-                continue
-            if self.error_exit:
-                succ_flag = False
-                break
+                if self.pref_guidelines and self.stream_outline:
+                    self.outline, streamed_slides = self._generate_outline_streaming(num_slides, code_executor, pool)
+                elif self.pref_guidelines:
+                    # Use the two-stage outline generation process when preference guidelines are provided
+                    self.outline = self._generate_outline_2_stage_with_guidelines(num_slides)
+                else:
+                    self.outline = self._generate_outline(num_slides)
+                
+            self.simple_outline = self._make_simple_outline(self.outline)
+            print(f"generating {num_slides} slides, with {len(self.outline)} outlines")
+            # each entry is a generated slide, a future of a slide generated by the pool,
+            # or the slide data of a slide left to generate in order
+            pending = []
+            for slide_data in enumerate(self.outline.items()):
+                if self.force_pages and slide_data[0] == num_slides:
+                    break
+                slide_idx, (slide_title, slide) = slide_data
+                # reuse the slides generated from streamed entries that survived the outline validation
+                if (slide_idx, slide_title) in streamed_slides and streamed_slides[(slide_idx, slide_title)][0] == slide:
+                    pending.append(streamed_slides[(slide_idx, slide_title)][1])
+                elif pool is not None:
+                    print(f"generating slide {slide_idx+1}...")
+                    pending.append(pool.submit(self._generate_slide_isolated, slide_data))
+                else:
+                    pending.append(slide_data)
+
+            generated_slides = []
+            for item in pending:
+                if isinstance(item, tuple):
+                    print(f"generating slide {item[0]+1}...")
+                    slide = self._generate_slide(item, code_executor, self.config.RUN_DIR)
+                else:
+                    slide = self._collect_slide(item, code_executor)
+                if slide is not None:
+                    generated_slides.append(slide)
+                    continue
+                if self.error_exit:
+                    succ_flag = False
+                    break
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=True, cancel_futures=True)
         self._save_history(code_executor)
                 
         # cut off empty_prs.slides by num_slides
@@ -187,6 +228,40 @@ class PPTGen(ABC):
         else:
             return None, None
 
+    def _generate_slide_isolated(self, slide_data):
+        """
+        Generate a slide with its own code executor and forked roles, so that slides can be generated concurrently.
+
+        Returns:
+            tuple[SlidePage | None, CodeExecutor, dict[str, Role]]: The slide, and the state to merge with `_collect_slide`.
+        """
+        code_executor = CodeExecutor(self.retry_times)
+        staffs = {name: role.fork() for name, role in self.staffs.items()}
+        slide = self._generate_slide(slide_data, code_executor, self.config.RUN_DIR, staffs)
+        return slide, code_executor, staffs
+
+    def _collect_slide(self, result, code_executor: CodeExecutor) -> SlidePage | None:
+        """
+        Get a generated slide, merging the history of the slides generated concurrently in outline order.
+        """
+        if not isinstance(result, Future):
+            return result
+        slide, slide_executor, staffs = result.result()
+        code_executor.api_history.extend(slide_executor.api_history)
+        code_executor.command_history.extend(slide_executor.command_history)
+        code_executor.code_history.extend(slide_executor.code_history)
+        for name, role in staffs.items():
+            self.staffs[name].merge(role)
+        return slide
+
+    def _make_simple_outline(self, outline: dict) -> str:
+        return "\n".join(
+            [
+                f"Slide {slide_idx+1}: {slide_title}"
+                for slide_idx, slide_title in enumerate(outline)
+            ]
+        )
+
     def _save_history(self, code_executor: CodeExecutor):
         """
         Save the history of code execution, API calls and agent steps.
@@ -228,6 +303,7 @@ class PPTGen(ABC):
             json_content=doc_overview,
             image_information=self.image_information,
             pref_guidelines="None",
+            schema_args=self._outline_schema_args(num_slides),
         )
         outline = self._valid_outline(outline, num_slides)  # add num of slide validation
         json.dump(
@@ -265,6 +341,7 @@ class PPTGen(ABC):
             summarized_doc_content=doc_overview,
             image_information=self.image_information,
             pref_guidelines=self.pref_guidelines,
+            schema_args=self._outline_schema_args(num_slides),
         )
         outline = self._valid_outline(outline, num_slides)  # add num of slide validation
         json.dump(
@@ -289,10 +366,98 @@ class PPTGen(ABC):
         Returns:
             dict: The final presentation outline with optimized content and layouts.
         """
+        content_outline = self._generate_content_outline(num_slides)
         
+        print("Stage 2: Refining layout selections...")
+        # Stage 2: Refine layout selections using planner_layout
+        layout_outline = self.staffs["planner_layout"](
+            content_outline=content_outline,
+            functional_keys=str(self.layout_info),
+            schema_args=self._outline_schema_args(num_slides),
+        )
+        
+        return self._finish_layout_outline(layout_outline, num_slides)
+
+    def _generate_outline_streaming(
+        self, num_slides: int, code_executor: CodeExecutor, pool: ThreadPoolExecutor = None
+    ):
+        """
+        Generate the outline with the 2-stage approach, streaming the layout outline of stage 2
+        and generating each slide as soon as its entry is complete.
+
+        Args:
+            num_slides (int): The number of slides to generate.
+            code_executor (CodeExecutor): The code executor object.
+            pool (ThreadPoolExecutor): The pool to generate slides concurrently with, None to generate them in turn.
+
+        Returns:
+            tuple[dict, dict]: The validated outline, and the slides generated from streamed entries by (index, title),
+            as (streamed entry, generated slide or None if it failed, or its future with a pool).
+        """
+        content_outline = self._generate_content_outline(num_slides)
+        # the layout stage keeps the slide titles of the content outline, so the editor sees the final titles
+        self.simple_outline = self._make_simple_outline(content_outline)
+
+        print("Stage 2: Streaming layout selections...")
+        entries = queue.Queue()
+        planned = {}
+
+        def _plan_layouts():
+            try:
+                stream = self.staffs["planner_layout"].stream(
+                    content_outline=content_outline,
+                    functional_keys=str(self.layout_info),
+                    schema_args=self._outline_schema_args(num_slides),
+                )
+                while True:
+                    try:
+                        entries.put(next(stream))
+                    except StopIteration as stop:
+                        planned["outline"] = stop.value
+                        break
+            except Exception as e:
+                planned["error"] = e
+            finally:
+                entries.put(None)
+
+        planner = threading.Thread(target=_plan_layouts, daemon=True)
+        planner.start()
+        streamed_slides = {}
+        slide_idx = 0
+        while (entry := entries.get()) is not None:
+            slide_title, slide = entry
+            # invalid entries are left to the outline validation below
+            if (
+                not (self.force_pages and slide_idx >= num_slides)
+                and isinstance(slide, dict)
+                and slide.get("layout") in self.layout_keys
+            ):
+                print(f"generating slide {slide_idx+1} while the outline is streamed...")
+                slide_data = (slide_idx, (slide_title, deepcopy(slide)))
+                if pool is not None:
+                    slide_result = pool.submit(self._generate_slide_isolated, slide_data)
+                else:
+                    slide_result = self._generate_slide(slide_data, code_executor, self.config.RUN_DIR)
+                streamed_slides[(slide_idx, slide_title)] = (deepcopy(slide), slide_result)
+            slide_idx += 1
+        planner.join()
+
+        if "error" in planned:
+            print(f"Streaming the layout outline failed, falling back to a blocking call: {planned['error']}")
+            layout_outline = self.staffs["planner_layout"](
+                content_outline=content_outline,
+                functional_keys=str(self.layout_info),
+                schema_args=self._outline_schema_args(num_slides),
+            )
+        else:
+            layout_outline = planned["outline"]
+        return self._finish_layout_outline(layout_outline, num_slides), streamed_slides
+
+    def _generate_content_outline(self, num_slides: int) -> dict:
+        """
+        Stage 1 of the 2-stage approach: generate and save the content outline.
+        """
         content_outline_file = pjoin(self.config.RUN_DIR, "presentation_content_outline.json")
-        layout_outline_file = pjoin(self.config.RUN_DIR, "presentation_layout_outline.json")
-        presentation_outline_file = pjoin(self.config.RUN_DIR, "presentation_outline.json")
         
         doc_overview = deepcopy(self.doc_json)
         
@@ -307,6 +472,7 @@ class PPTGen(ABC):
             summarized_doc_content=doc_overview,
             image_information=self.image_information,
             pref_guidelines=self.pref_guidelines,
+            schema_args={"num_slides": num_slides},
         )
         
         # Validate content outline
@@ -319,13 +485,14 @@ class PPTGen(ABC):
             ensure_ascii=False,
             indent=4,
         )
-        
-        print("Stage 2: Refining layout selections...")
-        # Stage 2: Refine layout selections using planner_layout
-        layout_outline = self.staffs["planner_layout"](
-            content_outline=content_outline,
-            functional_keys=str(self.layout_info),
-        )
+        return content_outline
+
+    def _finish_layout_outline(self, layout_outline: dict, num_slides: int) -> dict:
+        """
+        Stage 2 of the 2-stage approach: validate and save the layout outline as the presentation outline.
+        """
+        layout_outline_file = pjoin(self.config.RUN_DIR, "presentation_layout_outline.json")
+        presentation_outline_file = pjoin(self.config.RUN_DIR, "presentation_outline.json")
         
         # Validate layout outline
         layout_outline = self._valid_layout_outline(layout_outline, num_slides)
@@ -347,9 +514,15 @@ class PPTGen(ABC):
             indent=4,
         )
         
-        
         return final_presentation_outline
     
+    def _outline_schema_args(self, num_slides: int) -> dict:
+        """
+        Get the placeholders of the outline schemas, constraining layouts to the available ones
+        and the number of slides to `num_slides`, so that the validators below rarely have to re-prompt.
+        """
+        return {"num_slides": num_slides, "layouts": self.layout_names}
+
     def _valid_content_outline(self, outline: dict, num_slides: int, retry: int = 0) -> dict:
         """
         Validate the content outline generated in Stage 1.
@@ -460,27 +633,34 @@ class PPTGen(ABC):
         }
 
 
-    def _generate_slide(self, slide_data, code_executor: CodeExecutor, run_dir=None) -> SlidePage:
+    def _generate_slide(
+        self, slide_data, code_executor: CodeExecutor, run_dir=None, staffs: dict[str, Role] = None
+    ) -> SlidePage:
         """
-        Generate a slide from the slide data.
+        Generate a slide from the slide data, with the given roles or the shared ones.
         """
         slide_idx, (slide_title, slide) = slide_data
         images_info = "No Images"
         
         # check if the layout is available
         if slide["layout"] not in self.slide_induction.keys():
-            print(f"layout {slide['layout']} not found, please check the outline")
-            import pdb; pdb.set_trace()
             # todo: regen ouline / validate outline
+            raise ValueError(f"layout {slide['layout']} not found, please check the outline")
         
         template = deepcopy(self.slide_induction[slide["layout"]])  
         
+        if self.resume:
+            replayed = self._replay_slide(slide_data, template, code_executor)
+            if replayed is not None:
+                return replayed
+        
         try:
             return self.synergize(
                 template,
                 slide_data,
                 code_executor,
                 images_info,
+                staffs or self.staffs,
             )
         except Exception as e:
             # import pdb; pdb.set_trace()
@@ -488,6 +668,69 @@ class PPTGen(ABC):
             print(traceback.format_exc())
             print(self.config.RUN_DIR)
 
+    def _checkpoint_path(self, slide_idx: int) -> str:
+        return pjoin(self.config.RUN_DIR, "slide_checkpoints", f"slide_{slide_idx + 1:03d}.json")
+
+    def _checkpoint_key(self, slide_data, template: dict) -> str:
+        """
+        Get the key of a slide checkpoint, a digest of the inputs of the editor and coder,
+        so that a checkpoint is only replayed for the same outline entry and layout.
+        """
+        slide_idx, (slide_title, slide) = slide_data
+        inputs = [slide_idx, slide_title, slide, template["template_id"], self.simple_outline]
+        return hashlib.sha256(json.dumps(inputs, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def _save_checkpoint(self, slide_data, template: dict, editor_output: dict, edit_actions: str):
+        """
+        Checkpoint a generated slide under `RUN_DIR/slide_checkpoints`, see `_replay_slide`.
+        The file is written atomically, so an interrupted run never leaves a partial checkpoint.
+        """
+        slide_idx, (slide_title, slide) = slide_data
+        checkpoint_file = self._checkpoint_path(slide_idx)
+        os.makedirs(os.path.dirname(checkpoint_file), exist_ok=True)
+        checkpoint = {
+            "key": self._checkpoint_key(slide_data, template),
+            "slide_idx": slide_idx,
+            "slide_title": slide_title,
+            "slide": slide,
+            "template_id": template["template_id"],
+            "editor_output": editor_output,
+            "edit_actions": edit_actions,
+        }
+        tmp_file = f"{checkpoint_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(checkpoint, f, ensure_ascii=False, indent=4)
+        os.replace(tmp_file, checkpoint_file)
+
+    def _replay_slide(self, slide_data, template: dict, code_executor: CodeExecutor) -> SlidePage | None:
+        """
+        Rebuild a slide from its checkpoint by replaying the edit actions of the coder, without LLM calls.
+
+        Returns:
+            SlidePage | None: The slide, None if it has no valid checkpoint or the replay failed.
+        """
+        slide_idx = slide_data[0]
+        checkpoint_file = self._checkpoint_path(slide_idx)
+        if not pexists(checkpoint_file):
+            return None
+        try:
+            checkpoint = json.load(open(checkpoint_file))
+        except json.JSONDecodeError:
+            print(f"checkpoint of slide {slide_idx+1} is corrupted, regenerating it")
+            return None
+        if checkpoint.get("key") != self._checkpoint_key(slide_data, template):
+            print(f"checkpoint of slide {slide_idx+1} does not match the outline, regenerating it")
+            return None
+        edited_slide: SlidePage = deepcopy(self.presentation.slides[template["template_id"] - 1])
+        feedback = code_executor.execute_actions(checkpoint["edit_actions"], edited_slide)
+        if feedback is not None:
+            print(f"replaying the checkpoint of slide {slide_idx+1} failed, regenerating it: {feedback[1]}")
+            return None
+        with self._build_lock:
+            self.empty_prs.build_slide(edited_slide)
+        print(f"slide {slide_idx+1} replayed from its checkpoint")
+        return edited_slide
+
 
 class PPTCrew(PPTGen):
     """
@@ -502,6 +745,7 @@ class PPTCrew(PPTGen):
         slide_content: str,
         code_executor: CodeExecutor,
         images_info: str,
+        staffs: dict[str, Role] = None,
     ) -> SlidePage:
         """
         Synergize Agents to generate a slide.
@@ -511,21 +755,24 @@ class PPTCrew(PPTGen):
             slide_content (str): The slide content.
             code_executor (CodeExecutor): The code executor object.
             images_info (str): The image information.
+            staffs (dict[str, Role]): The roles to use, the shared ones by default.
 
         Returns:
             SlidePage: The generated slide.
         """
+        staffs = staffs or self.staffs
         content_schema = template["content_schema"]
         old_data = self._prepare_schema(content_schema)
         
         # import pdb; pdb.set_trace()
         
-        editor_output = self.staffs["editor"](
+        editor_output = staffs["editor"](
             schema=content_schema,
             simple_outline=self.simple_outline,    
             metadata=self.metadata,     # 
             text=slide_content,     
             # images_info=images_info,
+            schema_args={"elements": list(old_data.keys())},
         )
         
         print(f"editor_output (editor): {editor_output}")
@@ -533,10 +780,11 @@ class PPTCrew(PPTGen):
         command_list = self._generate_commands(
             editor_output,
             content_schema,
-            old_data  
+            old_data,
+            staffs=staffs,
         ) 
 
-        edit_actions = self.staffs["coder"](
+        edit_actions = staffs["coder"](
             api_docs=code_executor.get_apis_docs(API_TYPES.Agent.value),
             edit_target=self.presentation.slides[template["template_id"] - 1].to_html(),
             command_list="\n".join([str(i) for i in command_list]),
@@ -555,8 +803,10 @@ class PPTCrew(PPTGen):
                 raise Exception(
                     f"Failed to generate slide, tried too many times at editing\ntraceback: {feedback[1]}"
                 )
-            edit_actions = self.staffs["coder"].retry(*feedback, error_idx + 1)
-        self.empty_prs.build_slide(edited_slide)
+            edit_actions = staffs["coder"].retry(*feedback, error_idx + 1)
+        with self._build_lock:
+            self.empty_prs.build_slide(edited_slide)
+        self._save_checkpoint(slide_content, template, editor_output, edit_actions)
         return edited_slide
 
     def _prepare_schema(self, content_schema: dict):
@@ -572,10 +822,10 @@ class PPTCrew(PPTGen):
         old_data = {}
         if isinstance(content_schema, list):
             if len(content_schema) == 0:
-                print(f"content_schema is empty, {content_schema}, \
-                    maybe check the outline if it uses available layouts")
-                import pdb; pdb.set_trace()
-                
+                raise ValueError(
+                    f"content_schema is empty, {content_schema}, "
+                    "maybe check the outline if it uses available layouts"
+                )
             content_schema = {f"element_{i}": el for i, el in enumerate(content_schema)}
             
         for el_name, el_info in content_schema.items():
@@ -599,7 +849,12 @@ class PPTCrew(PPTGen):
         return old_data
 
     def _generate_commands(
-        self, editor_output: dict, content_schema: dict, old_data: dict, retry: int = 0
+        self,
+        editor_output: dict,
+        content_schema: dict,
+        old_data: dict,
+        retry: int = 0,
+        staffs: dict[str, Role] = None,
     ):
         """
         Generate commands for editing the slide content.
@@ -609,6 +864,7 @@ class PPTCrew(PPTGen):
             content_schema (dict): The content schema.
             old_data (dict): The old data.
             retry (int): The number of retries.
+            staffs (dict[str, Role]): The roles to use, the shared ones by default.
 
         Returns:
             list: A list of commands.
@@ -639,13 +895,14 @@ class PPTCrew(PPTGen):
                     )
         except Exception as e:
             if retry < self.retry_times:
-                new_output = self.staffs["editor"].retry(
+                staffs = staffs or self.staffs
+                new_output = staffs["editor"].retry(
                     e,
                     traceback.format_exc(),
                     retry + 1,
                 )
                 return self._generate_commands(
-                    new_output, content_schema, old_data, retry + 1
+                    new_output, content_schema, old_data, retry + 1, staffs
                 )
 
         for el_name, old_content in old_data.items():
@@ -0,0 +1,139 @@
+import os
+import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterator
+
+from pdf2image import convert_from_path, pdfinfo_from_path
+from PIL import Image
+
+# pages rendered at once, bounding the memory held by page images
+CHUNK_SIZE = 4
+THREAD_COUNT = min(4, os.cpu_count() or 1)
+
+
+def _page_runs(pages: list[int], chunk_size: int) -> Iterator[tuple[int, int]]:
+    """
+    Group sorted page numbers into runs of at most `chunk_size` consecutive pages, as (first, last).
+    """
+    first = last = None
+    for page in pages:
+        if first is not None and page == last + 1 and page - first < chunk_size:
+            last = page
+            continue
+        if first is not None:
+            yield first, last
+        first = last = page
+    if first is not None:
+        yield first, last
+
+
+def _select_pages(pdf_path: str, pages: list[int] | None) -> list[int]:
+    num_pages = pdfinfo_from_path(pdf_path)["Pages"]
+    if pages is None:
+        return list(range(1, num_pages + 1))
+    return sorted({page for page in pages if 1 <= page <= num_pages})
+
+
+def iter_pdf_pages(
+    pdf_path: str,
+    dpi: int = 150,
+    pages: list[int] = None,
+    chunk_size: int = CHUNK_SIZE,
+    thread_count: int = THREAD_COUNT,
+) -> Iterator[tuple[int, Image.Image]]:
+    """
+    Render the pages of a PDF lazily, a chunk of consecutive pages at a time, so that at most
+    `chunk_size` page images are in memory whatever the length of the document.
+
+    Args:
+        pdf_path (str): The PDF file.
+        dpi (int): The resolution of the page images.
+        pages (list[int]): The page numbers to render (1-based), all pages when None; pages out of range are skipped.
+        chunk_size (int): The number of pages rendered at once.
+        thread_count (int): The number of pdftoppm processes rendering a chunk.
+
+    Yields:
+        tuple[int, Image.Image]: The page number and its image.
+    """
+    for first, last in _page_runs(_select_pages(pdf_path, pages), chunk_size):
+        images = convert_from_path(
+            pdf_path, dpi=dpi, first_page=first, last_page=last, thread_count=min(thread_count, last - first + 1)
+        )
+        for page, image in zip(range(first, last + 1), images):
+            yield page, image
+        del images
+
+
+def rasterize_pdf(
+    pdf_path: str,
+    output_dir: str,
+    dpi: int = 72,
+    pages: list[int] = None,
+    fmt: str = "jpg",
+    filename: str = "slide_{page:04d}",
+    chunk_size: int = 16,
+    thread_count: int = THREAD_COUNT,
+) -> dict[int, str]:
+    """
+    Render the pages of a PDF to image files. pdftoppm writes the images itself, so they are never loaded in memory.
+
+    Args:
+        pdf_path (str): The PDF file.
+        output_dir (str): The directory of the images.
+        dpi (int): The resolution of the images.
+        pages (list[int]): The page numbers to render (1-based), all pages when None.
+        fmt (str): The format of the images, `jpg` or `png`.
+        filename (str): The name of the images without extension, formatted with the page number.
+        chunk_size (int): The number of pages rendered by a call to pdftoppm.
+        thread_count (int): The number of pdftoppm processes rendering a chunk.
+
+    Returns:
+        dict[int, str]: The paths of the images by page number.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = {}
+    with tempfile.TemporaryDirectory(dir=output_dir, prefix=".rasterize_") as temp_dir:
+        for first, last in _page_runs(_select_pages(pdf_path, pages), chunk_size):
+            rendered = convert_from_path(
+                pdf_path,
+                dpi=dpi,
+                first_page=first,
+                last_page=last,
+                fmt="jpeg" if fmt == "jpg" else fmt,
+                output_folder=temp_dir,
+                paths_only=True,
+                thread_count=min(thread_count, last - first + 1),
+            )
+            for page, path in zip(range(first, last + 1), rendered):
+                paths[page] = os.path.join(output_dir, f"{filename.format(page=page)}.{fmt}")
+                os.replace(path, paths[page])
+    return paths
+
+
+class ImageWriter:
+    """
+    Save images in a pool of writer threads within a `with` block, while the caller renders the next pages.
+    At most `max_pending` images wait to be saved, `save` blocks beyond, bounding the memory they hold.
+    """
+
+    def __init__(self, max_workers: int = THREAD_COUNT, max_pending: int = 16):
+        self._pool = ThreadPoolExecutor(max_workers)
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._futures: list[Future] = []
+
+    def save(self, image: Image.Image, path: str):
+        self._slots.acquire()
+        future = self._pool.submit(image.save, path)
+        future.add_done_callback(lambda _: self._slots.release())
+        self._futures.append(future)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._pool.shutdown(wait=True)
+        # report the first failed save, unless the block raised, whose exception is not masked
+        if exc[0] is None:
+            for future in self._futures:
+                future.result()
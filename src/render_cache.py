@@ -0,0 +1,148 @@
+import json
+import os
+import shutil
+import threading
+import uuid
+
+# directory of the render cache, rendering is not cached when set to an empty string
+RENDER_CACHE_ENV = "SLIDETAILOR_RENDER_CACHE"
+DEFAULT_RENDER_CACHE_DIR = "runs/cache/render"
+
+
+def place_file(src: str, dest: str):
+    """
+    Place a cached file at `dest`: images are linked, the other files (e.g. PDFs) copied, like
+    `ArtifactStore.materialize`, since they may be rewritten in place by later stages.
+    """
+    from agentic_loop.artifact_store import LINKED_SUFFIXES, link_file
+
+    os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+    if os.path.lexists(dest):
+        os.remove(dest)
+    if dest.lower().endswith(LINKED_SUFFIXES):
+        link_file(src, dest)
+    else:
+        shutil.copyfile(src, dest)
+
+
+class RenderCache:
+    """
+    A cache of the renderings of presentations, keyed by the sha256 of the PPTX content:
+    the PDF converted by LibreOffice, and the page images of each DPI and format.
+    Single slides are keyed by `utils.slide_render_digest` instead, their PDF is slide.pdf.
+
+    Layout:
+        {root}/{digest[:2]}/{digest}/deck.pdf
+        {root}/{digest[:2]}/{digest}/slide.pdf
+        {root}/{digest[:2]}/{digest}/pages_{dpi}_{fmt}/slide_{page:04d}.{fmt}
+        {root}/{digest[:2]}/{digest}/pages_{dpi}_{fmt}/pages.json, written once all the pages are
+
+    The mtime of an entry directory is its last access, by which `cache_manager.gc_render_cache` evicts entries.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def entry_dir(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest)
+
+    def pages_dir(self, digest: str, dpi: int, fmt: str) -> str:
+        return os.path.join(self.entry_dir(digest), f"pages_{dpi}_{fmt}")
+
+    def touch(self, digest: str):
+        try:
+            os.utime(self.entry_dir(digest))
+        except FileNotFoundError:
+            pass
+
+    def entries(self) -> list[str]:
+        """
+        Get the digests of the cached presentations.
+        """
+        if not os.path.isdir(self.root):
+            return []
+        return [
+            digest
+            for prefix in os.listdir(self.root)
+            if os.path.isdir(os.path.join(self.root, prefix))
+            for digest in os.listdir(os.path.join(self.root, prefix))
+            if not digest.endswith(".evicted")
+        ]
+
+    def delete(self, digest: str):
+        """
+        Delete the renderings of a presentation. The entry is renamed first, so readers never see it half deleted.
+        """
+        evicted = f"{self.entry_dir(digest)}.{uuid.uuid4().hex}.evicted"
+        try:
+            os.rename(self.entry_dir(digest), evicted)
+        except FileNotFoundError:
+            return
+        shutil.rmtree(evicted, ignore_errors=True)
+
+    def _put(self, src: str, dest: str):
+        # copy next to the destination, then rename, so readers never see a partial file
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tmp = f"{dest}.{uuid.uuid4().hex}.tmp"
+        shutil.copyfile(src, tmp)
+        os.chmod(tmp, 0o444)
+        os.replace(tmp, dest)
+
+    def _hit(self, digest: str, path: str) -> str | None:
+        if not os.path.exists(path):
+            return None
+        self.touch(digest)
+        return path
+
+    def get_pdf(self, digest: str, kind: str = "deck") -> str | None:
+        return self._hit(digest, os.path.join(self.entry_dir(digest), f"{kind}.pdf"))
+
+    def put_pdf(self, digest: str, pdf_path: str, kind: str = "deck"):
+        self._put(pdf_path, os.path.join(self.entry_dir(digest), f"{kind}.pdf"))
+        self.touch(digest)
+
+    def get_page(self, digest: str, dpi: int, fmt: str, page_num: int) -> str | None:
+        return self._hit(digest, os.path.join(self.pages_dir(digest, dpi, fmt), f"slide_{page_num:04d}.{fmt}"))
+
+    def put_page(self, digest: str, dpi: int, fmt: str, page_num: int, image_path: str):
+        self._put(image_path, os.path.join(self.pages_dir(digest, dpi, fmt), f"slide_{page_num:04d}.{fmt}"))
+        self.touch(digest)
+
+    def get_pages(self, digest: str, dpi: int, fmt: str) -> list[str] | None:
+        """
+        Get the images of all the pages of a presentation, None unless all of them were cached by `put_pages`.
+        """
+        index_path = os.path.join(self.pages_dir(digest, dpi, fmt), "pages.json")
+        if not os.path.exists(index_path):
+            return None
+        with open(index_path) as f:
+            num_pages = json.load(f)["num_pages"]
+        pages = [self.get_page(digest, dpi, fmt, i + 1) for i in range(num_pages)]
+        return pages if all(pages) else None
+
+    def put_pages(self, digest: str, dpi: int, fmt: str, image_paths: list[str]):
+        for i, image_path in enumerate(image_paths):
+            self.put_page(digest, dpi, fmt, i + 1, image_path)
+        index_path = os.path.join(self.pages_dir(digest, dpi, fmt), "pages.json")
+        tmp = f"{index_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"num_pages": len(image_paths)}, f)
+        os.replace(tmp, index_path)
+        self.touch(digest)
+
+
+_CACHES: dict[str, RenderCache] = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def get_render_cache() -> RenderCache | None:
+    """
+    Get the render cache configured by `SLIDETAILOR_RENDER_CACHE` (runs/cache/render by default), None if disabled.
+    """
+    root = os.environ.get(RENDER_CACHE_ENV, DEFAULT_RENDER_CACHE_DIR)
+    if not root:
+        return None
+    with _CACHES_LOCK:
+        if root not in _CACHES:
+            _CACHES[root] = RenderCache(root)
+        return _CACHES[root]
@@ -15,7 +15,8 @@ os.sys.path.append('./src')
 
 from presentation import Presentation
 from utils import Config, pptx_to_pdf, ppt_to_images
-from llms import LLM, setup_models
+from llms import LLM, connect_api_servers, setup_models
+from llm_cache import ResponseCache
 from pdf_parsing import parse_pdf, parsing_pdf_with_caption
 from stage_modules import stage_reference_document_parsing
 
@@ -25,31 +26,32 @@ def eval_aesthetic_quality(eval_dir: str, slide_images: list, vision_model: LLM,
     style_prompt = open("prompts/evaluation/ref_free/ppteval_aesthetic_quality.txt", "r").read()
     slide_scores = []
     slide_descriptions = []
-        
+
+    # Load existing evaluations, and evaluate the remaining slides concurrently
+    eval_results = {}
     for slide_image in slide_images:
         slide_name = os.path.basename(slide_image)
-        print(f"[INFO] Evaluating style of slide: {slide_name}")
-    
-        # Create evaluation results file path
         slide_eval_path = os.path.join(eval_dir, "aesthetic_quality", f"{slide_name.replace('.jpg', '.json')}")
         os.makedirs(os.path.dirname(slide_eval_path), exist_ok=True)
-        
-        if not os.path.exists(slide_eval_path) or not use_cache:
-            # Direct evaluation of style using unified prompt
-            style_eval = vision_model(style_prompt, [slide_image], return_json=True)
-            with open(slide_eval_path, "w", encoding="utf-8") as f:
-                json.dump({"style": style_eval}, f, indent=4)
-        else:
-            # Load existing evaluations
-            with open(slide_eval_path, "r+", encoding="utf-8") as f:
+        eval_data = {}
+        if os.path.exists(slide_eval_path) and use_cache:
+            with open(slide_eval_path, "r", encoding="utf-8") as f:
                 eval_data = json.load(f)
-                if "style" not in eval_data:
-                    style_eval = vision_model(style_prompt, [slide_image], return_json=True)
-                    f.seek(0)
-                    json.dump(eval_data | {"style": style_eval}, f, indent=4)
-                    f.truncate()
-                else:
-                    style_eval = eval_data['style']
+        eval_results[slide_image] = (slide_eval_path, eval_data)
+
+    pending = [k for k, (_, eval_data) in eval_results.items() if "style" not in eval_data]
+    for slide_image in pending:
+        print(f"[INFO] Evaluating style of slide: {os.path.basename(slide_image)}")
+    style_evals = vision_model.map(style_prompt, images=[[i] for i in pending], return_json=True) if pending else []
+    for slide_image, style_eval in zip(pending, style_evals):
+        # Direct evaluation of style using unified prompt
+        slide_eval_path, eval_data = eval_results[slide_image]
+        eval_data["style"] = style_eval
+        with open(slide_eval_path, "w", encoding="utf-8") as f:
+            json.dump(eval_data, f, indent=4)
+
+    for slide_image in slide_images:
+        style_eval = eval_results[slide_image][1]["style"]
         if "score" in style_eval:
             slide_scores.append(style_eval["score"])
             slide_descriptions.append(f"Score: {style_eval['score']}. Reason: {style_eval.get('reason', 'No description provided')}")        
@@ -77,28 +79,31 @@ def eval_content_informativeness(target_ppt_dir: str, target_doc_path: str, visi
 
     slide_scores = []
     slide_descriptions = []
-        
+
+    # Create evaluation results file path, storing in a sub-directory
+    eval_results = {}
     for slide_image in slide_images:
         slide_name = os.path.basename(slide_image)
-        print(f"[INFO] Evaluating content and informativeness of slide: {slide_name}")
-    
-        # Create evaluation results file path, storing in a sub-directory
         slide_eval_path = os.path.join(slide_eval_dir, f"{slide_name.replace('.jpg', '.json')}")
-        os.makedirs(os.path.dirname(slide_eval_path), exist_ok=True)
-                
         eval_data = {}
         if os.path.exists(slide_eval_path) and use_cache:
             with open(slide_eval_path, "r", encoding="utf-8") as f:
                 eval_data = json.load(f)
+        eval_results[slide_image] = (slide_eval_path, eval_data)
+
+    # This call is per-slide, passing the full paper and one slide image
+    pending = [k for k, (_, eval_data) in eval_results.items() if "content_informativeness" not in eval_data]
+    for slide_image in pending:
+        print(f"[INFO] Evaluating content and informativeness of slide: {os.path.basename(slide_image)}")
+    combined_evals = vision_model.map(prompt, images=[[i] for i in pending], return_json=True) if pending else []
+    for slide_image, combined_eval in zip(pending, combined_evals):
+        slide_eval_path, eval_data = eval_results[slide_image]
+        eval_data["content_informativeness"] = combined_eval
+        with open(slide_eval_path, "w", encoding="utf-8") as f:
+            json.dump(eval_data, f, indent=4)
 
-        if "content_informativeness" not in eval_data:
-            # This call is per-slide, passing the full paper and one slide image
-            combined_eval = vision_model(prompt, [slide_image], return_json=True)
-            eval_data["content_informativeness"] = combined_eval
-            with open(slide_eval_path, "w", encoding="utf-8") as f:
-                json.dump(eval_data, f, indent=4)
-        
-        combined_eval = eval_data["content_informativeness"]
+    for slide_image in slide_images:
+        combined_eval = eval_results[slide_image][1]["content_informativeness"]
         if "score" in combined_eval:
             slide_scores.append(combined_eval["score"])
             slide_descriptions.append(f"Score: {combined_eval['score']}. Reason: {combined_eval.get('reason', 'No description provided')}")        
@@ -551,22 +556,27 @@ def _evaluate(args):
         gen_config = json.load(f)
 
     # Setup models
+    llm_cache = None
+    if args.llm_cache:
+        llm_cache = ResponseCache(args.llm_cache, max_bytes=int(args.llm_cache_size_gb * 1024**3))
     
     if args.local_llm and args.llm_api_server_url and args.vlm_api_server_url:
             # Use OpenAI client with local API server URL
             print(f"[INFO] Using OpenAI-compatible API server at: {args.llm_api_server_url}")
             
             # Setup online models with custom API base URL
-            llm_client = OpenAI(api_key='YOUR_API_KEY', base_url=f"{args.llm_api_server_url}/v1")
-            model_name = llm_client.models.list().data[0].id
-            language_model = LLM(model=model_name, api_base=f"{args.llm_api_server_url}/v1", api_key="dummy-key")
+            language_model = connect_api_servers(args.llm_api_server_url, max_concurrency=args.max_concurrency, cache=llm_cache,
+                                                 image_size=args.image_size, image_quality=args.image_quality,
+                                                 image_transport=args.image_transport, media_root=args.media_root)
             
-            vlm_client = OpenAI(api_key='YOUR_API_KEY', base_url=f"{args.vlm_api_server_url}/v1")
-            model_name = vlm_client.models.list().data[0].id
-            vision_model = LLM(model=model_name, api_base=f"{args.vlm_api_server_url}/v1", api_key="dummy-key")
+            vision_model = connect_api_servers(args.vlm_api_server_url, max_concurrency=args.max_concurrency, cache=llm_cache,
+                                               image_size=args.image_size, image_quality=args.image_quality,
+                                               image_transport=args.image_transport, media_root=args.media_root)
     else:
-        language_model = LLM(model="gpt-4.1-2025-04-14", api_key=openai_api_key)
-        vision_model = LLM(model="gpt-4.1-2025-04-14", api_key=openai_api_key)
+        language_model = LLM(model="gpt-4.1-2025-04-14", api_key=openai_api_key, max_concurrency=args.max_concurrency, cache=llm_cache,
+                             image_size=args.image_size, image_quality=args.image_quality)
+        vision_model = LLM(model="gpt-4.1-2025-04-14", api_key=openai_api_key, max_concurrency=args.max_concurrency, cache=llm_cache,
+                           image_size=args.image_size, image_quality=args.image_quality)
         
     marker_model = create_model_dict(device=args.device, dtype=torch.float16)
     setup_models(language_model, vision_model)
@@ -683,10 +693,26 @@ if __name__ == '__main__':
                     help='file to store the results')
     parser.add_argument('--local_llm', action='store_true', default=False,
                         help='Use local LLM')
-    parser.add_argument('--vlm_api_server_url', type=str, default="http://0.0.0.0:8001",
-                        help='URL of OpenAI-compatible VLM API server (e.g., vllm or lmdeploy, http://0.0.0.0:8001)')
-    parser.add_argument('--llm_api_server_url', type=str, default="http://0.0.0.0:8002",
-                        help='URL of OpenAI-compatible LLM API server (e.g., vllm or lmdeploy, http://0.0.0.0:8002)')
+    parser.add_argument('--vlm_api_server_url', type=str, nargs='+', default=["http://0.0.0.0:8001"],
+                        help='URL(s) of OpenAI-compatible VLM API server replicas (e.g., vllm or lmdeploy, http://0.0.0.0:8001)')
+    parser.add_argument('--llm_api_server_url', type=str, nargs='+', default=["http://0.0.0.0:8002"],
+                        help='URL(s) of OpenAI-compatible LLM API server replicas (e.g., vllm or lmdeploy, http://0.0.0.0:8002)')
+    parser.add_argument('--max_concurrency', type=int, default=8,
+                        help='Maximum number of in-flight requests per LLM backend for batched calls')
+    parser.add_argument('--llm_cache', type=str, default=None,
+                        help='Path of the persistent LLM response cache (SQLite), e.g. runs/cache/llm_cache.sqlite')
+    parser.add_argument('--llm_cache_size_gb', type=float, default=2,
+                        help='Size budget of the LLM response cache in GB, least recently used entries are evicted')
+    parser.add_argument('--image_size', type=int, default=1024,
+                        help='Effective image resolution of the models, larger images are downscaled before sending')
+    parser.add_argument('--image_quality', type=int, default=90,
+                        help='JPEG quality images are recompressed to before sending')
+    parser.add_argument('--image_transport', type=str, default='base64', choices=['base64', 'file', 'http'],
+                        help='How images are sent to local API servers: inlined base64, file:// urls '
+                             '(needs e.g. vllm --allowed-local-media-path) or urls of a built-in localhost file server')
+    parser.add_argument('--media_root', type=str, nargs='+', default=None,
+                        help='Directories served to local API servers with --image_transport http, images outside '
+                             'them are sent as base64; runs by default')
 
     args = parser.parse_args()
     
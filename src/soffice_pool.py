@@ -0,0 +1,292 @@
+import atexit
+import os
+import queue
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+
+# the print of utils, which imports this module
+from rich import print
+
+try:
+    import uno
+except ImportError:
+    # pyuno ships with LibreOffice (e.g. python3-uno), without it every conversion launches soffice
+    uno = None
+
+# number of LibreOffice instances of the pool of each process
+INSTANCES_ENV = "SLIDETAILOR_SOFFICE_INSTANCES"
+# seconds a conversion may take before LibreOffice is killed
+CONVERT_TIMEOUT = 300
+
+# export filters by document type and target format
+FILTERS = {
+    ("impress", "pdf"): "impress_pdf_Export",
+    ("impress", "jpg"): "impress_jpg_Export",
+    ("impress", "png"): "impress_png_Export",
+    ("draw", "pdf"): "draw_pdf_Export",
+    ("draw", "jpg"): "draw_jpg_Export",
+    ("draw", "png"): "draw_png_Export",
+    ("writer", "pdf"): "writer_pdf_Export",
+}
+DOCUMENT_SERVICES = {
+    "impress": "com.sun.star.presentation.PresentationDocument",
+    "draw": "com.sun.star.drawing.DrawingDocument",
+    "writer": "com.sun.star.text.TextDocument",
+}
+
+
+class SofficeError(RuntimeError):
+    """
+    Raised when LibreOffice fails to convert a file.
+    """
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _property(name: str, value):
+    prop = uno.createUnoStruct("com.sun.star.beans.PropertyValue")
+    prop.Name = name
+    prop.Value = value
+    return prop
+
+
+def _call_with_timeout(func, timeout: float, *args):
+    """
+    Call `func` in a daemon thread, raising TimeoutError if it does not return within `timeout` seconds.
+    The thread is left behind on timeout, it ends once the caller kills what `func` waits on.
+    """
+    future = Future()
+
+    def run():
+        try:
+            future.set_result(func(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, daemon=True).start()
+    return future.result(timeout)
+
+
+def output_path(src: str, output_dir: str, fmt: str) -> str:
+    """
+    Get the path of the converted file, named like `soffice --convert-to` names it.
+    """
+    return os.path.join(output_dir, f"{os.path.splitext(os.path.basename(src))[0]}.{fmt}")
+
+
+class SofficeInstance:
+    """
+    A long-running headless LibreOffice with its own user profile, driven over a UNO socket.
+    """
+
+    def __init__(self, startup_timeout: float = 60):
+        self.startup_timeout = startup_timeout
+        self.profile_dir = tempfile.mkdtemp(prefix="soffice-profile-")
+        self.process = None
+        self.desktop = None
+
+    def start(self):
+        port = _free_port()
+        self.process = subprocess.Popen(
+            [
+                "soffice",
+                "--headless",
+                "--invisible",
+                "--nologo",
+                "--norestore",
+                "--nodefault",
+                f"--accept=socket,host=127.0.0.1,port={port};urp;StarOffice.ComponentContext",
+                f"-env:UserInstallation=file://{self.profile_dir}",
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        local_context = uno.getComponentContext()
+        resolver = local_context.ServiceManager.createInstanceWithContext(
+            "com.sun.star.bridge.UnoUrlResolver", local_context
+        )
+        deadline = time.monotonic() + self.startup_timeout
+        while True:
+            try:
+                context = resolver.resolve(f"uno:socket,host=127.0.0.1,port={port};urp;StarOffice.ComponentContext")
+                break
+            except Exception:
+                if self.process.poll() is not None or time.monotonic() > deadline:
+                    self.stop()
+                    raise SofficeError("LibreOffice failed to start")
+                time.sleep(0.2)
+        self.desktop = context.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", context)
+
+    def stop(self):
+        self.desktop = None
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.process = None
+
+    def kill(self):
+        """
+        Kill a hung LibreOffice, which may not answer a terminate.
+        """
+        self.desktop = None
+        if self.process is not None and self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+        self.process = None
+
+    def alive(self) -> bool:
+        return self.desktop is not None and self.process is not None and self.process.poll() is None
+
+    def convert(self, src: str, output_dir: str, fmt: str) -> str:
+        document = self.desktop.loadComponentFromURL(
+            uno.systemPathToFileUrl(os.path.abspath(src)), "_blank", 0, (_property("Hidden", True),)
+        )
+        if document is None:
+            raise SofficeError(f"LibreOffice could not open {src}")
+        try:
+            kind = next((k for k, service in DOCUMENT_SERVICES.items() if document.supportsService(service)), None)
+            if (kind, fmt) not in FILTERS:
+                raise SofficeError(f"Cannot convert {src} ({kind}) to {fmt}")
+            dest = output_path(src, output_dir, fmt)
+            document.storeToURL(
+                uno.systemPathToFileUrl(os.path.abspath(dest)), (_property("FilterName", FILTERS[(kind, fmt)]),)
+            )
+        finally:
+            document.close(True)
+        return dest
+
+    def close(self):
+        self.stop()
+        shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+
+class SofficePool:
+    """
+    A pool of headless LibreOffice instances converting files for all the threads of a process,
+    so that a conversion costs a dispatch rather than the launch of soffice.
+
+    Conversions wait in a queue for a free instance. An instance that crashed or failed a conversion
+    is restarted and the conversion retried once on it. A conversion hanging for `timeout` seconds
+    (e.g. on a malformed deck) kills its instance, restarted by the next conversion, and is retried once
+    by launching soffice. Without pyuno, each conversion launches soffice, with one isolated profile
+    per slot of the pool so that concurrent conversions do not wait for each other.
+    """
+
+    def __init__(self, size: int = 1, timeout: float = CONVERT_TIMEOUT):
+        """
+        Initialize the SofficePool, the instances are started on first use.
+
+        Args:
+            size (int): The number of LibreOffice instances, i.e. of concurrent conversions.
+            timeout (float): The time in seconds a conversion may take.
+        """
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.Queue()
+        self._instances = []
+        for _ in range(size):
+            instance = SofficeInstance() if uno is not None else tempfile.mkdtemp(prefix="soffice-profile-")
+            self._instances.append(instance)
+            self._idle.put(instance)
+
+    def convert(self, src: str, output_dir: str, fmt: str = "pdf") -> str:
+        """
+        Convert a file with LibreOffice, e.g. a presentation to pdf or a wmf image to jpg.
+
+        Args:
+            src (str): The file to convert.
+            output_dir (str): The directory of the converted file.
+            fmt (str): The target format.
+
+        Returns:
+            str: The path of the converted file, `output_dir/<name of src>.<fmt>`.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        instance = self._idle.get()
+        try:
+            if uno is None:
+                return self._convert_subprocess(instance, src, output_dir, fmt, self.timeout)
+            for attempt in range(2):
+                if not instance.alive():
+                    instance.stop()
+                    instance.start()
+                try:
+                    return _call_with_timeout(instance.convert, self.timeout, src, output_dir, fmt)
+                except TimeoutError:
+                    print(f"[WARNING] LibreOffice hung converting {src} for {self.timeout}s, "
+                          f"killing it and converting with a new soffice process")
+                    instance.kill()
+                    break
+                except Exception as e:
+                    if attempt == 1:
+                        raise SofficeError(f"LibreOffice failed to convert {src}: {e}") from e
+                    print(f"[WARNING] LibreOffice failed to convert {src}, restarting it: {e}")
+                    instance.stop()
+            profile_dir = tempfile.mkdtemp(prefix="soffice-profile-")
+            try:
+                return self._convert_subprocess(profile_dir, src, output_dir, fmt, self.timeout)
+            finally:
+                shutil.rmtree(profile_dir, ignore_errors=True)
+        finally:
+            self._idle.put(instance)
+
+    @staticmethod
+    def _convert_subprocess(profile_dir: str, src: str, output_dir: str, fmt: str, timeout: float = None) -> str:
+        command_list = [
+            "soffice",
+            "--headless",
+            "--convert-to",
+            fmt,
+            src,
+            "--outdir",
+            output_dir,
+            f"-env:UserInstallation=file://{profile_dir}",
+        ]
+        try:
+            subprocess.run(command_list, check=True, stdout=subprocess.DEVNULL, timeout=timeout)
+        except subprocess.TimeoutExpired as e:
+            raise SofficeError(f"LibreOffice timed out converting {src} after {timeout}s") from e
+        return output_path(src, output_dir, fmt)
+
+    def close(self):
+        for instance in self._instances:
+            if isinstance(instance, SofficeInstance):
+                instance.close()
+            else:
+                shutil.rmtree(instance, ignore_errors=True)
+        self._instances = []
+
+
+_POOL: SofficePool | None = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_soffice_pool() -> SofficePool:
+    """
+    Get the LibreOffice pool of this process, of `SLIDETAILOR_SOFFICE_INSTANCES` instances (1 by default).
+    """
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = SofficePool(int(os.environ.get(INSTANCES_ENV, 1)))
+            atexit.register(_POOL.close)
+        return _POOL
+
+
+def soffice_convert(src: str, output_dir: str, fmt: str = "pdf") -> str:
+    """
+    Convert a file with the LibreOffice pool of this process, see `SofficePool.convert`.
+    """
+    return get_soffice_pool().convert(src, output_dir, fmt)
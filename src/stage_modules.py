@@ -101,17 +101,20 @@ def stage_slide_induction(presentation, ppt_image_folder, pptx_config, vision_mo
     
     return template_presentation, slide_induction
 
-def stage_reference_document_parsing(ref_content_pdf, ref_content_ppt, marker_model, vision_model, language_model, project_id, runs_dir = "runs"):
+def stage_reference_document_parsing(ref_content_pdf, ref_content_ppt, marker_model, vision_model, language_model, project_id, runs_dir = "runs",
+                                     ref_pdf_text = None, ref_slide_text = None):
     """
     Stage 3: Reference document parsing - Parse reference PDF and PPT to extract presentation guidelines
     
     Args:
         ref_content_pdf: Path to reference PDF
         ref_content_ppt: Path to reference PPT
-        marker_model: Model for PDF parsing
+        marker_model: Model for PDF parsing, unused for the documents already parsed
         vision_model: Vision model
         language_model: Language model
         project_id: Project identifier
+        ref_pdf_text: Text of the reference PDF already parsed by `marker_parse_pdf`, if any
+        ref_slide_text: Text of the reference PPT already parsed by `marker_parse_pdf`, if any
         
     Returns:
         pref_guidelines: Presentation preference guidelines
@@ -120,12 +123,14 @@ def stage_reference_document_parsing(ref_content_pdf, ref_content_ppt, marker_mo
     
     ref_pdf_parsed_pdf_dir = pjoin(runs_dir, project_id, "pdf", "ref_pdf")
     print(f"[INFO] Parsing reference PDF: {ref_content_pdf}")
-    ref_pdf_md = parsing_pdf_with_caption(ref_content_pdf, ref_pdf_parsed_pdf_dir, marker_model, vision_model, language_model)
+    ref_pdf_md = parsing_pdf_with_caption(ref_content_pdf, ref_pdf_parsed_pdf_dir, marker_model, vision_model, language_model,
+                                          text_content=ref_pdf_text)
     # ref_pdf_md = parse_pdf(ref_content_pdf, ref_pdf_parsed_pdf_dir, marker_model)
     
     ref_slide_parsed_pdf_dir = pjoin(runs_dir, project_id, "pdf", "ref_slide_pdf")
     print(f"[INFO] Parsing reference PPT: {ref_content_ppt}")
-    ref_slide_md = parsing_pdf_with_caption(ref_content_ppt, ref_slide_parsed_pdf_dir, marker_model, vision_model, language_model)
+    ref_slide_md = parsing_pdf_with_caption(ref_content_ppt, ref_slide_parsed_pdf_dir, marker_model, vision_model, language_model,
+                                            text_content=ref_slide_text)
     # ref_slide_md = parse_pdf(ref_content_ppt, ref_slide_parsed_pdf_dir, marker_model)
     
     pref_guidelines = generate_preference_presentation_guidelines(language_model, ref_pdf_md, ref_slide_md)
@@ -151,11 +156,44 @@ def stage_target_document_parsing(pdf_path, marker_model, vision_model, language
         doc_json: Parsed document structure
         images: Images extracted from the document
     """
+    text_content = stage_target_document_captioning(pdf_path, marker_model, vision_model, language_model, project_id, runs_dir)
+    return stage_target_document_refinement(text_content, language_model, project_id, pref_guidelines, runs_dir)
+
+def stage_target_document_captioning(pdf_path, marker_model, vision_model, language_model, project_id, runs_dir = "runs", text_content = None):
+    """
+    Stage 4a: Target document parsing - Parse target PDF and caption its images, independent of the guidelines
+    
+    Args:
+        pdf_path: Path to target PDF
+        marker_model: Model for PDF parsing, unused if `text_content` is given
+        vision_model: Vision model
+        language_model: Language model
+        project_id: Project identifier
+        text_content: Text of the target PDF already parsed by `marker_parse_pdf`, if any
+        
+    Returns:
+        text_content: Markdown content with image captions
+    """
     print("[STAGE] PDF/Topic Parsing (Target)")
     
     parsed_pdf_dir = pjoin(runs_dir, project_id, "pdf", "target_pdf")
-    text_content = parsing_pdf_with_caption(pdf_path, parsed_pdf_dir, marker_model, vision_model, language_model)
+    return parsing_pdf_with_caption(pdf_path, parsed_pdf_dir, marker_model, vision_model, language_model,
+                                    text_content=text_content)
+
+def stage_target_document_refinement(text_content, language_model, project_id, pref_guidelines, runs_dir = "runs"):
+    """
+    Stage 4b: Target document parsing - Refine the parsed target document with reference to guidelines
     
+    Args:
+        text_content: Markdown content with image captions, from `stage_target_document_captioning`
+        language_model: Language model
+        project_id: Project identifier
+        pref_guidelines: Presentation preference guidelines
+        
+    Returns:
+        doc_json: Parsed document structure
+        images: Images extracted from the document
+    """
     parsedpdf_dir = pjoin(runs_dir, project_id, "pdf", "target_pdf")
     refined_doc_json_path = pjoin(parsedpdf_dir, "refined_doc.json")
     
@@ -173,7 +211,9 @@ def stage_presentation_generation(
     template_presentation, slide_induction, generation_config, 
     pref_guidelines, images, num_slides, doc_json,
     vision_model, language_model, text_model,
-    presentation_outline = None
+    presentation_outline = None,
+    parallel_slides: int = 1,
+    resume: bool = False,
 ):
     """
     Stage 5: Presentation generation - Generate the final presentation
@@ -190,6 +230,8 @@ def stage_presentation_generation(
         vision_model: Vision model
         language_model: Language model
         text_model: Text embedding model
+        parallel_slides: Number of slides generated concurrently
+        resume: Whether to resume an interrupted generation in the run directory from its slide checkpoints
         
     Returns:
         output_pptx_path: Path to the generated presentation
@@ -199,7 +241,8 @@ def stage_presentation_generation(
     
     print("[STAGE] PPT Generation")
     crew = pptgen.PPTCrew(vision_model, language_model, text_model,
-                        error_exit=True, retry_times=3)
+                        error_exit=True, retry_times=3, parallel_slides=parallel_slides,
+                        resume=resume)
 
     crew.set_reference(template_presentation,
                         slide_induction,
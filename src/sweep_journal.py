@@ -0,0 +1,80 @@
+import fcntl
+import json
+import os
+from time import time
+
+# statuses of a task in the journal, the last record of a task is its current status
+STARTED = "started"
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+def task_key(config_item: dict, slides: int) -> str:
+    """
+    Get the key of a sweep task: its target paper, reference paper, template and number of slides.
+    """
+    return json.dumps(
+        [config_item["target"], config_item["sample"]["paper"], config_item["template"], slides]
+    )
+
+
+class SweepJournal:
+    """
+    An append-only JSONL journal of the tasks of a sweep, recording each task as it starts and finishes,
+    so that an interrupted sweep can be resumed from the tasks it completed.
+
+    Records are appended with a single write under an exclusive lock, so the worker processes
+    of a sweep can share one journal, and a crash leaves at most a truncated last line.
+    """
+
+    def __init__(self, path: str):
+        """
+        Initialize the SweepJournal.
+
+        Args:
+            path (str): The path of the JSONL journal file.
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def append(self, key: str, status: str, **fields):
+        """
+        Append a record of a task.
+
+        Args:
+            key (str): The key of the task, see `task_key`.
+            status (str): `started`, `completed` or `failed`.
+            **fields: Other fields of the record, e.g. the output directory of the task.
+        """
+        line = json.dumps({"key": key, "status": status, "time": time(), **fields}, ensure_ascii=False) + "\n"
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            size = os.fstat(fd).st_size
+            # terminate the truncated line left by a killed writer, so it does not swallow this record
+            if size > 0 and os.pread(fd, 1, size - 1) != b"\n":
+                line = "\n" + line
+            os.write(fd, line.encode("utf-8"))
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def load(self) -> dict[str, dict]:
+        """
+        Read the journal.
+
+        Returns:
+            dict[str, dict]: The last record of every task by key.
+        """
+        records = {}
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # the last line of a journal whose writer was killed
+                    continue
+                records[record["key"]] = record
+        return records
@@ -0,0 +1,101 @@
+from collections import Counter
+
+
+def task_artifacts(config_item: dict, slides: int) -> list[str]:
+    """
+    Get the cached stage outputs of `refine_loop_with_cache` a sweep task needs: the parsed and induced
+    template, the reference guidelines, the parsed target (which depends on the reference) and the generation.
+    """
+    target = config_item["target"]
+    reference = config_item["sample"]["paper"]
+    template = config_item["template"]
+    return [
+        f"template:{template}",
+        f"reference:{reference}",
+        f"target:{target}:{reference}",
+        f"generation:{target}:{reference}:{template}:{slides}",
+    ]
+
+
+class SweepPlanner:
+    """
+    Order the tasks of a sweep to make the most of the stage cache.
+
+    A task is worth running early when it produces artifacts (see `task_artifacts`) many pending tasks
+    share, so one producer of every shared artifact runs first and the tasks depending on it hit the cache.
+    In parallel sweeps, tasks whose artifacts are being produced by a running task are held back while
+    other tasks are ready, so that workers do not wait on each other for the same artifact.
+    """
+
+    def __init__(self, tasks: list[tuple[int, dict]], slides: int):
+        """
+        Initialize the SweepPlanner.
+
+        Args:
+            tasks (list[tuple[int, dict]]): The tasks to plan, as (index, config item).
+            slides (int): The number of slides of the sweep.
+        """
+        self.pending = list(tasks)
+        self.artifacts = {i: task_artifacts(config_item, slides) for i, config_item in tasks}
+        # number of pending tasks needing each artifact
+        self.demand = Counter(a for artifacts in self.artifacts.values() for a in artifacts)
+        self.producing = Counter()
+        self.done = set()
+
+    def _priority(self, task: tuple[int, dict]) -> tuple:
+        i = task[0]
+        artifacts = self.artifacts[i]
+        blocked = sum(1 for a in artifacts if self.producing[a])
+        # the other pending tasks this one produces cached artifacts for
+        shared = sum(self.demand[a] - 1 for a in artifacts if a not in self.done and not self.producing[a])
+        reused = sum(1 for a in artifacts if a in self.done)
+        return (-blocked, shared, reused, -i)
+
+    def next_task(self) -> tuple[int, dict] | None:
+        """
+        Get the next task to run, preferring tasks no running task produces artifacts for,
+        then the producers of the most shared artifacts, then the tasks reusing the most finished ones.
+
+        Returns:
+            tuple[int, dict] | None: The task, None when no task is pending.
+        """
+        if not self.pending:
+            return None
+        return max(self.pending, key=self._priority)
+
+    def start(self, task: tuple[int, dict]):
+        self.pending.remove(task)
+        for a in self.artifacts[task[0]]:
+            self.demand[a] -= 1
+            if a not in self.done:
+                self.producing[a] += 1
+
+    def finish(self, task: tuple[int, dict], success: bool = True):
+        """
+        Mark a task as finished, its artifacts are cached if it succeeded. Otherwise
+        the next task needing them produces them.
+        """
+        for a in self.artifacts[task[0]]:
+            if self.producing[a]:
+                self.producing[a] -= 1
+            if success:
+                self.done.add(a)
+
+    def requeue(self, task: tuple[int, dict]):
+        """
+        Put a finished task back in the pending tasks, e.g. to rerun it after its worker died.
+        """
+        self.pending.append(task)
+        for a in self.artifacts[task[0]]:
+            self.demand[a] += 1
+
+    def order(self) -> list[tuple[int, dict]]:
+        """
+        Plan the order of the pending tasks of a sequential sweep.
+        """
+        ordered = []
+        while (task := self.next_task()) is not None:
+            self.start(task)
+            self.finish(task, success=True)
+            ordered.append(task)
+        return ordered
@@ -1,8 +1,11 @@
+import hashlib
+import json
 import os
+import posixpath
 import shutil
-import subprocess
 import tempfile
 import traceback
+import zipfile
 from time import sleep, time
 from types import SimpleNamespace
 from typing import List
@@ -11,9 +14,10 @@ import cv2
 import json_repair
 import Levenshtein
 from lxml import etree
-from pdf2image import convert_from_path
+from pptx import Presentation as PptxPresentation
 from pptx.dml.color import RGBColor
 from pptx.oxml import parse_xml
+from pptx.oxml.ns import qn
 from pptx.shapes.base import BaseShape
 from pptx.shapes.group import GroupShape
 from pptx.text.text import _Paragraph, _Run
@@ -21,6 +25,10 @@ from pptx.util import Length, Pt
 from rich import print
 from tenacity import RetryCallState, retry, stop_after_attempt, wait_fixed
 
+from rasterize import rasterize_pdf
+from render_cache import get_render_cache, place_file
+from soffice_pool import soffice_convert
+
 IMAGE_EXTENSIONS = {"bmp", "jpg", "jpeg", "pgm", "png", "ppm", "tif", "tiff", "webp"}
 
 BLACK = RGBColor(0, 0, 0)
@@ -130,6 +138,12 @@ def tenacity_log(retry_state: RetryCallState):
     traceback.print_tb(retry_state.outcome.exception().__traceback__)
 
 
+class ResponseParseError(RuntimeError):
+    """
+    Raised when no JSON can be parsed from a model response.
+    """
+
+
 def get_json_from_response(raw_response: str):
     response = raw_response.strip()
     l, r = response.rfind("```json"), response.rfind("```")
@@ -140,13 +154,109 @@ def get_json_from_response(raw_response: str):
             response = json_repair.loads(response[l + 7 : r].strip())
         return response
     except Exception as e:
-        raise RuntimeError("Failed to parse JSON from response", e)
+        raise ResponseParseError("Failed to parse JSON from response", e)
+
+
+class JSONObjectStream:
+    """
+    An incremental parser of a streamed JSON object, yielding its top-level members as soon as they are complete.
+    Text before the first `{` (e.g. a ```json fence) is skipped.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._member_start = None
+        self._done = False
+
+    def feed(self, chunk: str) -> list[tuple[str, object]]:
+        """
+        Feed a chunk of the response.
+
+        Args:
+            chunk (str): The next chunk of the response text.
+
+        Returns:
+            list[tuple[str, object]]: The (key, value) members completed by this chunk.
+        """
+        self.buffer += chunk
+        members = []
+        while self._pos < len(self.buffer) and not self._done:
+            char = self.buffer[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"' and self._depth > 0:
+                self._in_string = True
+            elif char == "{" or (char == "[" and self._depth > 0):
+                self._depth += 1
+                if self._depth == 1:
+                    self._member_start = self._pos + 1
+            elif char in "}]" and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    members.extend(self._pop_member(self._pos))
+                    self._done = True
+            elif char == "," and self._depth == 1:
+                members.extend(self._pop_member(self._pos))
+                self._member_start = self._pos + 1
+            self._pos += 1
+        return members
+
+    def _pop_member(self, end: int) -> list[tuple[str, object]]:
+        text = self.buffer[self._member_start : end].strip()
+        if len(text) == 0:
+            return []
+        try:
+            member = json.loads("{" + text + "}")
+        except json.JSONDecodeError:
+            member = json_repair.loads("{" + text + "}")
+            if not isinstance(member, dict):
+                return []
+        return list(member.items())
 
 
 tenacity = retry(
     wait=wait_fixed(3), stop=stop_after_attempt(5), after=tenacity_log, reraise=True
 )
 
+def _render_digest(file: str) -> str | None:
+    """
+    Get the key of a presentation in the render cache, None if rendering is not cached.
+    """
+    if get_render_cache() is None:
+        return None
+    from agentic_loop.artifact_store import file_digest
+
+    return file_digest(file)
+
+
+def _render_pdf(file: str, output_dir: str, digest: str | None, kind: str = "deck") -> str:
+    """
+    Convert a presentation to PDF in `output_dir`, or copy its rendering from the render cache.
+    `kind` is "deck" for a presentation keyed by its file digest, "slide" for a single slide keyed by `slide_render_digest`.
+    """
+    cache = get_render_cache()
+    pdf_path = pjoin(output_dir, os.path.splitext(pbasename(file))[0] + ".pdf")
+    if digest is not None and (cached := cache.get_pdf(digest, kind)) is not None:
+        place_file(cached, pdf_path)
+        return pdf_path
+    # converted by the LibreOffice pool of the process, see soffice_pool
+    pdf_path = soffice_convert(file, output_dir, "pdf")
+    if not pexists(pdf_path):
+        raise RuntimeError("No PDF file was created", file)
+    if digest is not None:
+        cache.put_pdf(digest, pdf_path, kind)
+    return pdf_path
+
+
 @tenacity
 def pptx_to_pdf(file: str, output_dir: str, warning: bool = False):
     assert pexists(file), f"File {file} does not exist"
@@ -154,19 +264,7 @@ def pptx_to_pdf(file: str, output_dir: str, warning: bool = False):
         print(f"pptx2pdf: {output_dir} already exists")
     os.makedirs(output_dir, exist_ok=True)
     
-    command_list = [
-        "soffice",
-        "--headless",
-        "--convert-to",
-        "pdf",
-        file,
-        "--outdir",
-        output_dir,
-        # '-env:UserInstallation=file:///tmp/soffice-profile',  # TODO@: fix this
-    ]
-    subprocess.run(command_list, check=True, stdout=subprocess.DEVNULL)
-    # print(f"[pptx2pdf] saved at {output_dir} completed")
-    return pjoin(output_dir, pbasename(file).removesuffix(".pptx") + ".pdf")
+    return _render_pdf(file, output_dir, _render_digest(file))
 
 @tenacity
 def ppt_to_images(file: str, output_dir: str, warning: bool = False):
@@ -175,35 +273,92 @@ def ppt_to_images(file: str, output_dir: str, warning: bool = False):
         print(f"ppt2images: {output_dir} already exists")
     os.makedirs(output_dir, exist_ok=True)
     
+    # the same deck is rendered by several stages and evaluations, reuse its cached page images
+    digest = _render_digest(file)
+    if digest is not None and (pages := get_render_cache().get_pages(digest, 72, "jpg")) is not None:
+        for i, page in enumerate(pages):
+            place_file(page, pjoin(output_dir, f"slide_{i+1:04d}.jpg"))
+        return
+    
     file_dir = os.path.dirname(file)
     with tempfile.TemporaryDirectory(dir=file_dir, prefix=".soffice_tmpdir_") as temp_dir:
-        command_list = [
-            "soffice",
-            "--headless",
-            "--convert-to",
-            "pdf",
-            file,
-            "--outdir",
-            temp_dir,
-            # '-env:UserInstallation=file:///tmp/soffice-profile',  # TODO@: fix this
-        ]
-        
-        subprocess.run(command_list, check=True, stdout=subprocess.DEVNULL)
+        temp_pdf = _render_pdf(file, temp_dir, digest)
+        # the pages are written by pdftoppm, chunk by chunk, without loading them in memory
+        image_paths = rasterize_pdf(temp_pdf, output_dir, dpi=72, fmt="jpg", filename="slide_{page:04d}")
+        if digest is not None:
+            get_render_cache().put_pages(digest, 72, "jpg", [image_paths[page] for page in sorted(image_paths)])
 
-        # import pdb; pdb.set_trace()
-        
-        for f in os.listdir(temp_dir):
-            if not f.endswith(".pdf"):
+def _package_rels(archive: zipfile.ZipFile, partname: str) -> list[tuple[str, str, str]]:
+    """
+    Get the internal relationships of a part of a PPTX archive, as (id, type, target part name), "" being the package.
+    """
+    directory, name = posixpath.split(partname)
+    rels_name = posixpath.join(directory, "_rels", f"{name}.rels")
+    if rels_name not in archive.NameToInfo:
+        return []
+    rels = []
+    for rel in etree.fromstring(archive.read(rels_name)):
+        if rel.get("TargetMode") == "External":
+            continue
+        target = rel.get("Target")
+        target = target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join(directory, target))
+        rels.append((rel.get("Id"), rel.get("Type"), target))
+    return rels
+
+
+def slide_render_digest(file: str, page_num: int) -> str:
+    """
+    Digest everything the rendering of a slide depends on: the slide size, its page number (for slide number
+    fields) and the parts reachable from the slide, i.e. its XML, media, layout, master and theme.
+    Only these parts are read from the archive, the presentation is not loaded.
+
+    Raises:
+        IndexError: If the presentation has no page `page_num`.
+    """
+    with zipfile.ZipFile(file) as archive:
+        presentation = next(
+            target for _, rel_type, target in _package_rels(archive, "") if rel_type.endswith("/officeDocument")
+        )
+        root = etree.fromstring(archive.read(presentation))
+        slide_ids = root.findall(f"{qn('p:sldIdLst')}/{qn('p:sldId')}")
+        if not 1 <= page_num <= len(slide_ids):
+            raise IndexError(f"Page {page_num} out of range, {file} has {len(slide_ids)} slides")
+        size = root.find(qn("p:sldSz"))
+        size = f"{size.get('cx')}x{size.get('cy')}" if size is not None else ""
+        targets = {rel_id: target for rel_id, _, target in _package_rels(archive, presentation)}
+        h = hashlib.sha256(f"{size}:{page_num}".encode())
+        seen = set()
+        parts = [targets[slide_ids[page_num - 1].get(qn("r:id"))]]
+        while parts:
+            part = parts.pop()
+            if part in seen or part not in archive.NameToInfo:
                 continue
-            temp_pdf = pjoin(temp_dir, f)
-            images = convert_from_path(temp_pdf, dpi=72)
-            for i, img in enumerate(images):
-                img.save(pjoin(output_dir, f"slide_{i+1:04d}.jpg"))
-            return
+            seen.add(part)
+            h.update(part.encode())
+            h.update(archive.read(part))
+            for _, _, target in sorted(_package_rels(archive, part)):
+                parts.append(target)
+    return h.hexdigest()
+
+
+def keep_single_slide(prs: PptxPresentation, page_num: int) -> PptxPresentation:
+    """
+    Remove all the slides of a presentation but one, keeping its masters and layouts.
+    The parts only the removed slides use (their media, notes) are left out when the presentation is saved.
+    """
+    slide_list = prs.slides._sldIdLst
+    for idx, slide_id in enumerate(list(slide_list)):
+        if idx == page_num - 1:
+            continue
+        slide_list.remove(slide_id)
+        prs.part.drop_rel(slide_id.rId)
+    # keep the page number of the slide, and drop the custom shows referring to the removed slides
+    prs.part._element.set("firstSlideNum", str(page_num))
+    for custom_shows in prs.part._element.findall(qn("p:custShowLst")):
+        prs.part._element.remove(custom_shows)
+    return prs
 
-        raise RuntimeError("No PDF file was created in the temporary directory", file)
 
-@tenacity
 def ppt_page_to_images(file: str, output_dir: str, page_num: int, dpi: int = 72, force: bool = True):
     """
     Convert a specific page of a PowerPoint presentation to an image.
@@ -218,17 +373,21 @@ def ppt_page_to_images(file: str, output_dir: str, page_num: int, dpi: int = 72,
     Returns:
         Path to the saved image file
     """
+    # Ensure input file exists and has the page, checked once rather than retried
+    if not os.path.exists(file):
+        raise FileNotFoundError(f"File {file} does not exist")
+    # Only the page is rendered, keyed by its slide, so that editing a slide does not re-render the others
+    digest = slide_render_digest(file, page_num)
+    return _ppt_page_to_image(file, output_dir, page_num, dpi, force, digest)
+
+
+@tenacity
+def _ppt_page_to_image(file: str, output_dir: str, page_num: int, dpi: int, force: bool, digest: str) -> str:
     import os
-    import subprocess
     import shutil
     import hashlib
     import time
     from pdf2image import convert_from_path
-    from pathlib import Path
-    
-    # Ensure input file exists
-    if not os.path.exists(file):
-        raise FileNotFoundError(f"File {file} does not exist")
     
     # Create output directory if it doesn't exist
     os.makedirs(output_dir, exist_ok=True)
@@ -244,6 +403,11 @@ def ppt_page_to_images(file: str, output_dir: str, page_num: int, dpi: int = 72,
     if not force and os.path.exists(output_path):
         return output_path
     
+    cache = get_render_cache()
+    if cache is not None and (cached := cache.get_page(digest, dpi, "jpg", 1)) is not None:
+        place_file(cached, output_path)
+        return output_path
+    
     # Create temporary directory for PDF conversion with unique name
     file_dir = os.path.dirname(file)
     temp_dir = os.path.join(file_dir, f".soffice_tmpdir_{file_hash}")
@@ -255,38 +419,21 @@ def ppt_page_to_images(file: str, output_dir: str, page_num: int, dpi: int = 72,
         
         os.makedirs(temp_dir, exist_ok=True)
         
-        # Create a unique user profile to avoid LibreOffice caching
-        profile_dir = f"/tmp/soffice-profile-{file_hash}"
-        
-        # Convert PPT to PDF using LibreOffice
-        command_list = [
-            "soffice",
-            "--headless",
-            "--convert-to",
-            "pdf",
-            file,
-            "--outdir",
-            temp_dir,
-            f'-env:UserInstallation=file://{profile_dir}',
-        ]
-        
-        subprocess.run(command_list, check=True, stdout=subprocess.DEVNULL)
+        # Convert the single slide to PDF using the LibreOffice pool
+        single_slide_pptx = pjoin(temp_dir, f"slide_{page_num:04d}.pptx")
+        keep_single_slide(PptxPresentation(file), page_num).save(single_slide_pptx)
+        temp_pdf = _render_pdf(single_slide_pptx, temp_dir, digest if cache is not None else None, "slide")
         
-        # Find the converted PDF file
-        pdf_files = [f for f in os.listdir(temp_dir) if f.endswith(".pdf")]
-        if not pdf_files:
-            raise RuntimeError("No PDF file was created in the temporary directory")
-        
-        temp_pdf = os.path.join(temp_dir, pdf_files[0])
-        
-        # Convert specific page to image
-        images = convert_from_path(temp_pdf, dpi=dpi, first_page=page_num, last_page=page_num)
+        # Convert the page to image
+        images = convert_from_path(temp_pdf, dpi=dpi, first_page=1, last_page=1)
         
         if not images:
             raise RuntimeError(f"Could not convert page {page_num} to image")
         
         # Save the image
         images[0].save(output_path)
+        if cache is not None:
+            cache.put_page(digest, dpi, "jpg", 1, output_path)
         
         return output_path
     
@@ -294,11 +441,6 @@ def ppt_page_to_images(file: str, output_dir: str, page_num: int, dpi: int = 72,
         # Clean up temporary directory
         if os.path.exists(temp_dir):
             shutil.rmtree(temp_dir, ignore_errors=True)
-        
-        # Clean up profile directory
-        profile_dir_path = Path(profile_dir.replace('file://', ''))
-        if profile_dir_path.exists():
-            shutil.rmtree(profile_dir_path, ignore_errors=True)
 
 @tenacity
 def wmf_to_images(blob: bytes, filepath: str):
@@ -311,17 +453,7 @@ def wmf_to_images(blob: bytes, filepath: str):
     os.makedirs(temp_dir, exist_ok=True)
     with open(pjoin(temp_dir, f"{basename}.wmf"), "wb") as f:
         f.write(blob)
-    command_list = [
-        "soffice",
-        "--headless",
-        "--convert-to",
-        "jpg",
-        pjoin(temp_dir, f"{basename}.wmf"),
-        "--outdir",
-        dirname,
-        # '-env:UserInstallation=file:///tmp/soffice-profile',  # TODO@: fix this
-    ]
-    subprocess.run(command_list, check=True, stdout=subprocess.DEVNULL)
+    soffice_convert(pjoin(temp_dir, f"{basename}.wmf"), dirname, "jpg")
 
     assert pexists(filepath), f"File {filepath} does not exist"
 
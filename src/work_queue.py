@@ -0,0 +1,244 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+from time import time
+
+from sweep_journal import task_key
+from sweep_planner import SweepPlanner, task_artifacts
+
+QUEUED = "queued"
+LEASED = "leased"
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class Lease:
+    """
+    A config item leased from a WorkQueue.
+    """
+
+    def __init__(self, key: str, task: int, config_item: dict, attempts: int, project_id: str | None):
+        self.key = key
+        self.task = task
+        self.config_item = config_item
+        self.attempts = attempts
+        self.project_id = project_id
+
+
+class WorkQueue:
+    """
+    A queue of sweep tasks in a SQLite file, shared by the workers of any number of machines through a shared filesystem.
+
+    Workers lease tasks for `lease_timeout` seconds and renew their leases with heartbeats while they run them;
+    the tasks of dead workers are leased again once their leases expire, up to `max_attempts` times.
+    Tasks are leased in the order planned by `SweepPlanner`, skipping the tasks sharing cached stages with
+    running ones while others are queued. The results of all tasks are written to the queue.
+
+    The rollback journal is used rather than WAL, which needs shared memory and does not work on network filesystems.
+    """
+
+    def __init__(self, path: str, lease_timeout: float = 600, max_attempts: int = 3):
+        """
+        Initialize the WorkQueue.
+
+        Args:
+            path (str): The path of the SQLite database file.
+            lease_timeout (float): The time in seconds a lease lasts without heartbeat.
+            max_attempts (int): The number of times a task is leased before it is failed, e.g. if it kills its workers.
+        """
+        self.path = path
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS tasks ("
+            "key TEXT PRIMARY KEY, task INTEGER NOT NULL, rank INTEGER NOT NULL, item TEXT NOT NULL, "
+            "artifacts TEXT NOT NULL, status TEXT NOT NULL, worker TEXT, lease_expires REAL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, project_id TEXT, result TEXT, updated REAL NOT NULL)"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=120, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=DELETE")
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, tasks: list[tuple[int, dict]], slides: int) -> int:
+        """
+        Add tasks to the queue, ignoring the tasks already in it, so that every worker may enqueue the same config.
+
+        Args:
+            tasks (list[tuple[int, dict]]): The tasks, as (index, config item).
+            slides (int): The number of slides of the sweep.
+
+        Returns:
+            int: The number of tasks added.
+        """
+        now = time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rank = conn.execute("SELECT COALESCE(MAX(rank) + 1, 0) FROM tasks").fetchone()[0]
+            added = 0
+            for i, config_item in SweepPlanner(tasks, slides).order():
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO tasks (key, task, rank, item, artifacts, status, updated) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        task_key(config_item, slides), i + 1, rank, json.dumps(config_item),
+                        json.dumps(task_artifacts(config_item, slides)), QUEUED, now,
+                    ),
+                )
+                added += cursor.rowcount
+                rank += 1
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return added
+
+    def lease(self, worker: str) -> Lease | None:
+        """
+        Lease the next task: a queued task, or a task whose lease expired.
+
+        Returns:
+            Lease | None: The leased task, None when no task is left to lease.
+        """
+        now = time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # tasks whose workers died too many times
+            conn.execute(
+                "UPDATE tasks SET status = ?, worker = NULL, updated = ?, result = ? "
+                "WHERE status = ? AND lease_expires < ? AND attempts >= ?",
+                (FAILED, now, json.dumps({"success": False, "error": "Lease expired too many times"}),
+                 LEASED, now, self.max_attempts),
+            )
+            candidates = conn.execute(
+                "SELECT key, task, item, artifacts, attempts, project_id, status, worker FROM tasks "
+                "WHERE status = ? OR (status = ? AND lease_expires < ?) ORDER BY rank",
+                (QUEUED, LEASED, now),
+            ).fetchall()
+            if not candidates:
+                conn.execute("COMMIT")
+                return None
+            producing = {
+                artifact
+                for (artifacts,) in conn.execute(
+                    "SELECT artifacts FROM tasks WHERE status = ? AND lease_expires >= ?", (LEASED, now)
+                )
+                for artifact in json.loads(artifacts)
+            }
+            chosen = next(
+                (c for c in candidates if producing.isdisjoint(json.loads(c[3]))),
+                candidates[0],
+            )
+            key, task, item, _, attempts, project_id, status, previous_worker = chosen
+            if status == LEASED:
+                print(f"[WARNING] Lease of task {task} by {previous_worker} expired, leasing it again")
+            conn.execute(
+                "UPDATE tasks SET status = ?, worker = ?, lease_expires = ?, attempts = attempts + 1, updated = ? "
+                "WHERE key = ?",
+                (LEASED, worker, now + self.lease_timeout, now, key),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return Lease(key, task, json.loads(item), attempts + 1, project_id)
+
+    def heartbeat(self, lease: Lease, worker: str, project_id: str = None) -> bool:
+        """
+        Renew a lease, recording the project id of the task if given.
+
+        Returns:
+            bool: Whether the worker still holds the lease.
+        """
+        now = time()
+        cursor = self._connect().execute(
+            "UPDATE tasks SET lease_expires = ?, project_id = COALESCE(?, project_id), updated = ? "
+            "WHERE key = ? AND worker = ? AND status = ?",
+            (now + self.lease_timeout, project_id, now, lease.key, worker, LEASED),
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, lease: Lease, worker: str, result: dict) -> bool:
+        """
+        Record the result of a leased task.
+
+        Returns:
+            bool: Whether the worker still held the lease, the result is dropped otherwise.
+        """
+        cursor = self._connect().execute(
+            "UPDATE tasks SET status = ?, worker = NULL, lease_expires = NULL, result = ?, updated = ? "
+            "WHERE key = ? AND worker = ? AND status = ?",
+            (COMPLETED if result["success"] else FAILED, json.dumps(result), time(), lease.key, worker, LEASED),
+        )
+        return cursor.rowcount == 1
+
+    def results(self) -> list[dict]:
+        """
+        Get the results of the finished tasks.
+        """
+        rows = self._connect().execute(
+            "SELECT task, item, result FROM tasks WHERE status IN (?, ?) ORDER BY task", (COMPLETED, FAILED)
+        )
+        results = []
+        for task, item, result in rows:
+            config_item = json.loads(item)
+            results.append({
+                "task": task,
+                "target": config_item["target"],
+                "reference": config_item["sample"]["paper"],
+                **json.loads(result),
+            })
+        return results
+
+    def counts(self) -> dict[str, int]:
+        rows = self._connect().execute("SELECT status, COUNT(*) FROM tasks GROUP BY status")
+        return {status: count for status, count in rows}
+
+
+class Heartbeat:
+    """
+    Renew a lease in a background thread while its task runs, within a `with` block.
+    """
+
+    def __init__(self, queue: WorkQueue, lease: Lease, worker: str, project_id: str = None):
+        self.queue = queue
+        self.lease = lease
+        self.worker = worker
+        self.project_id = project_id
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while True:
+            try:
+                if not self.queue.heartbeat(self.lease, self.worker, self.project_id):
+                    self.lost = True
+                    print(f"[WARNING] Lost the lease of task {self.lease.task}, another worker may run it")
+                    return
+            except sqlite3.Error as e:
+                print(f"[WARNING] Heartbeat of task {self.lease.task} failed: {e}")
+            if self._stop.wait(self.queue.lease_timeout / 3):
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
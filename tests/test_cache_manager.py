@@ -0,0 +1,60 @@
+import os
+
+import pytest
+
+for module in ("cv2", "json_repair", "Levenshtein", "lxml", "pptx", "rich", "tenacity", "pdf2image", "PIL"):
+    pytest.importorskip(module)
+
+from agentic_loop.artifact_store import ArtifactStore  # noqa: E402
+from agentic_loop.cache_manager import gc  # noqa: E402
+
+OLD = 1_000_000
+
+
+def age(store: ArtifactStore, digest: str):
+    os.utime(store.blob_path(digest), (OLD, OLD))
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ArtifactStore(str(tmp_path / "store"))
+
+
+def write(tmp_path, name: str, content: bytes) -> str:
+    path = tmp_path / name
+    path.write_bytes(content)
+    return str(path)
+
+
+def test_gc_keeps_blobs_of_manifests_being_saved(tmp_path, store):
+    # a stage stored its files and has not saved its manifest yet
+    digest = store.put_file(write(tmp_path, "slide.jpg", b"slide"))
+    assert gc(store)["freed_bytes"] == 0
+    store.save_manifest("pdf/paper", {"slide.jpg": digest})
+    assert store.load_manifest("pdf/paper") is not None
+
+
+def test_gc_collects_old_orphans(tmp_path, store):
+    digest = store.put_file(write(tmp_path, "slide.jpg", b"slide"))
+    age(store, digest)
+    assert gc(store)["freed_bytes"] == len(b"slide")
+    assert not os.path.exists(store.blob_path(digest))
+
+
+def test_reused_orphan_is_refreshed(tmp_path, store):
+    digest = store.put_file(write(tmp_path, "slide.jpg", b"slide"))
+    age(store, digest)
+    # a stage reuses the orphan blob, then gc runs before its manifest is saved
+    assert store.put_file(write(tmp_path, "copy.jpg", b"slide")) == digest
+    gc(store)
+    assert os.path.exists(store.blob_path(digest))
+
+
+def test_gc_evicts_manifests_over_budget(tmp_path, store):
+    for name in ("a", "b"):
+        digest = store.put_file(write(tmp_path, f"{name}.jpg", name.encode() * 10))
+        store.save_manifest(f"pdf/{name}", {f"{name}.jpg": digest})
+        age(store, digest)
+    result = gc(store, max_bytes=10)
+    assert len(result["evicted"]) == 1
+    assert result["total_bytes"] == 10
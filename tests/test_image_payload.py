@@ -0,0 +1,69 @@
+import os
+import urllib.error
+import urllib.request
+
+import pytest
+
+pytest.importorskip("PIL")
+
+from image_payload import LocalMediaServer  # noqa: E402
+
+
+@pytest.fixture
+def tree(tmp_path):
+    """
+    A run directory, an artifact store its images are linked from, and a secret next to them.
+    """
+    run_dir, store = tmp_path / "runs" / "run", tmp_path / "store"
+    run_dir.mkdir(parents=True)
+    store.mkdir()
+    (tmp_path / "api_key.json").write_text("secret")
+    (run_dir / "slide.jpg").write_bytes(b"slide")
+    (store / "blob").write_bytes(b"blob")
+    os.symlink(store / "blob", run_dir / "linked.jpg")
+    os.link(store / "blob", run_dir / "hardlinked.jpg")
+    os.symlink(tmp_path / "api_key.json", run_dir / "key.jpg")
+    return tmp_path
+
+
+def fetch(url: str) -> bytes:
+    with urllib.request.urlopen(url, timeout=5) as response:
+        return response.read()
+
+
+def status(url: str) -> int:
+    try:
+        fetch(url)
+        return 200
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def test_serves_files_within_roots(tree):
+    server = LocalMediaServer([str(tree / "runs"), str(tree / "store")])
+    try:
+        run_dir = tree / "runs" / "run"
+        assert fetch(server.url_for(str(run_dir / "slide.jpg"))) == b"slide"
+        # matched on the unresolved path, the link target is within the store root
+        assert fetch(server.url_for(str(run_dir / "linked.jpg"))) == b"blob"
+        assert fetch(server.url_for(str(run_dir / "hardlinked.jpg"))) == b"blob"
+        assert server.path_for(server.url_for(str(run_dir / "slide.jpg"))) == str(run_dir / "slide.jpg")
+    finally:
+        server.close()
+
+
+def test_refuses_files_outside_roots(tree):
+    server = LocalMediaServer([str(tree / "runs")])
+    try:
+        run_dir = tree / "runs" / "run"
+        assert server.url_for(str(tree / "api_key.json")) is None
+        assert server.url_for(str(run_dir / "key.jpg")) is None
+        # without the store root, links into it are sent as base64
+        assert server.url_for(str(run_dir / "linked.jpg")) is None
+        assert status(server.base_url + "0/run/key.jpg") == 404
+        assert status(server.base_url + "0/../api_key.json") == 404
+        assert status(server.base_url + "0/%2E%2E/api_key.json") == 404
+        assert status(server.base_url + "1/api_key.json") == 404
+        assert status(server.base_url + "0/run/") == 404
+    finally:
+        server.close()
@@ -0,0 +1,132 @@
+import json
+import sqlite3
+from dataclasses import dataclass
+from types import SimpleNamespace
+
+import pytest
+
+for module in ("jsonlines", "tiktoken", "yaml", "FlagEmbedding", "jinja2", "openai", "PIL", "torch", "json_repair"):
+    pytest.importorskip(module)
+
+import llms  # noqa: E402
+from jinja2 import Environment  # noqa: E402
+from llm_cache import ResponseCache  # noqa: E402
+from llms import LLM, Role  # noqa: E402
+from utils import ResponseParseError  # noqa: E402
+
+ROLE_CONFIG = {
+    "use_model": "language",
+    "return_json": True,
+    "system_prompt": "You are a tester.",
+    "jinja_args": ["topic"],
+    "template": "Describe {{ topic }} as JSON.",
+}
+
+
+class FakeClient:
+    """
+    Responds with the given responses in turn.
+    """
+
+    def __init__(self, responses: list[str]):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def completion(self, model, messages, **params):
+        self.calls += 1
+        return self.responses.pop(0)
+
+
+def strict_json(response: str):
+    try:
+        return json.loads(response)
+    except ValueError as e:
+        raise ResponseParseError("Failed to parse JSON from response", e)
+
+
+def cached_responses(path) -> list[str]:
+    with sqlite3.connect(path) as conn:
+        return [response for (response,) in conn.execute("SELECT response FROM responses")]
+
+
+def make_role(cache_path, responses: list[str]) -> Role:
+    llm = LLM(model="fake", api_base="http://127.0.0.1:1/v1", api_key="fake", print_message=False, cache=str(cache_path))
+    llm.client = FakeClient(responses)
+    return Role("tester", Environment(), False, llm=llm, config=ROLE_CONFIG)
+
+
+def test_unparsable_role_response_is_not_cached(tmp_path, monkeypatch):
+    monkeypatch.setattr(llms, "get_json_from_response", strict_json)
+    cache_path = tmp_path / "responses.db"
+    role = make_role(cache_path, ["not json", '{"topic": "caching"}'])
+    assert role(topic="caching") == {"topic": "caching"}
+    # the unparsable response was resampled, and only the parsed one cached
+    assert role.llm.client.calls == 2
+    assert cached_responses(cache_path) == ['{"topic": "caching"}']
+    assert role.history[-1].response == '{"topic": "caching"}'
+
+
+def test_parsed_role_response_is_replayed(tmp_path, monkeypatch):
+    monkeypatch.setattr(llms, "get_json_from_response", strict_json)
+    cache_path = tmp_path / "responses.db"
+    assert make_role(cache_path, ['{"topic": "caching"}'])(topic="caching") == {"topic": "caching"}
+    rerun = make_role(cache_path, [])
+    assert rerun(topic="caching") == {"topic": "caching"}
+    assert rerun.llm.client.calls == 0
+
+
+@dataclass
+class FakeGenConfig:
+    temperature: float = 0.0
+    top_p: float = 1.0
+
+
+def offline_llm(cache: ResponseCache, gen_config) -> LLM:
+    llm = LLM.__new__(LLM)
+    llm.model = "fake"
+    llm.offline = True
+    llm.cache = cache
+    llm.client = SimpleNamespace(gen_config=gen_config)
+    return llm
+
+
+def test_identical_requests_share_a_key(tmp_path):
+    messages = [{"role": "user", "content": "hello"}]
+    keys = {ResponseCache(str(tmp_path / "responses.db")).make_key("fake", messages) for _ in range(2)}
+    cache = ResponseCache(str(tmp_path / "responses.db"))
+    keys |= {cache.make_key("fake", messages), cache.make_key("fake", messages)}
+    assert len(keys) == 1
+
+
+def test_offline_gen_config_is_keyed(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.db"))
+    messages = [{"role": "user", "content": "hello"}]
+    greedy = offline_llm(cache, FakeGenConfig(temperature=0.0))._cache_key(messages)
+    sampled = offline_llm(cache, FakeGenConfig(temperature=0.8))._cache_key(messages)
+    assert greedy != sampled
+
+
+def test_total_size_follows_puts_and_evictions(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.db"), max_bytes=20)
+    cache.put("a", "x" * 10)
+    cache.put("b", "x" * 10)
+    assert cache.total_size() == 20
+    cache.put("a", "x" * 5)
+    assert cache.total_size() == 15
+    cache.get("a")
+    # b is the least recently used
+    cache.put("c", "x" * 10)
+    assert cache.total_size() == 15
+    assert cache.get("b") is None and cache.get("a") is not None
+
+
+def test_total_size_of_existing_cache(tmp_path):
+    path = str(tmp_path / "responses.db")
+    with sqlite3.connect(path) as conn:
+        conn.execute(
+            "CREATE TABLE responses (key TEXT PRIMARY KEY, response TEXT NOT NULL, "
+            "size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        conn.execute("INSERT INTO responses VALUES ('a', 'xxx', 3, 0), ('b', 'xxxx', 4, 0)")
+    assert ResponseCache(path).total_size() == 7
+    assert ResponseCache(path).total_size() == 7
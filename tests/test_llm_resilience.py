@@ -0,0 +1,78 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+for module in ("openai", "jsonlines", "tiktoken", "yaml", "FlagEmbedding", "jinja2", "PIL", "torch", "json_repair"):
+    pytest.importorskip(module)
+
+from llm_resilience import AIMDLimiter  # noqa: E402
+from llms import OnlineClient  # noqa: E402
+
+
+def half_open_client() -> OnlineClient:
+    client = OnlineClient(api_base="http://127.0.0.1:1/v1", api_key="fake", max_concurrency=1, reset_timeout=0)
+    client.breaker.trip()
+    assert client.breaker.available()
+    return client
+
+
+class HangingCompletions:
+    async def create(self, **kwargs):
+        await asyncio.Event().wait()
+
+
+def test_aacquire_wakes_on_release_from_another_thread():
+    limiter = AIMDLimiter(max_limit=1)
+    token = limiter.acquire()
+
+    async def main():
+        threading.Timer(0.05, limiter.release, (token,)).start()
+        return await asyncio.wait_for(limiter.aacquire(), timeout=5)
+
+    assert asyncio.run(main()) is not None
+    assert limiter.in_flight == 1
+    assert not limiter._waiters
+
+
+def test_cancelled_aacquire_leaves_no_waiter():
+    limiter = AIMDLimiter(max_limit=1)
+    limiter.acquire()
+
+    async def main():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(limiter.aacquire(), timeout=0.05)
+
+    asyncio.run(main())
+    assert limiter.in_flight == 1
+    assert not limiter._waiters
+
+
+def test_cancelled_wait_for_slot_frees_probe():
+    client = half_open_client()
+    held = client.limiter.acquire()
+
+    async def main():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(client.acompletion(model="fake", messages=[]), timeout=0.05)
+
+    asyncio.run(main())
+    # the next request may probe the backend
+    assert client.breaker.available()
+    assert client.limiter.in_flight == 1
+    client.limiter.release(held)
+
+
+def test_cancelled_request_frees_probe_and_slot():
+    client = half_open_client()
+    client._get_async_client = lambda: SimpleNamespace(chat=SimpleNamespace(completions=HangingCompletions()))
+
+    async def main():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(client.acompletion(model="fake", messages=[]), timeout=0.05)
+
+    asyncio.run(main())
+    assert client.breaker.available()
+    assert client.limiter.in_flight == 0
+    assert client.limiter.limit == 1
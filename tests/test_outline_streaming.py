@@ -0,0 +1,83 @@
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+for module in ("jsonlines", "PIL", "torch", "FlagEmbedding", "jinja2", "rich", "pptx", "openai"):
+    pytest.importorskip(module)
+
+from pptgen_2stage import PPTCrew  # noqa: E402
+
+LAYOUT_OUTLINE = {
+    "Introduction": {"layout": "Title", "subsections": []},
+    "Method": {"layout": "Bullets", "subsections": []},
+    "Results": {"layout": "Unknown", "subsections": []},
+}
+
+
+class FakeLayoutPlanner:
+    """
+    Streams the entries of the layout outline, then returns it, like `Role.stream`.
+    """
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.blocking_calls = 0
+
+    def stream(self, **kwargs):
+        for title, slide in LAYOUT_OUTLINE.items():
+            if self.fail:
+                raise ValueError("stream broke")
+            yield title, slide
+        return dict(LAYOUT_OUTLINE)
+
+    def __call__(self, **kwargs):
+        self.blocking_calls += 1
+        return dict(LAYOUT_OUTLINE)
+
+
+def make_crew(tmp_path, planner):
+    crew = PPTCrew.__new__(PPTCrew)
+    crew.config = SimpleNamespace(RUN_DIR=str(tmp_path))
+    crew.staffs = {"planner_layout": planner}
+    crew.layout_info = {"Title": [], "Bullets": []}
+    crew.layout_keys = crew.layout_info.keys()
+    crew.layout_names = list(crew.layout_info)
+    crew.force_pages = False
+    crew._generate_content_outline = lambda num_slides: {title: {} for title in LAYOUT_OUTLINE}
+    crew._finish_layout_outline = lambda layout_outline, num_slides: layout_outline
+    crew._generate_slide = lambda slide_data, code_executor, run_dir, staffs=None: f"slide:{slide_data[1][0]}"
+    crew._generate_slide_isolated = lambda slide_data: (f"slide:{slide_data[1][0]}", None, {})
+    return crew
+
+
+def test_streaming_generates_valid_entries(tmp_path):
+    crew = make_crew(tmp_path, FakeLayoutPlanner())
+    outline, streamed = crew._generate_outline_streaming(3, code_executor=None)
+    assert outline == LAYOUT_OUTLINE
+    assert crew.simple_outline.splitlines() == ["Slide 1: Introduction", "Slide 2: Method", "Slide 3: Results"]
+    # the entry with an unknown layout is left to the outline validation
+    assert streamed == {
+        (0, "Introduction"): (LAYOUT_OUTLINE["Introduction"], "slide:Introduction"),
+        (1, "Method"): (LAYOUT_OUTLINE["Method"], "slide:Method"),
+    }
+
+
+def test_streaming_with_pool(tmp_path):
+    crew = make_crew(tmp_path, FakeLayoutPlanner())
+    with ThreadPoolExecutor(2) as pool:
+        outline, streamed = crew._generate_outline_streaming(3, code_executor=None, pool=pool)
+        assert outline == LAYOUT_OUTLINE
+        assert {key: future.result()[0] for key, (_, future) in streamed.items()} == {
+            (0, "Introduction"): "slide:Introduction",
+            (1, "Method"): "slide:Method",
+        }
+
+
+def test_streaming_falls_back_to_blocking_call(tmp_path):
+    planner = FakeLayoutPlanner(fail=True)
+    crew = make_crew(tmp_path, planner)
+    outline, streamed = crew._generate_outline_streaming(3, code_executor=None)
+    assert outline == LAYOUT_OUTLINE
+    assert streamed == {}
+    assert planner.blocking_calls == 1
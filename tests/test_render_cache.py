@@ -0,0 +1,46 @@
+import os
+
+import pytest
+
+from render_cache import RenderCache
+
+for module in ("cv2", "json_repair", "Levenshtein", "lxml", "pptx", "rich", "tenacity", "pdf2image", "PIL"):
+    pytest.importorskip(module)
+
+from agentic_loop.cache_manager import gc_render_cache, render_cache_stats  # noqa: E402
+
+
+def put_deck(cache: RenderCache, tmp_path, digest: str, size: int, accessed: float):
+    pdf = tmp_path / f"{digest}.pdf"
+    pdf.write_bytes(b"x" * size)
+    cache.put_pdf(digest, str(pdf))
+    os.utime(cache.entry_dir(digest), (accessed, accessed))
+
+
+def test_gc_evicts_least_recently_used_renderings(tmp_path):
+    cache = RenderCache(str(tmp_path / "render"))
+    put_deck(cache, tmp_path, "aa" * 32, 100, accessed=1000)
+    put_deck(cache, tmp_path, "bb" * 32, 100, accessed=3000)
+    put_deck(cache, tmp_path, "cc" * 32, 100, accessed=2000)
+    assert render_cache_stats(cache) == {"total_bytes": 300, "entries": 3}
+
+    result = gc_render_cache(cache, max_bytes=150)
+    assert result == {"evicted": ["aa" * 32, "cc" * 32], "freed_bytes": 200, "total_bytes": 100}
+    assert cache.get_pdf("aa" * 32) is None
+    assert cache.get_pdf("bb" * 32) is not None
+    assert cache.entries() == ["bb" * 32]
+
+
+def test_hits_refresh_last_access(tmp_path):
+    cache = RenderCache(str(tmp_path / "render"))
+    put_deck(cache, tmp_path, "aa" * 32, 100, accessed=1000)
+    put_deck(cache, tmp_path, "bb" * 32, 100, accessed=2000)
+    assert cache.get_pdf("aa" * 32) is not None
+    assert gc_render_cache(cache, max_bytes=100)["evicted"] == ["bb" * 32]
+
+
+def test_gc_dry_run_keeps_renderings(tmp_path):
+    cache = RenderCache(str(tmp_path / "render"))
+    put_deck(cache, tmp_path, "aa" * 32, 100, accessed=1000)
+    assert gc_render_cache(cache, max_bytes=0, dry_run=True)["evicted"] == ["aa" * 32]
+    assert cache.get_pdf("aa" * 32) is not None
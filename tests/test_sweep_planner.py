@@ -0,0 +1,24 @@
+from sweep_planner import SweepPlanner
+
+SLIDES = 5
+
+
+def make_tasks(num_tasks: int) -> list[tuple[int, dict]]:
+    return [(i, {"target": f"target_{i}.pdf", "sample": {"paper": "ref.pdf"}, "template": "t.pptx"}) for i in range(num_tasks)]
+
+
+def test_failed_task_artifacts_are_not_done():
+    planner = SweepPlanner(make_tasks(2), SLIDES)
+    task = planner.next_task()
+    planner.start(task)
+    planner.finish(task, success=False)
+    assert not planner.done
+    assert not any(planner.producing.values())
+
+
+def test_succeeded_task_artifacts_are_done():
+    planner = SweepPlanner(make_tasks(2), SLIDES)
+    task = planner.next_task()
+    planner.start(task)
+    planner.finish(task, success=True)
+    assert "template:t.pptx" in planner.done and "reference:ref.pdf" in planner.done
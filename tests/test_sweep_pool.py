@@ -0,0 +1,71 @@
+import argparse
+import os
+
+import pytest
+
+for module in ("openai", "jsonlines", "tiktoken", "yaml", "FlagEmbedding", "jinja2", "PIL", "torch", "pptx"):
+    pytest.importorskip(module)
+
+from run_pptgen_refine_config import run_pool  # noqa: E402
+from sweep_journal import FAILED, STARTED, SweepJournal, task_key  # noqa: E402
+
+SLIDES = 5
+
+
+def init_noop(args):
+    pass
+
+
+def kill_once(task_idx, config_item, args, base_output_dir, journal_path, project_id=None):
+    """
+    Kill the worker the first time a task marked `kill` runs, like the OOM killer would.
+    """
+    project_id = project_id or f"project_{task_idx}"
+    SweepJournal(journal_path).append(task_key(config_item, args.slides), STARTED, project_id=project_id)
+    marker = os.path.join(base_output_dir, f"killed_{task_idx}")
+    if config_item.get("kill") and not os.path.exists(marker):
+        open(marker, "w").close()
+        os._exit(1)
+    return {"task": task_idx + 1, "success": True, "resume": args.resume, "project_id": project_id}
+
+
+def always_kill(task_idx, config_item, args, base_output_dir, journal_path, project_id=None):
+    if config_item.get("kill"):
+        os._exit(1)
+    return {"task": task_idx + 1, "success": True}
+
+
+def make_tasks(num_tasks: int, killed: int) -> list[tuple[int, dict]]:
+    return [
+        (i, {"target": f"target_{i}.pdf", "sample": {"paper": "ref.pdf"}, "template": "t.pptx", "kill": i == killed})
+        for i in range(num_tasks)
+    ]
+
+
+def make_args(workers: int) -> argparse.Namespace:
+    return argparse.Namespace(workers=workers, slides=SLIDES, task_order="plan", max_attempts=3, resume=False)
+
+
+def test_dead_worker_task_is_resumed(tmp_path):
+    results = []
+    journal_path = str(tmp_path / "journal.jsonl")
+    run_pool(make_tasks(3, killed=1), make_args(2), str(tmp_path), journal_path, {}, results.append,
+             initializer=init_noop, task_fn=kill_once)
+    assert sorted(r["task"] for r in results) == [1, 2, 3]
+    assert all(r["success"] for r in results)
+    killed = next(r for r in results if r["task"] == 2)
+    # rerun in the run directory it started in, resuming from its checkpoints
+    assert killed["resume"] and killed["project_id"] == "project_1"
+
+
+def test_task_killing_its_workers_is_failed(tmp_path):
+    results = []
+    journal_path = str(tmp_path / "journal.jsonl")
+    tasks = make_tasks(3, killed=0)
+    run_pool(tasks, make_args(1), str(tmp_path), journal_path, {}, results.append,
+             initializer=init_noop, task_fn=always_kill)
+    assert sorted(r["task"] for r in results) == [1, 2, 3]
+    failed = [r for r in results if not r["success"]]
+    assert [r["task"] for r in failed] == [1]
+    assert "Worker died" in failed[0]["error"]
+    assert SweepJournal(journal_path).load()[task_key(tasks[0][1], SLIDES)]["status"] == FAILED